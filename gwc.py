@@ -29,8 +29,13 @@ class GeoWebCache(object):
         if resp.status_code >= 400:
             raise Exception("Delete cached layer list failed ({0}: {1})".format(resp.status_code, resp.content))
 
-    def update_layer(self,layer):
-        if self.get_layer(layer['workspace'],layer['name']):
+    def update_layer(self,layer,exists=None):
+        """
+        exists: whether the cached layer exists or not; check it if it is None
+        """
+        if exists is None:
+            exists = bool(self.get_layer(layer['workspace'],layer['name']))
+        if exists:
             #layer exist, update
             http_method = requests.post
         else:
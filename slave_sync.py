@@ -25,6 +25,8 @@ Each sync task is implemented in different modules:
 Each module has some requirements:
     1. a "logger object" used when need to log task realted information; if not present, the logger declared in this module is used.
     2. a "tasks_metadata" array object, which hook the sync task to sync job; if not paesent, no task defined in this module will be executed
+    3. a "tasks_resource" dict object, which map the task type to a resource class(db, network, geoserver-rest, render); optional.
+       the number of concurrent tasks using the same resource class is limited by RESOURCE_LIMITS
 
 Each sync job is defined with a tuple, all jobs are defined in slave_sync_task.py
     1.JOB_TYPE_INDEX : specify the job type
@@ -44,28 +46,37 @@ Each sync  action is hooked into a sync job by included a tuple element in tasks
 
 All tasks will be contained by "sync_tasks" variable, which is declared in slave_sync_task.py
 
-All tasks will be executed in predefined order defined by "ordered_sync_task_type", which is declared in slave_sync_task.py
+All tasks will be executed based on a dependency graph built by slave_sync_scheduler.py. 
+The tasks of a job are executed in predefined order defined by "ordered_sync_task_type", and the dependencies across jobs are declared by "task_dependencies", both are declared in slave_sync_task.py
+A task is executed as soon as the tasks it depends on are executed; if SYNC_WORKERS is greater than 1, the tasks of unrelated jobs are executed concurrently.
+The ready tasks are executed in the order of the estimated cost of their jobs(slave_sync_history.py), and the notify of a job is sent in batch once the job is finished.
 
 Each sync task is a reusable program logic and can be used by different sync job.
 Each sync job has a sync status object which contains task status object for each sync task 
 """
 import json
 import logging
+import itertools
 import os
+import shutil
+import tempfile
 import traceback
 import sys
 import hglib
 
 from slave_sync_env import (
     PATH,HG_NODE,LISTEN_CHANNELS,ROLLBACK,
-    STATE_PATH,now,DEBUG,INCLUDE
+    STATE_PATH,now,DEBUG,INCLUDE,SYNC_WORKERS,SYNC_FOLDERS_FILE
 )
 from slave_sync_status import SlaveSyncStatus
+from slave_sync_scheduler import SyncTaskScheduler
+from slave_sync_history import TaskHistory
+from slave_sync_plancache import PlanCache,PLAN_CACHE_ENABLED
 
 from slave_sync_task import (
     sync_tasks,ordered_sync_task_type,
     TASK_TYPE_INDEX,JOB_DEF_INDEX,TASK_FILTER_INDEX,TASK_NAME_INDEX,TASK_HANDLER_INDEX,CHANNEL_SUPPORT_INDEX,JOB_FOLDER_INDEX,JOB_ACTION_INDEX,IS_JOB_INDEX,IS_VALID_JOB_INDEX,JOB_TYPE_INDEX,
-    execute_task,taskname,execute_notify_task,execute_prepare_task
+    taskname,execute_prepare_task,NotifyTaskBuffer
 
 )
 import slave_sync_prepare
@@ -81,7 +92,8 @@ import slave_sync_notify
 import slave_catalogues
 from slave_sync_file import load_metafile
 
-hg = hglib.open(STATE_PATH)
+#the state repository, opened at the beginning of each sync and closed at the end
+hg = None
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(
@@ -90,6 +102,7 @@ logging.basicConfig(
 )
 
 sync_tasks_metadata = {}
+sync_tasks_resource = {}
 notify_tasks_metadata = []
 notify_tasks = []
 
@@ -129,11 +142,47 @@ for m in plugin_modules:
                 continue
             sync_tasks_metadata[task_metadata[TASK_TYPE_INDEX]].append((task_metadata,m.logger if hasattr(m,"logger") else logger))
 
+    if hasattr(m,"tasks_resource"):
+        sync_tasks_resource.update(m.tasks_resource)
+
     if hasattr(m,"initialize"):
         module_init_handlers.append(m.initialize)
     if hasattr(m,"reset"):
         module_reset_handlers.append(m.reset)
 
+#dispatch index of the sync tasks, key: (channel supported, job folder, job action); job folder and job action are None if not checked
+#value: list of (sequence, task_type, task_metadata, task_logger), the sequence is the position in the order of "ordered_sync_task_type" and "tasks_metadata"
+sync_tasks_index = {}
+seq = 0
+for task_type in ordered_sync_task_type:
+    if task_type not in sync_tasks_metadata or task_type not in sync_tasks: continue
+    for (task_metadata,task_logger) in sync_tasks_metadata[task_type]:
+        job_def = task_metadata[JOB_DEF_INDEX]
+        key = (bool(job_def[CHANNEL_SUPPORT_INDEX]),job_def[JOB_FOLDER_INDEX] or None,job_def[JOB_ACTION_INDEX] or None)
+        sync_tasks_index.setdefault(key,[]).append((seq,task_type,task_metadata,task_logger))
+        seq += 1
+
+#True if the sync folders are saved by this process
+sync_folders_saved = False
+
+def save_sync_folders():
+    """
+    Save the listened channels and the folders of the non channel jobs, used by the pre-check of the hg hook to ignore the changesets without any file to synchronize.
+    A changed file is checked only if it is a root file, or its first folder is a listened channel or a folder of the non channel jobs.
+    Saved by the first sync of the process, the tasks and the settings don't change in a process.
+    """
+    global sync_folders_saved
+    sync_folders_saved = True
+    folders = sorted(set([key[1] for key in sync_tasks_index.iterkeys() if not key[0] and key[1]]))
+    tmp_file = "{}.{}".format(SYNC_FOLDERS_FILE,os.getpid())
+    try:
+        with open(tmp_file,"w") as f:
+            #the raw setting is saved, so the hook can find the file is outdated if the setting is changed
+            f.write(json.dumps({"channels":sorted(LISTEN_CHANNELS),"folders":folders,"listen_channels":os.environ.get("LISTEN_CHANNELS","kmi")}))
+        os.rename(tmp_file,SYNC_FOLDERS_FILE)
+    except:
+        logger.error("Failed to save the sync folders to file '{}'. {}".format(SYNC_FOLDERS_FILE,traceback.format_exc()))
+
 for m in notify_modules:
     if hasattr(m,"tasks_metadata"): 
         for task_metadata in m.tasks_metadata:
@@ -152,16 +201,51 @@ logging.basicConfig(
     format = '%(asctime)s %(levelname)s %(message)s',
 )
 
+#the maximum number of files retrieved by one "hg cat" command
+HG_CAT_BATCH_SIZE = 500
+
 def previous(rev):
     return str(int(hg.log(rev)[0][0])-1)
 
-def get_changeset():
+def get_file_nodes(rev):
+    """
+    Return a dict of file name to the file node in the revision
+    """
+    return dict([(m[4],m[0]) for m in hg.manifest(rev=rev)])
+
+def get_file_contents(file_names,rev):
+    """
+    Return a dict of file name to the file content in the revision; the files which can't be retrieved are not included.
+    The files are retrieved in batch, each "hg cat" command writes a batch of files into a temporary folder.
+    """
+    contents = {}
+    if not file_names:
+        return contents
+    tmpdir = tempfile.mkdtemp()
+    try:
+        for i in range(0,len(file_names),HG_CAT_BATCH_SIZE):
+            batch = file_names[i:i + HG_CAT_BATCH_SIZE]
+            try:
+                hg.cat(["path:{}".format(f) for f in batch],rev=rev,output=os.path.join(tmpdir,"%p"))
+            except hglib.error.CommandError:
+                #some files don't exist in the revision, the other files are still retrieved
+                logger.debug("Some files can't be retrieved from revision '{}'. {}".format(rev,traceback.format_exc()))
+            for f in batch:
+                path = os.path.join(tmpdir,f)
+                if os.path.isfile(path):
+                    with open(path,"rb") as content_file:
+                        contents[f] = content_file.read()
+    finally:
+        shutil.rmtree(tmpdir,ignore_errors=True)
+    return contents
+
+def get_changeset(hg_node):
     """
-    Returns the accumulated set of changes between $HG_NODE and the current tip
+    Returns the accumulated set of changes between hg_node and the current tip
     """
     changes = {}
-    changes.update({k:v for (v,k) in hg.status(change=HG_NODE)})
-    changes.update({k:v for (v,k) in hg.status(rev="{}:".format(HG_NODE))})
+    changes.update({k:v for (v,k) in hg.status(change=hg_node)})
+    changes.update({k:v for (v,k) in hg.status(rev="{}:".format(hg_node))})
     return changes
 
 def parse_job(file_name,action,file_content):
@@ -189,23 +273,41 @@ def parse_job(file_name,action,file_content):
         task["action"] = 'publish'
     return task
 
-def sync():
+def reset():
+    """
+    Clear the state of the last sync, so the next sync can be executed in the same process
+    """
+    global ignore_files
+    del notify_tasks[:]
+    del prepare_tasks[:]
+    ignore_files = 0
+    SlaveSyncStatus.reset()
+
+def sync(hg_node=HG_NODE):
+    """
+    Synchronize the changes between hg_node and the current tip
+    """
+    global hg
+    if not sync_folders_saved:
+        save_sync_folders()
     if DEBUG:
         logger.debug("Run in debug mode.")
         if INCLUDE:
             logger.debug("Only the files({}) will be processed.".format(",".join(INCLUDE)))
 	
+    notify_buffer = None
+    hg = hglib.open(STATE_PATH)
     try:
         for init_method in module_init_handlers:
             init_method()
 
         pull_status = SlaveSyncStatus.get_bitbucket_status()
-        get_tasks(pull_status)
+        get_tasks(pull_status,hg_node)
         try:
             slave_sync_notify.SlaveServerSyncNotify.send_last_sync_time(pull_status)
         except:
             pass
-        logger.info("HG_NODE: {}".format(HG_NODE))
+        logger.info("HG_NODE: {}".format(hg_node))
         for task_type in ordered_sync_task_type:
             for task_name,task in sync_tasks[task_type].iteritems():    
                 if isinstance(task,list):
@@ -220,17 +322,20 @@ def sync():
         #prepare tasks
         for task in prepare_tasks:
             execute_prepare_task(*task)
+            SlaveSyncStatus.checkpoint()
 
-        #execute tasks
-        for task_type in ordered_sync_task_type:
-            for task in sync_tasks[task_type].values():    
-                if isinstance(task,list):
-                    #shared task
-                    for shared_task in task:
-                        execute_task(*shared_task)
-                else:
-                    #unshared task
-                    execute_task(*task)
+        #execute tasks, cheap jobs first; the notify of a job is sent once the job is finished
+        notify_buffer = NotifyTaskBuffer(notify_tasks)
+        def job_done(sync_jobs):
+            notify_buffer.job_done(sync_jobs)
+            if slave_sync_file.prefetcher:
+                slave_sync_file.prefetcher.job_done(sync_jobs)
+
+        #checkpoint the status after the tasks are executed, a restarted sync resumes from the last checkpoint
+        scheduler = SyncTaskScheduler(sync_tasks,SYNC_WORKERS,sync_tasks_resource,job_done,lambda node:SlaveSyncStatus.checkpoint())
+        #download the files of the upcoming jobs in background
+        slave_sync_file.start_prefetch(scheduler.jobs,scheduler.job_task_types)
+        scheduler.run()
 
         if SlaveSyncStatus.all_succeed():
             logger.info("All done!")
@@ -245,9 +350,11 @@ def sync():
     finally:
         #save notify status 
         SlaveSyncStatus.save_all()
-        #send notify
-        for task in notify_tasks:
-            execute_notify_task(*task)
+        #send the notify not sent yet
+        if notify_buffer:
+            notify_buffer.flush()
+        else:
+            NotifyTaskBuffer(notify_tasks).flush()
 
         #clear all tasks
         for k in sync_tasks.keys():
@@ -256,58 +363,123 @@ def sync():
         for reset_method in module_reset_handlers:
             reset_method()
 
+        reset()
+        hg.close()
+        hg = None
+
 def is_sync_task(sync_job,segments,action,task_metadata):
+    debug = logger.isEnabledFor(logging.DEBUG)
     if task_metadata[JOB_DEF_INDEX][CHANNEL_SUPPORT_INDEX]:
         if not segments or len(segments) < 2:
-            logger.debug("The job '{1}' is a channel job, but the file '{0}' is not blonging to any channel,ignore".format(sync_job['job_file'],task_metadata[TASK_TYPE_INDEX]))
+            if debug:
+                logger.debug("The job '{1}' is a channel job, but the file '{0}' is not blonging to any channel,ignore".format(sync_job['job_file'],task_metadata[TASK_TYPE_INDEX]))
             return False
 
         #channel support
         if segments[0] not in LISTEN_CHANNELS:
             #channel not lisened by this slave
-            logger.debug("The job '{1}' is a channel job, but the channel '{2}' of the file '{0}' is not in the channels '{3}' listened by this slave server,ignore".format(sync_job['job_file'],task_metadata[TASK_TYPE_INDEX],segments[0],",".join(LISTEN_CHANNELS)))
+            if debug:
+                logger.debug("The job '{1}' is a channel job, but the channel '{2}' of the file '{0}' is not in the channels '{3}' listened by this slave server,ignore".format(sync_job['job_file'],task_metadata[TASK_TYPE_INDEX],segments[0],",".join(LISTEN_CHANNELS)))
             return False
         sync_job["channel"] = segments[0]
 
         if task_metadata[JOB_DEF_INDEX][JOB_FOLDER_INDEX] and not segments[1] == task_metadata[JOB_DEF_INDEX][JOB_FOLDER_INDEX]:
             #check the job folder
-            logger.debug("The folder '{3}' of the job '{1}' is not match the folder '{2}' of the file '{0}',ignore".format(sync_job['job_file'],task_metadata[TASK_TYPE_INDEX],segments[1],task_metadata[JOB_DEF_INDEX][JOB_FOLDER_INDEX]))
+            if debug:
+                logger.debug("The folder '{3}' of the job '{1}' is not match the folder '{2}' of the file '{0}',ignore".format(sync_job['job_file'],task_metadata[TASK_TYPE_INDEX],segments[1],task_metadata[JOB_DEF_INDEX][JOB_FOLDER_INDEX]))
             return False
     else:
         #not support channel
         if task_metadata[JOB_DEF_INDEX][JOB_FOLDER_INDEX] and not segments[0] == task_metadata[JOB_DEF_INDEX][JOB_FOLDER_INDEX]:
             #check the job folder
-            logger.debug("The folder '{3}' of the job '{1}' is not match the folder '{2}' of the file '{0}',ignore".format(sync_job['job_file'],task_metadata[TASK_TYPE_INDEX],segments[0],task_metadata[JOB_DEF_INDEX][JOB_FOLDER_INDEX]))
+            if debug:
+                logger.debug("The folder '{3}' of the job '{1}' is not match the folder '{2}' of the file '{0}',ignore".format(sync_job['job_file'],task_metadata[TASK_TYPE_INDEX],segments[0],task_metadata[JOB_DEF_INDEX][JOB_FOLDER_INDEX]))
             return False
         sync_job["channel"] = None
 
     if task_metadata[JOB_DEF_INDEX][JOB_ACTION_INDEX] and action != task_metadata[JOB_DEF_INDEX][JOB_ACTION_INDEX]:
         #The action is not equal with the action of this type
-        logger.debug("The action '{3}' of the job '{1}' is not match the action '{2}' of the file '{0}',ignore".format(sync_job['job_file'],task_metadata[TASK_TYPE_INDEX],action,task_metadata[JOB_DEF_INDEX][JOB_ACTION_INDEX]))
+        if debug:
+            logger.debug("The action '{3}' of the job '{1}' is not match the action '{2}' of the file '{0}',ignore".format(sync_job['job_file'],task_metadata[TASK_TYPE_INDEX],action,task_metadata[JOB_DEF_INDEX][JOB_ACTION_INDEX]))
         return False
 
     if task_metadata[JOB_DEF_INDEX][IS_JOB_INDEX] and not task_metadata[JOB_DEF_INDEX][IS_JOB_INDEX](segments[len(segments) - 1]):
         #The job file is belonging to this job type
-        logger.debug("The job '{1}' is not a job  for the file '{0}',ignore".format(sync_job['job_file'],task_metadata[TASK_TYPE_INDEX]))
+        if debug:
+            logger.debug("The job '{1}' is not a job  for the file '{0}',ignore".format(sync_job['job_file'],task_metadata[TASK_TYPE_INDEX]))
         return False
 
     if task_metadata[JOB_DEF_INDEX][IS_VALID_JOB_INDEX] and not task_metadata[JOB_DEF_INDEX][IS_VALID_JOB_INDEX](sync_job):
         #The job is a invalid job
-        logger.debug("The job '{1}' is a invalid job  for the file '{0}',ignore".format(sync_job['job_file'],task_metadata[TASK_TYPE_INDEX]))
+        if debug:
+            logger.debug("The job '{1}' is a invalid job  for the file '{0}',ignore".format(sync_job['job_file'],task_metadata[TASK_TYPE_INDEX]))
         return False
 
     if task_metadata[TASK_FILTER_INDEX] and not task_metadata[TASK_FILTER_INDEX](sync_job):
         #The task is filtered out.
-        logger.debug("The job '{1}' is a valid job for the file '{0}', but filtered out,ignore".format(sync_job['job_file'],task_metadata[TASK_TYPE_INDEX]))
+        if debug:
+            logger.debug("The job '{1}' is a valid job for the file '{0}', but filtered out,ignore".format(sync_job['job_file'],task_metadata[TASK_TYPE_INDEX]))
         return False
 
     sync_job["job_type"] = task_metadata[JOB_DEF_INDEX][JOB_TYPE_INDEX]
     return True
                     
 
-def get_tasks(pull_status):
+def candidate_tasks(segments,action):
+    """
+    Return the list of (task_type,[(task_metadata,task_logger,sequence)]) whose channel, folder and action can match the file, 
+    in the order of "ordered_sync_task_type"
+    """
+    keys = []
+    if len(segments) >= 2 and segments[0] in LISTEN_CHANNELS:
+        keys.extend([(True,folder,a) for folder in (segments[1],None) for a in (action,None)])
+    keys.extend([(False,folder,a) for folder in (segments[0],None) for a in (action,None)])
+    candidates = sorted([c for key in keys for c in sync_tasks_index.get(key,[])],key=lambda c:c[0])
+    return [(task_type,[(c[2],c[3],c[0]) for c in task_candidates]) for task_type,task_candidates in itertools.groupby(candidates,key=lambda c:c[1])]
+
+def get_tasks(pull_status,hg_node,dry_run=False):
+    """
+    dry_run: only find the tasks, the meta files are not downloaded and the plan cache is not changed
+    """
+    changes = get_changeset(hg_node)
+    file_names = [f for f in changes.iterkeys() if not (DEBUG and INCLUDE and f not in INCLUDE)]
+    updated_files = [f for f in file_names if changes[f] in ['A','M']]
+    removed_files = [f for f in file_names if changes[f] == 'R']
+    pre_rev = previous(hg_node) if removed_files else None
+
+    #find the planning result of the json job files from the plan cache by the file node
+    plan_cache = PlanCache(read_only=dry_run) if PLAN_CACHE_ENABLED else None
+    cache_keys = {}
+    cached_plans = {}
+    if plan_cache:
+        for files,rev,action in ((updated_files,"tip","update"),(removed_files,pre_rev,"remove")):
+            if not files:
+                continue
+            file_nodes = get_file_nodes(rev)
+            for f in files:
+                if f.endswith(".json") and f in file_nodes:
+                    cache_keys[f] = plan_cache.key(file_nodes[f],action)
+        cached_plans = plan_cache.get_all(cache_keys.itervalues())
+        logger.info("{} of {} changed files are planned from the plan cache".format(len(cached_plans),len(file_names)))
+
+    #retrieve the contents of the other changed files in batch
+    contents = get_file_contents([f for f in updated_files if cache_keys.get(f) not in cached_plans],"tip")
+    if removed_files:
+        contents.update(get_file_contents([f for f in removed_files if cache_keys.get(f) not in cached_plans],pre_rev))
+    try:
+        _get_tasks(pull_status,changes,contents,plan_cache,cache_keys,cached_plans,dry_run)
+    finally:
+        if plan_cache:
+            plan_cache.close()
+
+    #sort the jobs of each shared task once all jobs are added
+    for task_type in ordered_sync_task_type:
+        for task in sync_tasks.get(task_type,{}).itervalues():
+            if isinstance(task,list):
+                task.sort(key=lambda x: x[0]['job_file'], reverse=True)
+
+def _get_tasks(pull_status,changes,contents,plan_cache,cache_keys,cached_plans,dry_run=False):
     global ignore_files
-    changes = get_changeset()
     next_job = False
     for file_name, revision in changes.iteritems():
         if DEBUG and INCLUDE and file_name not in INCLUDE:
@@ -320,14 +492,20 @@ def get_tasks(pull_status):
         action = ""
         try:
             segments = file_name.split('/',2)
-            if revision in ['A','M']:
+            #the cached (job,md5,matched task metadata sequences)
+            cached_plan = cached_plans.get(cache_keys.get(file_name))
+            if cached_plan:
+                action = "update" if revision in ['A','M'] else "remove"
+                file_content = None
+            elif revision in ['A','M']:
                 action = "update"
-                file_content = hg.cat([file_name],rev="tip")
+                if file_name not in contents:
+                    raise Exception("Can't get file '{}' content from revision 'tip'".format(file_name))
+                file_content = contents[file_name]
             elif revision == 'R':
                 action = "remove"
-                pre_rev = previous(HG_NODE)
                 try:
-                    file_content = hg.cat([file_name],rev=pre_rev)
+                    file_content = contents[file_name]
                 except:
                     #can't get the file content
                     logger.error("Can't get file '{}' content, ignore.".format(file_name))
@@ -337,7 +515,7 @@ def get_tasks(pull_status):
                     pull_status.get_task_status(file_name).last_process_time = now()
                     continue
 
-            sync_job = parse_job(file_name,action,file_content)
+            sync_job = cached_plan[0] if cached_plan else parse_job(file_name,action,file_content)
             action = sync_job["action"]
             if action == 'none':
                 #no action is required
@@ -346,27 +524,39 @@ def get_tasks(pull_status):
                 #pull_status.get_task_status(file_name).succeed()
                 #pull_status.get_task_status(file_name).last_process_time = now()
                 logger.debug("No action is required fot the file '{}', ignore. ".format(file_name))
+                if file_name in cache_keys and not cached_plan:
+                    plan_cache.put(cache_keys[file_name],sync_job,None,[])
                 continue
 
             logger.debug("The file '{}' is requested to perform '{}' action".format(file_name,action))
-            sync_job["status"] = SlaveSyncStatus(file_name,action,file_content)
-            #load meta data, if meta data is saved into a separated file
-            load_metafile(sync_job)
-            #convert bbox to array if bbox is a string
-            if "bbox" in sync_job and isinstance(sync_job["bbox"],basestring):
-                sync_job["bbox"] = json.loads(sync_job["bbox"])
+            if cached_plan:
+                sync_job["status"] = SlaveSyncStatus(file_name,action,None,cached_plan[1])
+                if sync_job.get('meta') and sync_job["status"].get_task_status("load_metadata").is_not_succeed:
+                    #the status of loading meta data was reset(e.g. the file was removed and added again), load the meta data again
+                    load_metafile(sync_job,dry_run)
+            else:
+                sync_job["status"] = SlaveSyncStatus(file_name,action,file_content)
+                #load meta data, if meta data is saved into a separated file
+                load_metafile(sync_job,dry_run)
+                #convert bbox to array if bbox is a string
+                if "bbox" in sync_job and isinstance(sync_job["bbox"],basestring):
+                    sync_job["bbox"] = json.loads(sync_job["bbox"])
             #tasks will be added only after if a sync job has some unexecuted task or unsuccessful task.
             job_failed = False
             next_job = False
-            for task_type in ordered_sync_task_type:
-                if task_type not in sync_tasks_metadata: continue
-                if task_type not in sync_tasks:continue
-                for (task_metadata,task_logger) in sync_tasks_metadata[task_type]:
+            #the sequences of the matched task metadata
+            matches = []
+            for task_type,task_candidates in candidate_tasks(segments,action):
+                for (task_metadata,task_logger,seq) in task_candidates:
                     try:
                         #if task_type == "update_access_rules":
                         #    import ipdb;ipdb.set_trace()
-                        if not is_sync_task(sync_job,segments,action,task_metadata):
+                        if cached_plan:
+                            if seq not in cached_plan[2]:
+                                continue
+                        elif not is_sync_task(sync_job,segments,action,task_metadata):
                             continue
+                        matches.append(seq)
 
                         if task_metadata[JOB_DEF_INDEX][CHANNEL_SUPPORT_INDEX]:
                             sync_job["channel"] = segments[0]
@@ -383,22 +573,16 @@ def get_tasks(pull_status):
                         if task_type not in tasks:
                             tasks[task_type] = {}
                         if task_name in sync_tasks[task_type]:
-                            #task is already exist, this is a shared task
+                            #task is already exist, this is a shared task, all jobs share the status object of the first job
                             shared_task = sync_tasks[task_type][task_name]
-                            if isinstance(shared_task,list):
-                                task_status = shared_task[0][0]['status'].get_task_status(task_type)
-                                tasks[task_type][task_name] = shared_task + [(sync_job,task_metadata,task_logger)]
-                            else:
-                                task_status = shared_task[0]['status'].get_task_status(task_type)
-                                task_status.shared = True
-                                tasks[task_type][task_name] = [shared_task,(sync_job,task_metadata,task_logger)]
-                            tasks[task_type][task_name] = sorted(tasks[task_type][task_name], key=lambda x: x[0]['job_file'], reverse=True)
+                            task_status = (shared_task[0] if isinstance(shared_task,list) else shared_task)[0]['status'].get_task_status(task_type)
+                            task_status.shared = True
                             sync_job['status'].set_task_status(task_type,task_status)
                         else:
                             #init a default status object for this task
                             sync_job['status'].get_task_status(task_type)
 
-                            tasks[task_type][task_name] = (sync_job,task_metadata,task_logger)
+                        tasks[task_type][task_name] = (sync_job,task_metadata,task_logger)
 
                         #if task_type == "create_workspace": raise Exception("Failed for testing.")
                         break
@@ -427,9 +611,22 @@ def get_tasks(pull_status):
             if next_job:
                 continue
 
-            #add the sync job's tasks to the total sync tasks.
+            if file_name in cache_keys and not cached_plan:
+                try:
+                    plan_cache.put(cache_keys[file_name],dict([(k,v) for k,v in sync_job.iteritems() if k != "status"]),sync_job["status"].md5,matches)
+                except:
+                    logger.error("Failed to cache the planning result of the file '{}'. {}".format(file_name,traceback.format_exc()))
+
+            #add the sync job's tasks to the total sync tasks; a shared task is a list of the tasks of all its jobs
             for key,val in tasks.iteritems():
-                sync_tasks[key].update(val)
+                for task_name,task in val.iteritems():
+                    shared_task = sync_tasks[key].get(task_name)
+                    if shared_task is None:
+                        sync_tasks[key][task_name] = task
+                    elif isinstance(shared_task,list):
+                        shared_task.append(task)
+                    else:
+                        sync_tasks[key][task_name] = [shared_task,task]
             
             if tasks:
                 #this job has some sync tasks to do, 
@@ -458,5 +655,63 @@ def get_tasks(pull_status):
             pull_status.get_task_status(file_name).last_process_time = now()
             logger.error("Add the '{1}' task for ({0}) failed.{2}".format(file_name,action,traceback.format_exc()))
 
+def format_size(size):
+    if not size:
+        return "-"
+    for unit in ("B","KB","MB","GB"):
+        if size < 1024:
+            return "{0:.1f}{1}".format(size,unit)
+        size /= 1024.0
+    return "{0:.1f}TB".format(size)
+
+def plan(hg_node=HG_NODE):
+    """
+    Print the tasks which will be executed to synchronize the changes between hg_node and the current tip, without executing them.
+    The tasks are grouped by job, and the jobs are ordered by the estimated duration from the execution history.
+    Nothing is downloaded and the plan cache is not changed; the meta files which were not downloaded before are not loaded.
+    """
+    global hg
+    hg = hglib.open(STATE_PATH)
+    try:
+        get_tasks(SlaveSyncStatus.get_bitbucket_status(),hg_node,dry_run=True)
+
+        #job file -> [sync_job,[(task_type,task_name,shared,duration,size)]]
+        jobs = {}
+        total_duration = 0
+        total_size = 0
+        for task_type in ordered_sync_task_type:
+            for task_name,task in sync_tasks[task_type].iteritems():
+                tasks = task if isinstance(task,list) else [task]
+                for sync_job,task_metadata,task_logger in tasks:
+                    duration,size = TaskHistory.estimate(task_type,sync_job)
+                    if sync_job["job_file"] not in jobs:
+                        jobs[sync_job["job_file"]] = [sync_job,[]]
+                    jobs[sync_job["job_file"]][1].append((task_type,task_name,len(tasks) > 1,duration,size))
+                #a shared task is executed once
+                total_duration += duration
+                total_size += size or 0
+
+        print "Changes from {0}: {1} jobs, {2} tasks, estimated {3:.1f}s, {4}".format(hg_node,len(jobs),sum([len(sync_tasks[t]) for t in ordered_sync_task_type]),total_duration,format_size(total_size))
+        for sync_job,tasks in sorted(jobs.itervalues(),key=lambda job:sum([t[3] for t in job[1]]),reverse=True):
+            print ""
+            print "{0} ({1} {2}): estimated {3:.1f}s".format(sync_job["job_file"],sync_job.get("job_type"),sync_job["action"],sum([t[3] for t in tasks]))
+            for task_type,task_name,shared,duration,size in tasks:
+                print "    {0:<30} {1:<50} {2:>10.1f}s {3:>10}{4}".format(task_type,task_name,duration,format_size(size)," (shared)" if shared else "")
+        for task in notify_tasks:
+            if task[0]["job_file"] not in jobs:
+                print ""
+                print "{0} ({1}): no tasks, {2}".format(task[0]["job_file"],task[0]["action"],"failed" if task[0]["status"].is_failed else "notify only")
+    finally:
+        for k in sync_tasks.keys():
+            sync_tasks[k].clear()
+        reset()
+        hg.close()
+        hg = None
+
 if __name__ == "__main__":
-    sync()
+    if "--plan" in sys.argv[1:]:
+        #print the tasks for the changes from the specified changeset or HG_NODE
+        args = [a for a in sys.argv[1:] if a != "--plan"]
+        plan(args[0] if args else HG_NODE)
+    else:
+        sync()
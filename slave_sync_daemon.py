@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+"""
+A long running sync worker.
+
+The geoserver catalogs, templates and plugin modules are loaded once when the daemon is started,
+and each sync request from the hg hook (slave_sync_hook.py) is executed in this process.
+
+Protocol: the hook connects to the unix socket SYNC_DAEMON_SOCKET and sends one json line
+    {"HG_NODE":..., "HG_PENDING":...}
+the daemon executes the sync and replies one json line
+    {"status":"succeed"|"failed"|"outdated", "message":...}
+"outdated" means the code or the settings(".env") were changed after the daemon was started; the daemon exits and the hook runs the sync by itself.
+"""
+import os
+import sys
+import json
+import glob
+import time
+import logging
+import traceback
+import SocketServer
+
+from slave_sync_env import CODE_PATH,SYNC_DAEMON_SOCKET
+import slave_sync
+
+logger = logging.getLogger(__name__)
+
+def code_modified_time():
+    """
+    Return the last modified time of the code and the settings(".env"), the daemon is outdated if they are changed after it was started
+    """
+    return max([os.path.getmtime(f) for f in glob.glob(os.path.join(CODE_PATH,"*.py")) + [os.path.join(CODE_PATH,".env")] if os.path.exists(f)] or [0])
+
+class SyncRequestHandler(SocketServer.StreamRequestHandler):
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline())
+        except:
+            self._reply("failed","Invalid request. {}".format(traceback.format_exc()))
+            return
+
+        if code_modified_time() > self.server.started:
+            logger.info("The code or the settings were changed, stop the sync daemon.")
+            self._reply("outdated","The code or the settings were changed after the sync daemon was started")
+            self.server.outdated = True
+            return
+
+        hg_node = request.get("HG_NODE") or "0"
+        #the changesets of the running transaction are only visible to hg if HG_PENDING is set
+        if request.get("HG_PENDING"):
+            os.environ["HG_PENDING"] = request["HG_PENDING"]
+        else:
+            os.environ.pop("HG_PENDING",None)
+        logger.info("Begin to synchronize the changes from '{}'".format(hg_node))
+        try:
+            slave_sync.sync(hg_node)
+            self._reply("succeed","")
+        except:
+            logger.error("Failed to synchronize the changes from '{}'. {}".format(hg_node,traceback.format_exc()))
+            self._reply("failed",str(sys.exc_info()[1]))
+        finally:
+            os.environ.pop("HG_PENDING",None)
+
+    def _reply(self,status,message):
+        self.wfile.write(json.dumps({"status":status,"message":message}))
+        self.wfile.write("\n")
+
+class SyncDaemon(SocketServer.UnixStreamServer):
+    """
+    Execute the sync requests one by one
+    """
+    def __init__(self,path):
+        if os.path.exists(path):
+            os.remove(path)
+        SocketServer.UnixStreamServer.__init__(self,path,SyncRequestHandler)
+        os.chmod(path,0700)
+        self.started = time.time()
+        self.outdated = False
+
+    def serve(self):
+        try:
+            while not self.outdated:
+                self.handle_request()
+        finally:
+            self.server_close()
+            if os.path.exists(self.server_address):
+                os.remove(self.server_address)
+
+if __name__ == "__main__":
+    logger.info("Sync daemon is listening on '{}'".format(SYNC_DAEMON_SOCKET))
+    SyncDaemon(SYNC_DAEMON_SOCKET).serve()
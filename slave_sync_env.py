@@ -6,6 +6,7 @@ import socket
 import pytz
 import sys
 import logging
+import threading
 from jinja2 import Environment,FileSystemLoader
 from geoserver.catalog import Catalog
 from datetime import datetime
@@ -51,12 +52,69 @@ else:
 ROLLBACK = DEBUG and bool(os.environ.get("ROLLBACK","false").lower() in ["true","yes","on"])
 
 INCLUDE = [f for f in os.environ.get("INCLUDE","").split(",") if f.strip()]
+
+#the number of threads used to execute the sync tasks; tasks of unrelated jobs are executed concurrently if greater than 1
+try:
+    SYNC_WORKERS = int(os.environ.get("SYNC_WORKERS","1"))
+    if SYNC_WORKERS <= 0:
+        SYNC_WORKERS = 1
+except:
+    SYNC_WORKERS = 1
+
+#the notify tasks of the finished jobs are sent in batch, when the number of buffered jobs reaches NOTIFY_BATCH_SIZE or NOTIFY_BATCH_INTERVAL(seconds) is elapsed since last batch
+try:
+    NOTIFY_BATCH_SIZE = max(int(os.environ.get("NOTIFY_BATCH_SIZE","20")),1)
+except:
+    NOTIFY_BATCH_SIZE = 20
+try:
+    NOTIFY_BATCH_INTERVAL = max(int(os.environ.get("NOTIFY_BATCH_INTERVAL","30")),0)
+except:
+    NOTIFY_BATCH_INTERVAL = 30
+
 HG_NODE = os.environ.get("HG_NODE", "0")
+#the modified sync status is checkpointed into a journal after every SYNC_STATUS_CHECKPOINT_INTERVAL executed tasks, 0 to disable
+try:
+    SYNC_STATUS_CHECKPOINT_INTERVAL = max(int(os.environ.get("SYNC_STATUS_CHECKPOINT_INTERVAL","1")),0)
+except:
+    SYNC_STATUS_CHECKPOINT_INTERVAL = 1
+
+#the status messages longer than STATUS_MESSAGE_MAX_SIZE(characters) are truncated, and the full messages are saved into files; 
+#only the latest STATUS_MESSAGE_SPILL_FILES files are kept
+try:
+    STATUS_MESSAGE_MAX_SIZE = max(int(os.environ.get("STATUS_MESSAGE_MAX_SIZE","16384")),0)
+except:
+    STATUS_MESSAGE_MAX_SIZE = 16384
+try:
+    STATUS_MESSAGE_SPILL_FILES = max(int(os.environ.get("STATUS_MESSAGE_SPILL_FILES","1000")),0)
+except:
+    STATUS_MESSAGE_SPILL_FILES = 1000
+
+#the unix socket used by the hg hook(slave_sync_hook.py) to hand the changeset to the sync daemon(slave_sync_daemon.py)
+SYNC_DAEMON_SOCKET = os.environ.get("SYNC_DAEMON_SOCKET",os.path.join(PATH,".sync_daemon.sock"))
+#the folders of the files which can be synchronized, written when the sync tasks are loaded and read by the pre-check of the hg hook(slave_sync_hook.py)
+SYNC_FOLDERS_FILE = os.path.join(PATH,".sync_folders.json")
 BORG_STATE_SSH = os.environ.get("BORG_STATE_SSH", "ssh -i /etc/id_rsa_borg -o StrictHostKeyChecking=no -o KeepAlive=yes -o ServerAliveInterval=30 -o ConnectTimeout=3600 -o ConnectionAttempts=5")
 BORGCOLLECTOR_SSH = os.environ.get("BORGCOLLECTOR_SSH", "ssh -i /etc/id_rsa_borg -o StrictHostKeyChecking=no -o KeepAlive=yes -o ServerAliveInterval=30 -o ConnectTimeout=3600 -o ConnectionAttempts=5")
+#the ssh master connection to a remote host exits SSH_CONTROL_PERSIST seconds after the last command, 0 to disable the ssh master connections
+try:
+    SSH_CONTROL_PERSIST = max(int(os.environ.get("SSH_CONTROL_PERSIST","300")),0)
+except:
+    SSH_CONTROL_PERSIST = 300
 CODE_BRANCH = os.environ.get("CODE_BRANCH","default")
 LISTEN_CHANNELS = set([c.strip() for c in os.environ.get("LISTEN_CHANNELS","kmi").split(",") if c.strip()])
 
+#the maximum number of concurrent tasks for each resource class, configured as "resource class:limit" separated by ','
+#resource classes: db, network, geoserver-rest, render
+RESOURCE_LIMITS = {"db":2,"network":2,"geoserver-rest":1,"render":1}
+for limit in os.environ.get("RESOURCE_LIMITS","").split(","):
+    if not limit.strip():
+        continue
+    try:
+        resource,limit = limit.rsplit(":",1)
+        RESOURCE_LIMITS[resource.strip()] = max(int(limit),1)
+    except:
+        raise Exception("Invalid resource limit '{}', the format should be 'resource class:limit'".format(limit))
+
 url_re = re.compile("^(?P<protocol>https?)://(?P<host>[^:/\?]+)(:(?P<port>[0-9]+))?(?P<path>[^\?]+)?(\?(?P<params>.+)?)?$",re.IGNORECASE)
 GEOSERVER_URL = [url.strip() for url in os.environ.get("GEOSERVER_URL", "http://localhost:8080/geoserver").split(",") if url and url.strip()]
 GEOSERVER_URL = [(url[:-1] if url[-1] == "/" else url) for url in GEOSERVER_URL]
@@ -83,6 +141,12 @@ if len(GEOSERVER_PASSWORD) == 1 :
 elif len(GEOSERVER_PASSWORD) != len(GEOSERVER_URL):
     raise Exception("Please configure the password for each geoserver")
 
+#the maximum number of geoservers which are updated concurrently by a task; if missing, geoservers are updated one by one
+try:
+    GEOSERVER_WORKERS = int(os.environ.get("GEOSERVER_WORKERS","1"))
+except:
+    GEOSERVER_WORKERS = 1
+
 GEOSERVER_WMS_GETCAPABILITIES_URL = ["{}/wms?request=GetCapabilities&version=1.3.0&tiled=true".format(u) for u in GEOSERVER_URL]
 gs = []
 for index in range(len(GEOSERVER_URL)):
@@ -114,7 +178,39 @@ SKIP_GS = os.environ.get("SKIP_GS", "false").lower() in ["true","yes"]
 SHARE_LAYER_DATA = os.environ.get("SHARE_LAYER_DATA","false").lower() in ["true","yes"]
 SHARE_PREVIEW_DATA = os.environ.get("SHARE_PREVIEW_DATA","false").lower() in ["true","yes"]
 
+#the number of files downloaded in advance for the upcoming jobs; 0 to disable prefetch
+try:
+    PREFETCH_LOOKAHEAD = max(int(os.environ.get("PREFETCH_LOOKAHEAD","2")),0)
+except:
+    PREFETCH_LOOKAHEAD = 2
+#the maximum size(MB) of the files downloaded in advance
+try:
+    PREFETCH_DISK_BUDGET = max(int(os.environ.get("PREFETCH_DISK_BUDGET","10240")),0) * 1024 * 1024
+except:
+    PREFETCH_DISK_BUDGET = 10240 * 1024 * 1024
+#the maximum number of concurrent file transfers from the same host
+try:
+    TRANSFER_HOST_LIMIT = max(int(os.environ.get("TRANSFER_HOST_LIMIT","4")),1)
+except:
+    TRANSFER_HOST_LIMIT = 4
+#the bandwidth limit(KB/s) of each file transfer, like the "--bwlimit" of rsync; 0 means no limit
+try:
+    TRANSFER_BWLIMIT = max(int(os.environ.get("TRANSFER_BWLIMIT","0")),0)
+except:
+    TRANSFER_BWLIMIT = 0
+#pipe the remote table dump file into pg_restore instead of downloading it first; the restore is rolled back if the md5 of the stream doesn't match
+STREAMING_RESTORE = os.environ.get("STREAMING_RESTORE","false").lower() in ["true","yes","on"]
+#check the md5 of the remote file before downloading it, the downloaded file is always checked
+REMOTE_MD5_PRECHECK = os.environ.get("REMOTE_MD5_PRECHECK","false").lower() in ["true","yes","on"]
+#the downloaded files with md5 are kept in DUMP_CACHE_PATH, named by md5; the least recently used files are removed if the total size exceeds DUMP_CACHE_SIZE(MB), 0 to disable
+DUMP_CACHE_PATH = os.path.join(CACHE_PATH,".md5_cache")
+try:
+    DUMP_CACHE_SIZE = max(int(os.environ.get("DUMP_CACHE_SIZE","10240")),0) * 1024 * 1024
+except:
+    DUMP_CACHE_SIZE = 10240 * 1024 * 1024
+
 FASTLY_PURGE_URL = os.environ.get("FASTLY_PURGE_URL")
+FASTLY_BULK_PURGE_URL = os.environ.get("FASTLY_BULK_PURGE_URL","https://api.fastly.com/service/{}/purge")
 FASTLY_SERVICEID = os.environ.get("FASTLY_SERVICEID")
 FASTLY_API_TOKEN = os.environ.get("FASTLY_API_TOKEN")
 
@@ -189,8 +285,8 @@ def apply_to_geoservers(sync_job,task_metadata,task_status,func,args_func=lambda
     if len(GEOSERVER_URL[start:end]) == 1:
         func(sync_job,task_metadata,task_status,*args_func(0))
     else:
-        exceptions = []
-        for i in range(start,end):
+        exceptions = {}
+        def _apply(i):
             stagename = GEOSERVER_HOST[i]
             try:
                 if task_status.is_stage_not_succeed(stagename):
@@ -202,10 +298,29 @@ def apply_to_geoservers(sync_job,task_metadata,task_status,func,args_func=lambda
             except:
                 task_status.stage_failed(stagename)
                 task_status.set_stage_message(stagename,"message",str(sys.exc_info()[1]))
-                exceptions.append(str(sys.exc_info()[1]))
+                exceptions[i] = str(sys.exc_info()[1])
+
+        indexes = range(start,end)
+        if GEOSERVER_WORKERS > 1:
+            #apply to geoservers concurrently, each geoserver is processed by one thread.
+            def _worker():
+                while True:
+                    try:
+                        i = indexes.pop(0)
+                    except IndexError:
+                        return
+                    _apply(i)
+            threads = [threading.Thread(target=_worker) for i in range(min(GEOSERVER_WORKERS,len(indexes)))]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        else:
+            for i in indexes:
+                _apply(i)
     
         if exceptions:
-            raise Exception("\n".join(exceptions))
+            raise Exception("\n".join([exceptions[i] for i in sorted(exceptions.keys())]))
         elif task_status.all_stages_succeed:
             task_status.clean_task_failed()
         else:
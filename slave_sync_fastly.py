@@ -9,7 +9,7 @@ from slave_sync_task import (
     update_livelayer_job,remove_livelayer_job,empty_gwc_livelayer_job,
     update_layergroup_job,remove_layergroup_job,empty_gwc_group_job,
     update_feature_job,update_feature_metadata_job,remove_feature_job,empty_gwc_feature_job,
-    gs_feature_task_filter,gs_task_filter
+    gs_feature_task_filter,gs_task_filter,NETWORK_RESOURCE
 )
 
 logger = logging.getLogger(__name__)
@@ -29,11 +29,48 @@ def purge_fastly_cache(sync_job,task_metadata,task_status):
 
     task_status.set_message("message","Succeed to purge fastly cache.\r\n{}".format("\r\n".join(purge_results)))
 
+def purge_fastly_cache_batch(tasks):
+    """
+    Purge the fastly cache of a batch of jobs with bulk purge requests
+    """
+    #the jobs which use each surrogate key
+    key_jobs = {}
+    for sync_job,task_metadata,task_status in tasks:
+        for k in settings.FASTLY_SURROGATE_KEY:
+            key = k.format(sync_job['workspace'],sync_job['name'])
+            if key not in key_jobs:
+                key_jobs[key] = []
+            key_jobs[key].append((sync_job,task_status))
+
+    keys = key_jobs.keys()
+    for i in range(0,len(keys),FASTLY_BULK_PURGE_KEYS):
+        chunk = keys[i:i + FASTLY_BULK_PURGE_KEYS]
+        try:
+            resp = requests.post(BULK_PURGE_URL, headers={'Accept':'application/json','Fastly-Soft-Purge':settings.FASTLY_SOFT_PURGE,'Fastly-Key':settings.FASTLY_API_TOKEN,'Surrogate-Key':" ".join(chunk)})
+            resp.raise_for_status()
+            for key in chunk:
+                for sync_job,task_status in key_jobs[key]:
+                    task_status.set_message("message","{}\r\n{}:{}".format(task_status.get_message("message") or "Succeed to purge fastly cache.",BULK_PURGE_URL,key))
+        except Exception as ex:
+            message = "Failed to purge fastly cache via url({}) with surrogate keys({}).{}".format(BULK_PURGE_URL," ".join(chunk),str(ex))
+            logger.error(message)
+            for key in chunk:
+                for sync_job,task_status in key_jobs[key]:
+                    task_status.failed()
+                    task_status.set_message("message",message)
+
+#the maximum number of surrogate keys in a bulk purge request
+FASTLY_BULK_PURGE_KEYS = 256
+
 tasks_metadata = []
+tasks_resource = {
+    "purge_fastly_cache":NETWORK_RESOURCE
+}
 
 
 if settings.FASTLY_PURGE_URL and settings.FASTLY_SERVICEID and settings.FASTLY_API_TOKEN and settings.FASTLY_SURROGATE_KEY:
     PURGE_URL = settings.FASTLY_PURGE_URL.format(settings.FASTLY_SERVICEID)
+    BULK_PURGE_URL = settings.FASTLY_BULK_PURGE_URL.format(settings.FASTLY_SERVICEID)
 
     for job,task_filter in (
         (update_wmslayer_job,gs_feature_task_filter),
@@ -54,4 +91,4 @@ if settings.FASTLY_PURGE_URL and settings.FASTLY_SERVICEID and settings.FASTLY_A
         (empty_gwc_feature_job,gs_feature_task_filter),
 
     ):
-        tasks_metadata.append(("purge_fastly_cache",job,task_filter,task_feature_name,purge_fastly_cache))
+        tasks_metadata.append(("purge_fastly_cache",job,task_filter,task_feature_name,purge_fastly_cache,purge_fastly_cache_batch))
@@ -1,13 +1,19 @@
 import logging
 import os
+import re
+import hashlib
+import shutil
 import subprocess
 import json
+import threading
 import traceback
+from contextlib import contextmanager
 
 from slave_sync_env import (
-    BORGCOLLECTOR_SSH,env,SLAVE_NAME,PUBLISH_PATH,CACHE_PATH,
+    env,SLAVE_NAME,PUBLISH_PATH,CACHE_PATH,
     PREVIEW_ROOT_PATH,SYNC_PATH,SYNC_SERVER,
-    SHARE_LAYER_DATA,SHARE_PREVIEW_DATA,
+    SHARE_LAYER_DATA,SHARE_PREVIEW_DATA,PREFETCH_LOOKAHEAD,PREFETCH_DISK_BUDGET,DUMP_CACHE_PATH,DUMP_CACHE_SIZE,
+    TRANSFER_HOST_LIMIT,TRANSFER_BWLIMIT,STREAMING_RESTORE,REMOTE_MD5_PRECHECK,
     parse_remotefilepath,
     now
 )
@@ -17,17 +23,39 @@ from slave_sync_task import (
     update_wmsstore_job,update_wmslayer_job,remove_wmslayer_job,remove_wmsstore_job,
     update_livestore_job,update_livelayer_job,remove_livelayer_job,remove_livestore_job,
     empty_gwc_layer_job,empty_gwc_group_job,empty_gwc_livelayer_job,
-    update_feature_job,remove_feature_job,update_feature_metadata_job,empty_gwc_feature_job,update_workspace_job
+    update_feature_job,remove_feature_job,update_feature_metadata_job,empty_gwc_feature_job,update_workspace_job,
+    NETWORK_RESOURCE
 )
+from slave_sync_ssh import SSHPool
 
 logger = logging.getLogger(__name__)
 
 
 task_name = lambda sync_job: "{0}:{1}".format(sync_job["workspace"],sync_job["name"]) if "workspace" in sync_job else (sync_job["name"] if "name" in sync_job else sync_job["schema"])
 
-download_cmd = ["rsync", "-Paz", "-e", BORGCOLLECTOR_SSH,None,None]
-md5_cmd = BORGCOLLECTOR_SSH.split() + [None,"md5sum",None]
-local_md5_cmd = ["md5sum",None]
+#the ssh commands are executed through the ssh master connection of the host
+download_cmd = ["rsync", "-Paz", "-e", None,None,None]
+md5_cmd = [None,"md5sum",None]
+#the size of the buffer used to compute the md5 of a local file
+MD5_BUFFER_SIZE = 4 * 1024 * 1024
+
+def file_md5(path):
+    """
+    Return the md5 of the local file
+    """
+    m = hashlib.md5()
+    with open(path,"rb") as f:
+        while True:
+            data = f.read(MD5_BUFFER_SIZE)
+            if not data:
+                break
+            m.update(data)
+    return m.hexdigest()
+
+def check_local_file_md5(path,md5):
+    local_md5 = file_md5(path)
+    if local_md5 != md5:
+        raise Exception("md5sum checks failed.Expected md5 is {0}; but file's md5 is {1}".format(md5,local_md5))
 
 def check_file_md5(md5_cmd,md5,task_status = None):
     logger.info("Executing {}...".format(repr(md5_cmd)))
@@ -47,30 +75,125 @@ def check_file_md5(md5_cmd,md5,task_status = None):
         raise Exception("md5sum checks failed.Expected md5 is {0}; but file's md5 is {1}".format(md5,file_md5))
 
 
-def download_file(remote_path,local_path,task_status = None,md5=None):
-    if md5:
-        #check file md5 before downloading.
+class DumpCache(object):
+    """
+    A content-addressed cache of the downloaded files, the file with md5 is hard linked into DUMP_CACHE_PATH with the md5 as name.
+    A file with the same md5 is linked to the local path from the cache instead of downloading again;
+    the least recently used files are removed if the total size of the cache exceeds DUMP_CACHE_SIZE.
+    """
+    _md5_re = re.compile("^[0-9a-fA-F]{32}$")
+    _lock = threading.Lock()
+
+    @classmethod
+    def _cache_file(cls,md5):
+        if not DUMP_CACHE_SIZE or not md5 or not cls._md5_re.match(md5):
+            return None
+        return os.path.join(DUMP_CACHE_PATH,md5.lower())
+
+    @classmethod
+    def _link(cls,src,dest):
+        if os.path.exists(dest):
+            os.remove(dest)
+        try:
+            os.link(src,dest)
+        except OSError:
+            #different file system
+            shutil.copyfile(src,dest)
+
+    @classmethod
+    def cached(cls,md5):
+        cache_file = cls._cache_file(md5)
+        return bool(cache_file) and os.path.exists(cache_file)
+
+    @classmethod
+    def get(cls,md5,local_path):
+        """
+        Link the cached file to the local path; return True if the file is cached
+        """
+        cache_file = cls._cache_file(md5)
+        if not cache_file:
+            return False
+        with cls._lock:
+            if not os.path.exists(cache_file):
+                return False
+            try:
+                cls._link(cache_file,local_path)
+                #the modify time of the cached file is used as the last used time
+                os.utime(cache_file,None)
+                return True
+            except:
+                logger.error("Failed to get the file '{}' from cache. {}".format(local_path,traceback.format_exc()))
+                return False
+
+    @classmethod
+    def put(cls,md5,local_path):
+        """
+        Add the downloaded file into the cache
+        """
+        cache_file = cls._cache_file(md5)
+        if not cache_file:
+            return
+        with cls._lock:
+            try:
+                if not os.path.exists(DUMP_CACHE_PATH):
+                    os.makedirs(DUMP_CACHE_PATH)
+                cls._link(local_path,cache_file)
+                os.utime(cache_file,None)
+                cls._evict()
+            except:
+                logger.error("Failed to add the file '{}' into cache. {}".format(local_path,traceback.format_exc()))
+
+    @classmethod
+    def _evict(cls):
+        files = [(os.path.getmtime(f),os.path.getsize(f),f) for f in [os.path.join(DUMP_CACHE_PATH,name) for name in os.listdir(DUMP_CACHE_PATH)]]
+        size = sum([f[1] for f in files])
+        if size <= DUMP_CACHE_SIZE:
+            return
+        files.sort()
+        for mtime,file_size,f in files:
+            if size <= DUMP_CACHE_SIZE:
+                break
+            os.remove(f)
+            size -= file_size
+
+def download_file(remote_path,local_path,task_status = None,md5=None,bwlimit=None):
+    """
+    bwlimit: the bandwidth limit(KB/s) of the transfer
+    """
+    if DumpCache.get(md5,local_path):
+        logger.info("Get the file '{}' from cache".format(remote_path))
+        if task_status:
+            task_status.set_message("message","Get the file from cache.")
+        return
+
+    if md5 and REMOTE_MD5_PRECHECK:
+        #check file md5 before downloading; the downloaded file is always checked.
         remote_file_path = remote_path
         if remote_path.find("@") > 0:
             #remote_path includes user@server prefix,remote that prefix
             remote_file_path = remote_path.split(":",1)[1]
         if SYNC_SERVER:
-            md5_cmd[len(md5_cmd) - 1] = remote_file_path
-            md5_cmd[len(md5_cmd) - 3] = SYNC_SERVER
-            check_file_md5(md5_cmd,md5,task_status)
+            cmd = SSHPool.ssh_cmd(SYNC_SERVER) + md5_cmd
+            cmd[len(cmd) - 1] = remote_file_path
+            cmd[len(cmd) - 3] = SYNC_SERVER
+            check_file_md5(cmd,md5,task_status)
         elif remote_path.find("@") > 0:
-            md5_cmd[len(md5_cmd) - 1] = remote_file_path
-            md5_cmd[len(md5_cmd) - 3] = remote_path.split(":",1)[0]
-            check_file_md5(md5_cmd,md5,task_status)
+            cmd = SSHPool.ssh_cmd(remote_path.split(":",1)[0]) + md5_cmd
+            cmd[len(cmd) - 1] = remote_file_path
+            cmd[len(cmd) - 3] = remote_path.split(":",1)[0]
+            check_file_md5(cmd,md5,task_status)
         else:
-            local_md5_cmd[len(local_md5_cmd) - 1] = remote_file_path
-            check_file_md5(local_md5_cmd,md5,task_status)
+            check_local_file_md5(remote_file_path,md5)
 
     # sync over PostgreSQL dump with rsync
-    download_cmd[len(download_cmd) - 2] = remote_path
-    download_cmd[len(download_cmd) - 1] = local_path
-    logger.info("Executing {}...".format(repr(download_cmd)))
-    rsync = subprocess.Popen(download_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
+    cmd = list(download_cmd)
+    cmd[len(cmd) - 3] = SSHPool.rsync_ssh(remote_path)
+    cmd[len(cmd) - 2] = remote_path
+    cmd[len(cmd) - 1] = local_path
+    if bwlimit:
+        cmd.insert(1,"--bwlimit={}".format(bwlimit))
+    logger.info("Executing {}...".format(repr(cmd)))
+    rsync = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
     rsync_output = rsync.communicate()
 
     if rsync.returncode != 0:
@@ -83,10 +206,13 @@ def download_file(remote_path,local_path,task_status = None,md5=None):
 
     if md5:
         #check file md5 after downloading
-        local_md5_cmd[len(local_md5_cmd) - 1] = local_path
-        check_file_md5(local_md5_cmd,md5,task_status)
+        check_local_file_md5(local_path,md5)
+        DumpCache.put(md5,local_path)
 
-def load_metafile(sync_job):
+def load_metafile(sync_job,dry_run=False):
+    """
+    dry_run: only load the meta file which was already downloaded
+    """
     meta_file = sync_job.get('meta',None)
     if not meta_file:
         #no meta file, all meta datas are embeded into the sync_job
@@ -107,6 +233,10 @@ def load_metafile(sync_job):
     except:
         pass
 
+    if dry_run and not SHARE_LAYER_DATA:
+        logger.info("The meta data of job({}) is not downloaded in dry run".format(sync_job['job_file']))
+        return
+
     logger.info("Begin to load meta data for job({})".format(sync_job['job_file']))
     task_status.last_process_time = now()
     if SHARE_LAYER_DATA:
@@ -130,9 +260,9 @@ def load_metafile(sync_job):
         # 4. Remove the layer from repository.
         # 5. Slave pull from the repository, only the last version will be fetched, and intermediate versions are ignored. so the publish action in step 3 is invisible for slave cient.
         # 6. Slave client try to fetch the meta file from master and compare the md5 , and found: file's md5 is 'B', but md5 data in repository is 'A', doesn't match.
-        download_file(meta_file["file"],temp_file,task_status,None)
+        TransferManager.transfer(meta_file["file"],temp_file,task_status,None)
     else:
-        download_file(meta_file["file"],temp_file,task_status,meta_file.get('md5',None))
+        TransferManager.transfer(meta_file["file"],temp_file,task_status,meta_file.get('md5',None))
     meta_data = None
     with open(temp_file,"r") as f:
         meta_data = json.loads(f.read())
@@ -156,50 +286,304 @@ def load_metafile(sync_job):
 def previous(rev):
     return str(int(hg.log(rev)[0][0])-1)
 
-def load_table_dumpfile(sync_job):
+def table_dumpfile(sync_job):
+    """
+    Return the (remote path,local path,md5) of the table dump file; return None if no need to download
+    """
     if sync_job["action"] != "publish":
         #not a publish job, no need to download table data
-        return
+        return None
 
     data_file = sync_job.get('data',None)
     if not data_file:
         raise Exception("Can't find data file in json file.")
     if SYNC_SERVER:
         #download from local slave
-        download_file("{0}:{1}/{2}.tar".format(SYNC_SERVER,SYNC_PATH,sync_job["name"]),data_file['local_file'],None,data_file.get("md5",None))
+        return ("{0}:{1}/{2}.tar".format(SYNC_SERVER,SYNC_PATH,sync_job["name"]),data_file['local_file'],data_file.get("md5",None))
     else:
         #download from borg master
-        download_file(data_file["file"],data_file['local_file'],None,data_file.get('md5',None))
+        return (data_file["file"],data_file['local_file'],data_file.get('md5',None))
 
-def load_gs_stylefile(sync_job,task_metadata,task_status):
+def stylefiles(sync_job):
+    """
+    Return the list of (remote path,local path,md5) of the style files
+    """
     if sync_job["action"] == "remove":
         #remove task, no need to download style file
-        return
-    style_files = sync_job.get('styles',None)
-    if not style_files: 
-        return
-    for name,style_file in style_files.iteritems():
+        return []
+    files = []
+    for name,style_file in (sync_job.get('styles') or {}).iteritems():
         if SYNC_SERVER:
             #download from local slave
             if name == "builtin":
-                download_file("{}:{}/{}.sld".format(SYNC_SERVER,SYNC_PATH,sync_job["name"]),style_file['local_file'],task_status,style_file.get("md5",None))
+                files.append(("{}:{}/{}.sld".format(SYNC_SERVER,SYNC_PATH,sync_job["name"]),style_file['local_file'],style_file.get("md5",None)))
             else:
-                download_file("{}:{}/{}.{}.sld".format(SYNC_SERVER,SYNC_PATH,sync_job["name"],name),style_file['local_file'],task_status,style_file.get("md5",None))
-            task_status.set_message("message","Succeed to download style file from slave server {0}".format(SYNC_SERVER))
+                files.append(("{}:{}/{}.{}.sld".format(SYNC_SERVER,SYNC_PATH,sync_job["name"],name),style_file['local_file'],style_file.get("md5",None)))
         else:
             #download from borg master
-            download_file(style_file["file"],style_file['local_file'],task_status,style_file.get("md5",None))
-            task_status.set_message("message","Succeed to download style file from master.")
+            files.append((style_file["file"],style_file['local_file'],style_file.get("md5",None)))
+    return files
+
+class TransferManager(object):
+    """
+    Execute the file transfers with a concurrency limit for each host(TRANSFER_HOST_LIMIT) and a bandwidth limit for each transfer(TRANSFER_BWLIMIT);
+    the bandwidth of a transfer can't be changed after it is started, so a single transfer gets the whole limit,
+    and the bandwidth of the transfers from a host is at most TRANSFER_HOST_LIMIT * TRANSFER_BWLIMIT.
+    """
+    _host_slots = {}
+    _bwlimit = TRANSFER_BWLIMIT or None
+    _lock = threading.Lock()
+
+    @classmethod
+    def _host(cls,remote_path):
+        if remote_path.find(":") > 0 and not remote_path.startswith("/"):
+            return remote_path.split(":",1)[0].split("@")[-1]
+        return "localhost"
+
+    @classmethod
+    @contextmanager
+    def slot(cls,remote_path):
+        """
+        Take a slot of the host for a transfer of the remote file;
+        yield the bandwidth limit(KB/s) of the transfer, None means no limit.
+        Used by the transfers which are not executed by "transfer", e.g. the streaming restore.
+        """
+        host = cls._host(remote_path)
+        with cls._lock:
+            if host not in cls._host_slots:
+                cls._host_slots[host] = threading.BoundedSemaphore(TRANSFER_HOST_LIMIT)
+            slots = cls._host_slots[host]
+        with slots:
+            yield cls._bwlimit
+
+    @classmethod
+    def transfer(cls,remote_path,local_path,task_status=None,md5=None):
+        """
+        Download a file
+        """
+        with cls.slot(remote_path) as bwlimit:
+            download_file(remote_path,local_path,task_status,md5,bwlimit)
+
+    @classmethod
+    def transfer_batch(cls,files,task_status=None,fetch=None):
+        """
+        Download a batch of files (remote path,local path,md5) concurrently with at most TRANSFER_HOST_LIMIT threads;
+        the result of each file is saved as a stage of the task status, an exception is raised if some file is failed.
+        fetch: the function to download a file, default is "transfer"
+        """
+        fetch = fetch or cls.transfer
+        errors = []
+        def _fetch(remote_path,local_path,md5):
+            stage = os.path.basename(local_path)
+            try:
+                fetch(remote_path,local_path,task_status,md5)
+                if task_status:
+                    task_status.set_stage_message(stage,"message","Succeed to download file '{}'".format(remote_path))
+                    task_status.stage_succeed(stage)
+            except:
+                message = traceback.format_exc()
+                errors.append("Failed to download file '{}'. {}".format(remote_path,message))
+                if task_status:
+                    task_status.set_stage_message(stage,"message",message)
+                    task_status.stage_failed(stage)
+
+        pending = list(files)
+        lock = threading.Lock()
+        def _work():
+            while True:
+                with lock:
+                    if not pending:
+                        return
+                    f = pending.pop(0)
+                _fetch(*f)
+
+        if len(files) == 1:
+            _fetch(*files[0])
+        else:
+            threads = [threading.Thread(target=_work,name="transfer-{}".format(i)) for i in range(min(len(files),TRANSFER_HOST_LIMIT))]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        if errors:
+            raise Exception("\n".join(errors))
+
+def load_table_dumpfile(sync_job):
+    data_file = table_dumpfile(sync_job)
+    if data_file:
+        fetch_file(data_file[0],data_file[1],None,data_file[2])
+
+def load_gs_stylefile(sync_job,task_metadata,task_status):
+    files = stylefiles(sync_job)
+    if not files:
+        return
+    #download the style files concurrently
+    TransferManager.transfer_batch(files,task_status,fetch_file)
+    if SYNC_SERVER:
+        task_status.set_message("message","Succeed to download style file from slave server {0}".format(SYNC_SERVER))
+    else:
+        task_status.set_message("message","Succeed to download style file from master.")
+
+class Prefetcher(object):
+    """
+    Download the table dump files and style files of the upcoming jobs in a background thread,
+    so the transfer of the files overlaps with the restore of the earlier jobs.
+    The files are downloaded to the same local paths used by the tasks; at most "lookahead" files or "disk_budget" bytes
+    are downloaded but not used yet.
+    Only the files of the tasks scheduled for the job are prefetched; the task status is only read, never created or changed.
+    """
+    def __init__(self,sync_jobs,job_task_types,lookahead=PREFETCH_LOOKAHEAD,disk_budget=PREFETCH_DISK_BUDGET):
+        self._sync_jobs = sync_jobs
+        #job file -> the task types scheduled for the job
+        self._job_task_types = job_task_types
+        self._lookahead = lookahead
+        self._disk_budget = disk_budget
+        #local path -> {"event":threading.Event,"succeed":bool,"size":int,"held":bool}
+        self._files = {}
+        self._held_files = 0
+        self._held_bytes = 0
+        self._stopped = False
+        self._lock = threading.Condition()
+        self._thread = threading.Thread(target=self._run,name="prefetcher")
+        self._thread.daemon = True
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        with self._lock:
+            self._stopped = True
+            self._lock.notify_all()
+
+    def _job_files(self,sync_job):
+        files = []
+        task_types = self._job_task_types.get(sync_job["job_file"],())
+        tasks = sync_job["status"]._info["tasks"]
+        if "load_gs_stylefile" in task_types and not (tasks.get("load_gs_stylefile") and tasks["load_gs_stylefile"].is_succeed):
+            files.extend(stylefiles(sync_job))
+        if not STREAMING_RESTORE and "restore_table" in task_types and not (tasks.get("restore_table") and tasks["restore_table"].is_stage_succeed("load_table_dumpfile")):
+            #the table dump file is piped into pg_restore in streaming mode
+            data_file = table_dumpfile(sync_job)
+            if data_file:
+                files.append(data_file)
+        return files
+
+    def _run(self):
+        for sync_job in self._sync_jobs:
+            try:
+                files = self._job_files(sync_job)
+            except:
+                #the files of the job are unknown, let the tasks report the error
+                continue
+            for remote_path,local_path,md5 in files:
+                with self._lock:
+                    while not self._stopped and (self._held_files >= self._lookahead or self._held_bytes >= self._disk_budget):
+                        self._lock.wait()
+                    if self._stopped:
+                        return
+                    if local_path in self._files:
+                        #already downloaded or being downloaded by a task
+                        continue
+                    state = {"event":threading.Event(),"succeed":False,"size":0,"held":False}
+                    self._files[local_path] = state
+
+                logger.info("Prefetch the file '{}' for job({})".format(remote_path,sync_job["job_file"]))
+                try:
+                    TransferManager.transfer(remote_path,local_path,None,md5)
+                    state["succeed"] = True
+                    state["size"] = os.path.getsize(local_path)
+                except:
+                    logger.error("Failed to prefetch the file '{}'. {}".format(remote_path,traceback.format_exc()))
+
+                with self._lock:
+                    if state["succeed"]:
+                        state["held"] = True
+                        self._held_files += 1
+                        self._held_bytes += state["size"]
+                    state["event"].set()
+
+    def _release(self,state):
+        """
+        The prefetched file is used or not required any more
+        """
+        with self._lock:
+            if state["held"]:
+                state["held"] = False
+                self._held_files -= 1
+                self._held_bytes -= state["size"]
+                self._lock.notify_all()
+
+    def fetch(self,remote_path,local_path,task_status=None,md5=None):
+        """
+        Download the file if it is not prefetched
+        """
+        with self._lock:
+            state = self._files.get(local_path)
+            if not state:
+                #not prefetched, download it by the task
+                event = threading.Event()
+                event.set()
+                self._files[local_path] = {"event":event,"succeed":False,"size":0,"held":False}
+        if state:
+            state["event"].wait()
+            if state["succeed"]:
+                self._release(state)
+                if os.path.exists(local_path):
+                    return
+            #prefetch failed, download it again
+        TransferManager.transfer(remote_path,local_path,task_status,md5)
+
+    def job_done(self,sync_jobs):
+        """
+        Release the prefetched files of the finished jobs, used or not
+        """
+        for sync_job in sync_jobs:
+            try:
+                files = stylefiles(sync_job) + [f for f in [table_dumpfile(sync_job)] if f]
+            except:
+                continue
+            for remote_path,local_path,md5 in files:
+                state = self._files.get(local_path)
+                if state:
+                    self._release(state)
+
+prefetcher = None
+
+def start_prefetch(sync_jobs,job_task_types):
+    """
+    Start to prefetch the files of the jobs in the order of the jobs; do nothing if prefetch is disabled
+    job_task_types: job file -> the task types scheduled for the job
+    """
+    global prefetcher
+    if SHARE_LAYER_DATA or PREFETCH_LOOKAHEAD <= 0 or not sync_jobs:
+        return
+    prefetcher = Prefetcher(sync_jobs,job_task_types).start()
+
+def fetch_file(remote_path,local_path,task_status=None,md5=None):
+    if prefetcher:
+        prefetcher.fetch(remote_path,local_path,task_status,md5)
+    else:
+        TransferManager.transfer(remote_path,local_path,task_status,md5)
+
+def reset():
+    global prefetcher
+    if prefetcher:
+        prefetcher.stop()
+        prefetcher = None
+    SSHPool.close_all()
 
 
-upload_cmd = ["rsync", "-azR" ,"-e", BORGCOLLECTOR_SSH,None,None]
+upload_cmd = ["rsync", "-azR" ,"-e", None,None,None]
 
 def upload_file(local_file,remote_path,task_status):
     # sync over PostgreSQL dump with rsync
-    upload_cmd[len(upload_cmd) - 2] = local_file
-    upload_cmd[len(upload_cmd) - 1] = remote_path
-    logger.info("Executing {}...".format(repr(upload_cmd)))
-    rsync = subprocess.Popen(upload_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
+    cmd = list(upload_cmd)
+    cmd[len(cmd) - 3] = SSHPool.rsync_ssh(remote_path)
+    cmd[len(cmd) - 2] = local_file
+    cmd[len(cmd) - 1] = remote_path
+    logger.info("Executing {}...".format(repr(cmd)))
+    rsync = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
     rsync_output = rsync.communicate()
     if rsync_output[1] and rsync_output[1].strip():
         logger.info("stderr: {}".format(rsync_output[1]))
@@ -314,3 +698,8 @@ elif SHARE_PREVIEW_DATA:
     
                         ("delete_dumpfile"  , update_workspace_job, None, task_name, delete_dumpfile),
     ]
+
+tasks_resource = {
+                        "load_gs_stylefile" : NETWORK_RESOURCE,
+                        "send_layer_preview": NETWORK_RESOURCE,
+}
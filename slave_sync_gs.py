@@ -16,7 +16,8 @@ from slave_sync_task import (
     update_access_rules_job,update_wmsstore_job,gs_task_filter,update_layergroup_job,
     update_livestore_job,update_livelayer_job,remove_livestore_job,remove_livelayer_job,
     remove_wmsstore_job,update_wmslayer_job,remove_wmslayer_job,remove_layergroup_job,empty_gwc_layer_job,empty_gwc_livelayer_job,
-    empty_gwc_group_job,empty_gwc_feature_job,update_workspace_job
+    empty_gwc_group_job,empty_gwc_feature_job,update_workspace_job,
+    GEOSERVER_RESOURCE
 )
 
 logger = logging.getLogger(__name__)
@@ -392,3 +393,14 @@ if settings.GEOSERVER_SHARING_DATA_DIR and len(settings.GEOSERVER_URL) > 1:
         (update_workspace_job,gs_feature_task_filter)
     ):
         tasks_metadata.append(("reload_dependent_geoservers",job,task_filter,'reload_dependent_geoservers',reload_dependent_geoservers))
+
+tasks_resource = {
+                    "create_datastore"              : GEOSERVER_RESOURCE,
+                    "delete_datastore"              : GEOSERVER_RESOURCE,
+                    "delete_feature"                : GEOSERVER_RESOURCE,
+                    "create_feature"                : GEOSERVER_RESOURCE,
+                    "create_style"                  : GEOSERVER_RESOURCE,
+                    "create_workspace"              : GEOSERVER_RESOURCE,
+                    "reload_geoserver"              : GEOSERVER_RESOURCE,
+                    "reload_dependent_geoservers"   : GEOSERVER_RESOURCE,
+}
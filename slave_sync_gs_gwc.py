@@ -10,7 +10,7 @@ import slave_sync_env as settings
 from slave_sync_task import (
     update_wmslayer_job,update_layergroup_job,update_feature_job,update_feature_metadata_job,gs_task_filter,gs_feature_task_filter,gs_spatial_task_filter,
     empty_gwc_layer_job,empty_gwc_group_job,empty_gwc_feature_job,
-    empty_gwc_livelayer_job,update_livelayer_job
+    empty_gwc_livelayer_job,update_livelayer_job,GEOSERVER_RESOURCE
 )
 
 logger = logging.getLogger(__name__)
@@ -19,17 +19,19 @@ update_headers = {'content-type':'application/xml','Accept': 'application/xml'}
 
 task_name = lambda sync_job: "{0}:{1}".format(sync_job["workspace"],sync_job["name"])
 
-def _update_gwc(sync_job,task_metadata,task_status,gwc,stage=None):
+def _update_gwc(sync_job,task_metadata,task_status,gwc,layers=None,stage=None):
     """
     update a gwc
+    layers: the cached layers in gwc; retrieve the cached layer from gwc if it is None
     """
+    exists = None if layers is None else task_name(sync_job) in layers
     #create the cached layer
     if "geoserver_setting" in sync_job and sync_job["geoserver_setting"].get("create_cache_layer",False):
         #need to create cache layer
-        gwc.update_layer(sync_job)
+        gwc.update_layer(sync_job,exists=exists)
         task_status.set_message("message","Update gwc successfully",stage=stage)
     else:
-        if gwc.get_layer(sync_job['workspace'], sync_job['name']):
+        if gwc.get_layer(sync_job['workspace'], sync_job['name']) if exists is None else exists:
             gwc.del_layer(sync_job['workspace'],sync_job['name'])
             task_status.set_message("message","Remove gwc successfully",stage=stage)
         else:
@@ -38,6 +40,28 @@ def _update_gwc(sync_job,task_metadata,task_status,gwc,stage=None):
 def update_gwc(sync_job,task_metadata,task_status):
     settings.apply_to_geoservers(sync_job,task_metadata,task_status,_update_gwc,lambda index:(GeoWebCache(settings.GEOSERVER_URL[index],settings.GEOSERVER_USERNAME[index],settings.GEOSERVER_PASSWORD[index]),))
 
+def update_gwc_batch(tasks):
+    """
+    update the gwc of a batch of jobs; the cached layer list is retrieved once from each geoserver
+    """
+    gwcs = {}
+    def _gwc(index):
+        if index not in gwcs:
+            gwc = GeoWebCache(settings.GEOSERVER_URL[index],settings.GEOSERVER_USERNAME[index],settings.GEOSERVER_PASSWORD[index])
+            try:
+                layers = gwc.layers
+            except:
+                logger.error("Failed to retrieve the cached layers from geoserver({0}), check the cached layer one by one. {1}".format(settings.GEOSERVER_URL[index],traceback.format_exc()))
+                layers = None
+            gwcs[index] = (gwc,layers)
+        return gwcs[index]
+
+    for sync_job,task_metadata,task_status in tasks:
+        try:
+            settings.apply_to_geoservers(sync_job,task_metadata,task_status,_update_gwc,_gwc)
+        except:
+            task_status.failed()
+            task_status.set_message("message",traceback.format_exc())
 
 def _empty_gwc(sync_job,task_metadata,task_status,gwc,stage=None):
     """
@@ -54,14 +78,19 @@ def empty_gwc(sync_job,task_metadata,task_status):
 
 
 tasks_metadata = {
-                ("update_gwc", update_wmslayer_job  , gs_task_filter        , task_name, update_gwc),
-                ("update_gwc", update_layergroup_job, gs_task_filter        , task_name, update_gwc),
-                ("update_gwc", update_feature_job   , gs_spatial_task_filter, task_name, update_gwc),
-                ("update_gwc", update_livelayer_job   , gs_spatial_task_filter, task_name, update_gwc),
-                ("update_gwc", update_feature_metadata_job   , gs_spatial_task_filter, task_name, update_gwc),
+                ("update_gwc", update_wmslayer_job  , gs_task_filter        , task_name, update_gwc, update_gwc_batch),
+                ("update_gwc", update_layergroup_job, gs_task_filter        , task_name, update_gwc, update_gwc_batch),
+                ("update_gwc", update_feature_job   , gs_spatial_task_filter, task_name, update_gwc, update_gwc_batch),
+                ("update_gwc", update_livelayer_job   , gs_spatial_task_filter, task_name, update_gwc, update_gwc_batch),
+                ("update_gwc", update_feature_metadata_job   , gs_spatial_task_filter, task_name, update_gwc, update_gwc_batch),
                 ("empty_gwc", empty_gwc_layer_job  , gs_task_filter        , task_name, empty_gwc),
                 ("empty_gwc", empty_gwc_group_job  , gs_task_filter        , task_name, empty_gwc),
                 ("empty_gwc", empty_gwc_feature_job  , gs_task_filter        , task_name, empty_gwc),
                 ("empty_gwc", empty_gwc_livelayer_job  , gs_task_filter        , task_name, empty_gwc),
 }
 
+tasks_resource = {
+                "update_gwc": GEOSERVER_RESOURCE,
+                "empty_gwc": GEOSERVER_RESOURCE,
+}
+
@@ -7,7 +7,7 @@ import slave_sync_env as settings
 
 from slave_sync_task import (
     update_layergroup_job,remove_layergroup_job,gs_task_filter,
-    get_http_response_exception,get_task
+    get_http_response_exception,get_task,GEOSERVER_RESOURCE
 )
 
 logger = logging.getLogger(__name__)
@@ -96,3 +96,8 @@ tasks_metadata = {
                 ("remove_layergroup", remove_layergroup_job, gs_task_filter, task_name, remove_group)
 }
 
+tasks_resource = {
+                "update_layergroup": GEOSERVER_RESOURCE,
+                "remove_layergroup": GEOSERVER_RESOURCE
+}
+
@@ -10,7 +10,8 @@ import geoserver_catalog_extension
 import slave_sync_env as settings
 
 from slave_sync_task import (
-    update_feature_job,gs_spatial_task_filter,update_livelayer_job,layer_preview_task_filter,update_wmslayer_job
+    update_feature_job,gs_spatial_task_filter,update_livelayer_job,layer_preview_task_filter,update_wmslayer_job,
+    RENDER_RESOURCE
 )
 
 logger = logging.getLogger(__name__)
@@ -180,3 +181,7 @@ tasks_metadata = [
                     ("get_layer_preview", update_wmslayer_job, layer_preview_task_filter      , task_layer_name  , get_layer_preview),
 ]
 
+tasks_resource = {
+                    "get_layer_preview": RENDER_RESOURCE,
+}
+
@@ -6,7 +6,7 @@ import requests
 import slave_sync_env as settings
 from slave_sync_task import (
     update_wmsstore_job,update_wmslayer_job,remove_wmslayer_job,remove_wmsstore_job,gs_task_filter,
-    get_http_response_exception
+    get_http_response_exception,GEOSERVER_RESOURCE
 )
 
 logger = logging.getLogger(__name__)
@@ -168,3 +168,10 @@ tasks_metadata = [
                     ("remove_wmsstore", remove_wmsstore_job, gs_task_filter, task_name, remove_store)
 ]
 
+tasks_resource = {
+                    "update_wmsstore": GEOSERVER_RESOURCE,
+                    "update_wmslayer": GEOSERVER_RESOURCE,
+                    "remove_wmslayer": GEOSERVER_RESOURCE,
+                    "remove_wmsstore": GEOSERVER_RESOURCE
+}
+
@@ -0,0 +1,140 @@
+"""
+Record the duration and the data size of the executed sync tasks, and estimate the cost of the sync tasks from the history.
+
+The history is saved in the file ".task_history.json" in SYNC_STATUS_PATH, the structure is
+    {
+        task_type:{
+            "jobs":{job_file:[duration,size,time]}, #the duration, data size and time of the last execution of the task for the job
+            "job_types":{job_type:[duration,count]},  #the total duration and the number of the executions of the task for the job type
+            "rate":[duration,size]                    #the total duration and the total data size of the executions with a data size
+        }
+    }
+Only the duration of the data bound tasks(DATA_TASK_TYPES) is scaled by the data size.
+The last execution of a removed job, or of a job not executed in TASK_HISTORY_EXPIRE_DAYS days, is removed from the history.
+"""
+import os
+import json
+import time
+import logging
+import threading
+import traceback
+
+from slave_sync_env import SYNC_STATUS_PATH
+
+logger = logging.getLogger(__name__)
+
+#the estimated duration(seconds) of a task without any history
+DEFAULT_TASK_DURATION = 1
+#the task types whose duration is proportional to the data size
+DATA_TASK_TYPES = ("restore_table","load_table_dumpfile")
+#the last execution of a job is removed from the history if the job is not executed in the days
+TASK_HISTORY_EXPIRE_DAYS = 30
+
+def data_size(sync_job):
+    """
+    Return the size of the data file of the job; return None if not available
+    """
+    data = sync_job.get('data') or {}
+    if data.get('size'):
+        return data['size']
+    try:
+        if data.get('local_file') and os.path.isfile(data['local_file']):
+            return os.path.getsize(data['local_file'])
+    except:
+        pass
+    return None
+
+class TaskHistory(object):
+    """
+    The execution history of the sync tasks
+    """
+    _history_file = os.path.join(SYNC_STATUS_PATH,".task_history.json")
+    _history = None
+    _modified = False
+    _lock = threading.Lock()
+
+    @classmethod
+    def _load(cls):
+        if cls._history is None:
+            cls._history = {}
+            if os.path.isfile(cls._history_file):
+                try:
+                    with open(cls._history_file,'r') as f:
+                        cls._history = json.loads(f.read() or "{}")
+                except:
+                    logger.error("Failed to load task history from file ({0}). {1}".format(cls._history_file,traceback.format_exc()))
+        return cls._history
+
+    @classmethod
+    def record(cls,task_type,sync_jobs,duration):
+        """
+        Record the duration of a task executed for the jobs; the duration is shared by the jobs equally
+        """
+        if not sync_jobs:
+            return
+        duration = float(duration) / len(sync_jobs)
+        with cls._lock:
+            all_history = cls._load()
+            history = all_history.setdefault(task_type,{"jobs":{},"job_types":{},"rate":[0,0]})
+            for sync_job in sync_jobs:
+                size = data_size(sync_job) if task_type in DATA_TASK_TYPES else None
+                if sync_job.get("action") == "remove":
+                    #the job is removed, its last executions are not required any more
+                    for h in all_history.itervalues():
+                        h["jobs"].pop(sync_job["job_file"],None)
+                else:
+                    history["jobs"][sync_job["job_file"]] = [duration,size,time.time()]
+                job_type = history["job_types"].setdefault(sync_job.get("job_type") or "",[0,0])
+                job_type[0] += duration
+                job_type[1] += 1
+                if size:
+                    history["rate"][0] += duration
+                    history["rate"][1] += size
+            cls._modified = True
+
+    @classmethod
+    def estimate(cls,task_type,sync_job):
+        """
+        Return the estimated (duration,data size) of the task for the job
+        """
+        with cls._lock:
+            history = cls._load().get(task_type)
+        size = data_size(sync_job)
+        if not history:
+            return (DEFAULT_TASK_DURATION,size)
+
+        last = history["jobs"].get(sync_job["job_file"])
+        if task_type in DATA_TASK_TYPES:
+            if last and size and last[1]:
+                #the job was executed before, scale the last duration with the data size
+                return (last[0] * size / last[1],size)
+            elif size and history["rate"][1]:
+                return (history["rate"][0] * size / history["rate"][1],size)
+        if last:
+            return (last[0],size)
+
+        job_type = history["job_types"].get(sync_job.get("job_type") or "")
+        if job_type and job_type[1]:
+            return (job_type[0] / job_type[1],size)
+        return (DEFAULT_TASK_DURATION,size)
+
+    @classmethod
+    def save(cls):
+        """
+        Save the history into file if modified; the expired executions are removed.
+        The history is written into a temporary file and then renamed, so a half-written history file is never left.
+        """
+        with cls._lock:
+            if not cls._modified:
+                return
+            expired = time.time() - TASK_HISTORY_EXPIRE_DAYS * 86400
+            for history in cls._history.itervalues():
+                for job_file in [k for k,v in history["jobs"].iteritems() if len(v) < 3 or v[2] < expired]:
+                    del history["jobs"][job_file]
+            tmp_file = "{}.{}".format(cls._history_file,os.getpid())
+            with open(tmp_file,'w') as f:
+                f.write(json.dumps(cls._history))
+                f.flush()
+                os.fsync(f.fileno())
+            os.rename(tmp_file,cls._history_file)
+            cls._modified = False
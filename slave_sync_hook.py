@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+"""
+The hg hook to synchronize the pulled changes.
+
+Hand the changeset to the sync daemon (slave_sync_daemon.py) if it is running; otherwise run slave_sync.py in this process.
+With "--queue", add the changeset into the durable queue (slave_sync_queue.py) and return at once; the queue is drained by the executor.
+Before that, the changed files are pre-checked; if no file is in a listened channel, in a folder of the non channel jobs or in the root folder,
+the hook returns at once.
+Only the standard library is imported, so the hook starts quickly.
+The hook is not started by honcho, the settings in ".env" in the code folder are loaded by the hook itself,
+so the hook and the sync executed by the hook see the same settings as the daemon.
+"""
+import os
+import sys
+import glob
+import json
+import socket
+import subprocess
+
+CODE_PATH = os.path.dirname(os.path.realpath(__file__))
+ENV_FILE = os.path.join(CODE_PATH,".env")
+
+def load_env_file(path=ENV_FILE):
+    """
+    Load the settings in the env file into the environment, as "honcho -e" does
+    """
+    if not os.path.exists(path):
+        return
+    with open(path,"r") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#") or "=" not in line:
+                continue
+            if line.startswith("export "):
+                line = line[7:].strip()
+            key,value = [s.strip() for s in line.split("=",1)]
+            if len(value) >= 2 and value[0] == value[-1] and value[0] in ("'",'"'):
+                value = value[1:-1]
+            os.environ[key] = value
+
+load_env_file()
+
+STATE_PATH = os.environ.get("STATE_REPOSITORY_ROOT",os.path.split(CODE_PATH)[0])
+SYNC_DAEMON_SOCKET = os.environ.get("SYNC_DAEMON_SOCKET",os.path.join(CODE_PATH,".sync_daemon.sock"))
+SYNC_FOLDERS_FILE = os.path.join(CODE_PATH,".sync_folders.json")
+
+def changed_files(hg_node):
+    """
+    Return the files changed between hg_node and the current tip
+    """
+    hg = os.environ.get("HG","hg")
+    files = set()
+    for args in (["--change",hg_node],["--rev","{}:".format(hg_node)]):
+        output = subprocess.check_output([hg,"--cwd",STATE_PATH,"status","--no-status","--print0"] + args)
+        files.update([f for f in output.split("\0") if f])
+    return files
+
+def need_sync(hg_node):
+    """
+    Return False if no changed file can be synchronized by this slave; return True if some file may be synchronized or the check is not available
+    """
+    try:
+        #the sync folders are saved when the sync tasks are loaded, ignore it if the code or the settings are changed after that
+        modified_time = max([os.path.getmtime(f) for f in glob.glob(os.path.join(CODE_PATH,"*.py")) + [ENV_FILE] if os.path.exists(f)] or [0])
+        if not os.path.exists(SYNC_FOLDERS_FILE) or os.path.getmtime(SYNC_FOLDERS_FILE) < modified_time:
+            return True
+        with open(SYNC_FOLDERS_FILE,"r") as f:
+            sync_folders = json.loads(f.read())
+        if sync_folders.get("listen_channels") != os.environ.get("LISTEN_CHANNELS","kmi"):
+            #the listened channels are changed
+            return True
+        folders = set(sync_folders["channels"] + sync_folders["folders"])
+
+        for file_name in changed_files(hg_node):
+            segments = file_name.split("/",1)
+            if len(segments) == 1 or segments[0] in folders:
+                return True
+        return False
+    except:
+        return True
+
+def run_in_daemon():
+    """
+    Return the exit code of the sync executed in the daemon; return None if the daemon is not available
+    """
+    if not os.path.exists(SYNC_DAEMON_SOCKET):
+        return None
+    client = socket.socket(socket.AF_UNIX,socket.SOCK_STREAM)
+    try:
+        client.connect(SYNC_DAEMON_SOCKET)
+        client.sendall(json.dumps({"HG_NODE":os.environ.get("HG_NODE"),"HG_PENDING":os.environ.get("HG_PENDING")}) + "\n")
+        response = client.makefile("r").readline()
+    except socket.error:
+        return None
+    finally:
+        client.close()
+
+    try:
+        response = json.loads(response)
+    except:
+        #the daemon is terminated during the sync
+        sys.stderr.write("The sync daemon didn't return a result.\n")
+        return 1
+
+    if response["status"] == "succeed":
+        return 0
+    elif response["status"] == "failed":
+        sys.stderr.write("{}\n".format(response["message"]))
+        return 1
+    else:
+        return None
+
+if __name__ == "__main__":
+    if not need_sync(os.environ.get("HG_NODE") or "0"):
+        #no file in the changeset is synchronized by this slave
+        sys.exit(0)
+
+    if "--queue" in sys.argv[1:]:
+        from slave_sync_queue import SyncQueue
+        queue = SyncQueue()
+        queue.enqueue(os.environ.get("HG_NODE") or "0")
+        queue.close()
+        sys.exit(0)
+
+    result = run_in_daemon()
+    if result is None:
+        #daemon is not available, run the sync in this process; the settings in the env file are already loaded into the environment
+        script = os.path.join(CODE_PATH,"slave_sync.py")
+        os.execv(sys.executable,[sys.executable,script])
+    sys.exit(result)
@@ -11,7 +11,7 @@ from slave_sync_task import (
     update_feature_job,update_feature_metadata_job,remove_feature_job,update_auth_job,update_access_rules_job,
     update_wmsstore_job,update_wmslayer_job,remove_wmslayer_job,remove_wmsstore_job,
     update_layergroup_job,remove_layergroup_job,
-    JOB_DEF_INDEX,JOB_TYPE_INDEX,jobname,
+    JOB_DEF_INDEX,JOB_TYPE_INDEX,TASK_HANDLER_INDEX,jobname,
     empty_gwc_layer_job,empty_gwc_group_job,empty_gwc_feature_job,update_workspace_job,
     update_livelayer_job,remove_livelayer_job,empty_gwc_livelayer_job,update_livestore_job,remove_livestore_job,
 )
@@ -68,8 +68,9 @@ class SlaveServerSyncNotify(object):
             with open(sql_file,'r') as f:
                 for sql in f.read().split(cls._sql_separator):
                     if not sql.strip(): continue
-                    sql_cmd[len(sql_cmd) - 1] = sql
-                    sql_process = subprocess.Popen(sql_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
+                    cmd = list(sql_cmd)
+                    cmd[len(cmd) - 1] = sql
+                    sql_process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
                     sql_output = sql_process.communicate()
                     if sql_output[1] and sql_output[1].strip():
                         logger.info("stderr: {}".format(sql_output[1]))
@@ -111,8 +112,9 @@ $$BEGIN
     END IF;
 END$$;
 """.format(MASTER_PGSQL_SCHEMA,SLAVE_NAME,cls._listen_channels,last_poll_time,"{0} ({1})".format(get_version(),CODE_BRANCH))
-        sql_cmd[len(sql_cmd) - 1] = sql
-        sql_process = subprocess.Popen(sql_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
+        cmd = list(sql_cmd)
+        cmd[len(cmd) - 1] = sql
+        sql_process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
         sql_output = sql_process.communicate()
         if sql_output[1] and sql_output[1].strip():
             logger.info("stderr: {}".format(sql_output[1]))
@@ -125,7 +127,7 @@ END$$;
     def send_last_sync_time(cls,pull_status):
         if feedback_disabled: return
         last_sync_time = now()
-        last_sync_message = str(pull_status).replace("'","''")
+        last_sync_message = pull_status.to_json().replace("'","''")
         sql = """
 DO 
 $$BEGIN
@@ -134,8 +136,9 @@ END$$;
 """.format(MASTER_PGSQL_SCHEMA,SLAVE_NAME,last_sync_time,last_sync_message)
 
         #logger.info("hg pull status notify: \r\n" + sql)
-        sql_cmd[len(sql_cmd) - 1] = sql
-        sql_process = subprocess.Popen(sql_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
+        cmd = list(sql_cmd)
+        cmd[len(cmd) - 1] = sql
+        sql_process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
         sql_output = sql_process.communicate()
         if sql_output[1] and sql_output[1].strip():
             logger.info("stderr: {}".format(sql_output[1]))
@@ -149,23 +152,34 @@ END$$;
             logger.info("Notify feature is disabled.")
             return
         try:
-            sync_succeed = task["status"].is_succeed
-            sync_message = str(task["status"]).replace("'","''")
-
-            sync_time = task["status"].last_process_time or now()
-            if sync_succeed:
-                if remove:
-                    #remove publish succeed.
-                    sql_template = """
+            sql = cls.feature_sync_status_sql(task,remove)
+            if sql:
+                cls._send_sync_status(task,sql)
+        except:
+            logger.error("Update sync status of task ({0}) in master db failed. {1}".format(task['job_file'],traceback.format_exc()))       
+
+    @classmethod
+    def feature_sync_status_sql(cls,task,remove=False):
+        """
+        Return the sql to update the feature's sync status in master db; return None if no need to update
+        """
+        sync_succeed = task["status"].is_succeed
+        sync_message = task["status"].to_json().replace("'","''")
+
+        sync_time = task["status"].last_process_time or now()
+        if sync_succeed:
+            if remove:
+                #remove publish succeed.
+                sql_template = """
 DELETE FROM {0}.monitor_publishsyncstatus AS b
 USING {0}.monitor_slaveserver AS a
 WHERE a.id = b.slave_server_id
   AND a.name = '{1}'
   AND b.publish = '{2}'
 """
-                else:
-                    #update publish succeed
-                    sql_template = """
+            else:
+                #update publish succeed
+                sql_template = """
 DO 
 $$BEGIN
     IF EXISTS (SELECT 1 FROM {0}.monitor_slaveserver a JOIN {0}.monitor_publishsyncstatus b ON a.id=b.slave_server_id WHERE a.name='{1}' AND b.publish='{2}') THEN
@@ -181,8 +195,8 @@ $$BEGIN
     END IF;
 END$$;
 """
-            elif not remove:
-                sql_template = """
+        elif not remove:
+            sql_template = """
 DO 
 $$BEGIN
     IF EXISTS (SELECT 1 FROM {0}.monitor_slaveserver a JOIN {0}.monitor_publishsyncstatus b ON a.id=b.slave_server_id WHERE a.name='{1}' AND b.publish='{2}') THEN
@@ -198,28 +212,15 @@ $$BEGIN
     END IF;
 END$$;
 """
-            else:
-                return
-
-            
-            preview_file = task["status"].get_task_status("get_layer_preview").get_message("preview_file") or None
-            preview_file = "'{}'".format(preview_file) if preview_file else "null"
-
-            sql = sql_template.format(MASTER_PGSQL_SCHEMA, SLAVE_NAME,task['name'], task.get("job_id"), task.get("job_batch_id"), sync_message, "'{0}'".format(sync_time) if sync_time else 'null',preview_file,task.get('spatial_type',''))
+        else:
+            return None
 
-            #logger.info("Feature sync status notify: \r\n" + sql)
-            sql_cmd[len(sql_cmd) - 1] = sql
-            sql_process = subprocess.Popen(sql_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
-            sql_output = sql_process.communicate()
-            if sql_output[1] and sql_output[1].strip():
-                logger.info("stderr: {}".format(sql_output[1]))
-
-            if sql_process.returncode != 0 and sql_output[1].find("ERROR") >= 0:
-                cls._save_failed_sql(sql)
-                logger.error("Update sync status of task ({0}) in master db failed with return code ({1})".format(task['job_file'],sql_process.returncode))       
-        except:
-            logger.error("Update sync status of task ({0}) in master db failed. {1}".format(task['job_file'],traceback.format_exc()))       
+        
+        preview_file = task["status"].get_task_status("get_layer_preview").get_message("preview_file") or None
+        preview_file = "'{}'".format(preview_file) if preview_file else "null"
 
+        #logger.info("Feature sync status notify: \r\n" + sql)
+        return sql_template.format(MASTER_PGSQL_SCHEMA, SLAVE_NAME,task['name'], task.get("job_id"), task.get("job_batch_id"), sync_message, "'{0}'".format(sync_time) if sync_time else 'null',preview_file,task.get('spatial_type',''))
 
     @classmethod
     def send_job_sync_status(cls,task,task_metadata):
@@ -227,16 +228,25 @@ END$$;
             logger.info("Notify feature is disabled.")
             return
         try:
-            task_type = task_metadata[JOB_DEF_INDEX][JOB_TYPE_INDEX]
-            task_name = jobname(task,task_metadata)
-            action = task["action"]
-            sync_succeed = task["status"].is_succeed
-            sync_message = str(task["status"]).replace("'","''")
+            cls._send_sync_status(task,cls.job_sync_status_sql(task,task_metadata))
+        except:
+            logger.error("Update sync status of task ({0}) in master db failed. {1}".format(task['job_file'],traceback.format_exc()))       
 
-            sync_time = task["status"].last_process_time
+    @classmethod
+    def job_sync_status_sql(cls,task,task_metadata):
+        """
+        Return the sql to update the job's sync status in master db
+        """
+        task_type = task_metadata[JOB_DEF_INDEX][JOB_TYPE_INDEX]
+        task_name = jobname(task,task_metadata)
+        action = task["action"]
+        sync_succeed = task["status"].is_succeed
+        sync_message = task["status"].to_json().replace("'","''")
 
-            #update publish succeed
-            sql_template = """
+        sync_time = task["status"].last_process_time
+
+        #update publish succeed
+        sql_template = """
 DO 
 $$BEGIN
     IF EXISTS (SELECT 1 FROM {0}.monitor_slaveserver a JOIN {0}.monitor_tasksyncstatus b ON a.id=b.slave_server_id WHERE a.name='{1}' AND b.task_type='{2}' AND b.task_name='{3}' AND b.action='{4}') THEN
@@ -252,24 +262,54 @@ $$BEGIN
     END IF;
 END$$;
 """
-            preview_file = task["status"].get_task_status("get_layer_preview").get_message("preview_file") or None
-            preview_file = "'{}'".format(preview_file) if preview_file else "null"
+        preview_file = task["status"].get_task_status("get_layer_preview").get_message("preview_file") or None
+        preview_file = "'{}'".format(preview_file) if preview_file else "null"
 
-            sql = sql_template.format(MASTER_PGSQL_SCHEMA, SLAVE_NAME,task_type,task_name,action,sync_succeed, sync_message, "'{0}'".format(sync_time) if sync_time else 'null',preview_file)
+        #logger.info("Notify: \r\n" + sql)
+        return sql_template.format(MASTER_PGSQL_SCHEMA, SLAVE_NAME,task_type,task_name,action,sync_succeed, sync_message, "'{0}'".format(sync_time) if sync_time else 'null',preview_file)
 
-            #logger.info("Notify: \r\n" + sql)
+    @classmethod
+    def _send_sync_status(cls,task,sql):
+        """
+        Execute the sql to update the sync status of a task in master db; save the sql for executing later if failed
+        """
+        cmd = list(sql_cmd)
+        cmd[len(cmd) - 1] = sql
+        sql_process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
+        sql_output = sql_process.communicate()
+        if sql_output[1] and sql_output[1].strip():
+            logger.info("stderr: {}".format(sql_output[1]))
 
-            sql_cmd[len(sql_cmd) - 1] = sql
-            sql_process = subprocess.Popen(sql_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
-            sql_output = sql_process.communicate()
-            if sql_output[1] and sql_output[1].strip():
-                logger.info("stderr: {}".format(sql_output[1]))
+        if sql_process.returncode != 0 and sql_output[1].find("ERROR") >= 0:
+            cls._save_failed_sql(sql)
+            logger.error("Update sync status of task ({0}) in master db failed with return code ({1})".format(task['job_file'],sql_process.returncode))       
 
-            if sql_process.returncode != 0 and sql_output[1].find("ERROR") >= 0:
-                cls._save_failed_sql(sql)
-                logger.error("Update sync status of task ({0}) in master db failed with return code ({1})".format(task['job_file'],sql_process.returncode))       
-        except:
-            logger.error("Update sync status of task ({0}) in master db failed. {1}".format(task['job_file'],traceback.format_exc()))       
+    @classmethod
+    def send_sync_status_batch(cls,tasks):
+        """
+        Update the sync status of a batch of tasks in master db in one transaction
+        tasks: a list of (task,sql)
+        If the transaction failed, update the sync status of the tasks one by one.
+        """
+        if feedback_disabled: 
+            logger.info("Notify feature is disabled.")
+            return
+        tasks = [t for t in tasks if t[1]]
+        if not tasks:
+            return
+        cmd = sql_cmd[:-2] + ["-1","-v","ON_ERROR_STOP=1","-f","-"]
+        sql_process = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
+        sql_output = sql_process.communicate(";\n".join([t[1] for t in tasks]))
+        if sql_output[1] and sql_output[1].strip():
+            logger.info("stderr: {}".format(sql_output[1]))
+
+        if sql_process.returncode != 0 or sql_output[1].find("ERROR") >= 0:
+            logger.error("Update sync status of {0} tasks in master db failed with return code ({1}), try to update them one by one".format(len(tasks),sql_process.returncode))
+            for task,sql in tasks:
+                try:
+                    cls._send_sync_status(task,sql)
+                except:
+                    logger.error("Update sync status of task ({0}) in master db failed. {1}".format(task['job_file'],traceback.format_exc()))       
 
 task_name = lambda task: "{0}:{1}".format(task["workspace"],task["name"])
 
@@ -282,33 +322,50 @@ def send_remove_feature_notify(sync_job,task_metadata):
     
 def send_job_notify(sync_job,task_metadata):
     SlaveServerSyncNotify.send_job_sync_status(sync_job,task_metadata)
+
+def send_notify_batch(tasks):
+    """
+    Send the notify of a batch of jobs in one transaction
+    """
+    notify_sqls = {
+        send_update_feature_notify: lambda sync_job,task_metadata: SlaveServerSyncNotify.feature_sync_status_sql(sync_job,False),
+        send_remove_feature_notify: lambda sync_job,task_metadata: SlaveServerSyncNotify.feature_sync_status_sql(sync_job,True),
+        send_job_notify: SlaveServerSyncNotify.job_sync_status_sql
+    }
+    batch = []
+    for sync_job,task_metadata,task_status in tasks:
+        try:
+            batch.append((sync_job,notify_sqls[task_metadata[TASK_HANDLER_INDEX]](sync_job,task_metadata)))
+        except:
+            logger.error("Update sync status of task ({0}) in master db failed. {1}".format(sync_job['job_file'],traceback.format_exc()))       
+    SlaveServerSyncNotify.send_sync_status_batch(batch)
     
 tasks_metadata = [
-                    ("send_notify", update_feature_job, None, task_name, send_update_feature_notify),
-                    ("send_notify", remove_feature_job, None, task_name, send_remove_feature_notify),
-
-
-                    ("send_notify", update_feature_metadata_job   , None, task_name,send_job_notify),
-                    ("send_notify", update_auth_job   , None, "update_roles",send_job_notify),
-                    ("send_notify", update_access_rules_job, None, "update_access_rules", send_job_notify),
-                    ("send_notify", update_wmsstore_job,None, task_name, send_job_notify),
-                    ("send_notify", update_wmslayer_job,None, task_name, send_job_notify),
-                    ("send_notify", remove_wmslayer_job, None, task_name, send_job_notify),
-                    ("send_notify", remove_wmsstore_job, None, task_name, send_job_notify),
-                    ("send_notify", remove_wmslayer_job, None, task_name, send_job_notify),
-                    ("send_notify", empty_gwc_layer_job  , None, task_name, send_job_notify),
-                    ("send_notify", empty_gwc_group_job  , None, task_name, send_job_notify),
-                    ("send_notify", empty_gwc_feature_job  , None, task_name, send_job_notify),
-
-                    ("send_notify", update_layergroup_job, None, task_name, send_job_notify),
-                    ("send_notify", remove_layergroup_job, None, task_name, send_job_notify),
-
-                    ("send_notify", update_workspace_job, None, lambda task: task["schema"], send_job_notify),
-
-                    ("send_notify", update_livelayer_job,None, task_name, send_job_notify),
-                    ("send_notify", remove_livelayer_job, None, task_name, send_job_notify),
-                    ("send_notify", update_livestore_job, None, task_name, send_job_notify),
-                    ("send_notify", remove_livestore_job, None, task_name, send_job_notify),
-                    ("send_notify", empty_gwc_livelayer_job, None, task_name, send_job_notify),
+                    ("send_notify", update_feature_job, None, task_name, send_update_feature_notify, send_notify_batch),
+                    ("send_notify", remove_feature_job, None, task_name, send_remove_feature_notify, send_notify_batch),
+
+
+                    ("send_notify", update_feature_metadata_job   , None, task_name,send_job_notify, send_notify_batch),
+                    ("send_notify", update_auth_job   , None, "update_roles",send_job_notify, send_notify_batch),
+                    ("send_notify", update_access_rules_job, None, "update_access_rules", send_job_notify, send_notify_batch),
+                    ("send_notify", update_wmsstore_job,None, task_name, send_job_notify, send_notify_batch),
+                    ("send_notify", update_wmslayer_job,None, task_name, send_job_notify, send_notify_batch),
+                    ("send_notify", remove_wmslayer_job, None, task_name, send_job_notify, send_notify_batch),
+                    ("send_notify", remove_wmsstore_job, None, task_name, send_job_notify, send_notify_batch),
+                    ("send_notify", remove_wmslayer_job, None, task_name, send_job_notify, send_notify_batch),
+                    ("send_notify", empty_gwc_layer_job  , None, task_name, send_job_notify, send_notify_batch),
+                    ("send_notify", empty_gwc_group_job  , None, task_name, send_job_notify, send_notify_batch),
+                    ("send_notify", empty_gwc_feature_job  , None, task_name, send_job_notify, send_notify_batch),
+
+                    ("send_notify", update_layergroup_job, None, task_name, send_job_notify, send_notify_batch),
+                    ("send_notify", remove_layergroup_job, None, task_name, send_job_notify, send_notify_batch),
+
+                    ("send_notify", update_workspace_job, None, lambda task: task["schema"], send_job_notify, send_notify_batch),
+
+                    ("send_notify", update_livelayer_job,None, task_name, send_job_notify, send_notify_batch),
+                    ("send_notify", remove_livelayer_job, None, task_name, send_job_notify, send_notify_batch),
+                    ("send_notify", update_livestore_job, None, task_name, send_job_notify, send_notify_batch),
+                    ("send_notify", remove_livestore_job, None, task_name, send_job_notify, send_notify_batch),
+                    ("send_notify", empty_gwc_livelayer_job, None, task_name, send_job_notify, send_notify_batch),
 ]
 
@@ -0,0 +1,107 @@
+"""
+A persistent cache of the planning result of the job files, saved in the sqlite database ".plan_cache.db" in SYNC_STATUS_PATH.
+
+The cache key is the hg file node of the job file, the change type(update or remove), and a fingerprint of the code and the settings;
+the cached value is the parsed job (with the meta data), the md5 of the job file and the sequences of the matched task metadata in the dispatch index.
+A job file with the same file node has the same content, so the cached job can be used without reading, parsing and classifying the job file again.
+"""
+import os
+import glob
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import traceback
+
+from slave_sync_env import CODE_PATH,SYNC_STATUS_PATH
+
+logger = logging.getLogger(__name__)
+
+PLAN_CACHE_ENABLED = os.environ.get("PLAN_CACHE","true").lower() in ["true","yes","on"]
+#the cached entries not used in the days are removed
+PLAN_CACHE_EXPIRE_DAYS = 30
+
+def fingerprint():
+    """
+    Return the fingerprint of the code and the settings; the planning result depends on both.
+    """
+    m = hashlib.md5()
+    for f in sorted(glob.glob(os.path.join(CODE_PATH,"*.py"))):
+        with open(f,"rb") as code_file:
+            m.update(code_file.read())
+    for k,v in sorted(os.environ.iteritems()):
+        if k.startswith("HG_"):
+            #hg hook variables are changed in each pull
+            continue
+        m.update(k)
+        m.update(v)
+    return m.hexdigest()
+
+class PlanCache(object):
+    """
+    The cache of the planning result of the job files
+    """
+    _fingerprint = None
+
+    def __init__(self,path=os.path.join(SYNC_STATUS_PATH,".plan_cache.db"),read_only=False):
+        """
+        read_only: only read the cached entries, nothing is written into the cache
+        """
+        if PlanCache._fingerprint is None:
+            PlanCache._fingerprint = fingerprint()
+        self._read_only = read_only
+        self._puts = []
+        if read_only and not os.path.exists(path):
+            self._conn = None
+            return
+        self._conn = sqlite3.connect(path,timeout=60)
+        if not read_only:
+            self._conn.execute("CREATE TABLE IF NOT EXISTS plan_cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, used REAL NOT NULL)")
+            self._conn.commit()
+
+    def key(self,file_node,action):
+        return hashlib.md5("{}:{}:{}".format(file_node,action,PlanCache._fingerprint)).hexdigest()
+
+    def get_all(self,keys):
+        """
+        Return a dict of key to the cached value (job,md5,matches) for the cached keys
+        """
+        result = {}
+        if not self._conn:
+            return result
+        keys = list(keys)
+        for i in range(0,len(keys),500):
+            batch = keys[i:i + 500]
+            for key,value in self._conn.execute("SELECT key,value FROM plan_cache WHERE key IN ({})".format(",".join(["?"] * len(batch))),batch):
+                try:
+                    value = json.loads(value)
+                    result[key] = (value["job"],value["md5"],value["matches"])
+                except:
+                    logger.error("Invalid plan cache entry. {}".format(traceback.format_exc()))
+        if result and not self._read_only:
+            with self._conn:
+                self._conn.executemany("UPDATE plan_cache SET used = ? WHERE key = ?",[(time.time(),key) for key in result.iterkeys()])
+        return result
+
+    def put(self,key,job,md5,matches):
+        """
+        Add the planning result of a job file; saved when the cache is closed.
+        """
+        if self._read_only:
+            return
+        self._puts.append((key,json.dumps({"job":job,"md5":md5,"matches":matches}),time.time()))
+
+    def close(self):
+        if not self._conn:
+            return
+        if self._read_only:
+            self._conn.close()
+            return
+        try:
+            with self._conn:
+                self._conn.executemany("INSERT OR REPLACE INTO plan_cache (key,value,used) VALUES (?,?,?)",self._puts)
+                self._conn.execute("DELETE FROM plan_cache WHERE used < ?",(time.time() - PLAN_CACHE_EXPIRE_DAYS * 86400,))
+        finally:
+            self._puts = []
+            self._conn.close()
@@ -1,18 +1,24 @@
 import logging
 import os
+import sys
+import hashlib
+import time
 import tempfile
+import threading
 import subprocess
 import traceback
 
 from slave_sync_env import (
     GEOSERVER_PGSQL_HOST,GEOSERVER_PGSQL_PORT,GEOSERVER_PGSQL_DATABASE,GEOSERVER_PGSQL_USERNAME,
-    CACHE_PATH,SHARE_LAYER_DATA,
+    CACHE_PATH,SHARE_LAYER_DATA,STREAMING_RESTORE,
     env
 )
 from slave_sync_task import (
-    update_auth_job,update_feature_job,db_feature_task_filter,foreignkey_task_filter,remove_feature_job,update_workspace_job
+    update_auth_job,update_feature_job,db_feature_task_filter,foreignkey_task_filter,remove_feature_job,update_workspace_job,
+    DB_RESOURCE
 )
-from slave_sync_file import delete_table_dumpfile,load_table_dumpfile
+from slave_sync_file import delete_table_dumpfile,load_table_dumpfile,table_dumpfile,DumpCache,TransferManager
+from slave_sync_ssh import SSHPool
 
 logger = logging.getLogger(__name__)
 
@@ -22,15 +28,16 @@ table_name = lambda sync_job: "{0}:{1}".format(sync_job["schema"],sync_job["name
 psql_cmd = ["psql","-h",GEOSERVER_PGSQL_HOST,"-p",GEOSERVER_PGSQL_PORT,"-d",GEOSERVER_PGSQL_DATABASE,"-U",GEOSERVER_PGSQL_USERNAME,"-w","-c",None]
 
 def update_auth(sync_job,task_metadata,task_status):
+    cmd = list(psql_cmd)
     with tempfile.NamedTemporaryFile(mode="w+b", suffix=".sql") as sql_file:
         sql_file.file.write(sync_job['job_file_content'])
         sql_file.file.close()
         
-        psql_cmd[len(psql_cmd) - 2] = "-f"
-        psql_cmd[len(psql_cmd) - 1] = sql_file.name
+        cmd[len(cmd) - 2] = "-f"
+        cmd[len(cmd) - 1] = sql_file.name
 
-        logger.info("Executing {}...".format(repr(psql_cmd)))
-        psql = subprocess.Popen(psql_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
+        logger.info("Executing {}...".format(repr(cmd)))
+        psql = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
         psql_output = psql.communicate()
         if psql_output[1] and psql_output[1].strip():
             logger.info("stderr: {}".format(psql_output[1]))
@@ -40,10 +47,11 @@ def update_auth(sync_job,task_metadata,task_status):
 
 
 def create_postgis_extension(sync_job,task_metadata,task_status):
-    psql_cmd[len(psql_cmd) - 2] = "-c"
-    psql_cmd[len(psql_cmd) - 1] = "CREATE EXTENSION IF NOT EXISTS postgis;"
+    cmd = list(psql_cmd)
+    cmd[len(cmd) - 2] = "-c"
+    cmd[len(cmd) - 1] = "CREATE EXTENSION IF NOT EXISTS postgis;"
     
-    psql = subprocess.Popen(psql_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
+    psql = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
     psql_output = psql.communicate()
     if psql_output[1] and psql_output[1].strip():
         logger.info("stderr: {}".format(psql_output[1]))
@@ -95,11 +103,12 @@ ALTER DEFAULT PRIVILEGES IN SCHEMA "{1}" GRANT SELECT ON TABLES TO "{1}";
 END$$;
 """
 def create_schema(sync_job,task_metadata,task_status):
+    cmd = list(psql_cmd)
     #create schema
-    psql_cmd[len(psql_cmd) - 2] = "-c"
-    psql_cmd[len(psql_cmd) - 1] = ";".join(["CREATE SCHEMA IF NOT EXISTS \"{0}\"".format(s) for s in [sync_job["schema"],sync_job["data_schema"],sync_job["outdated_schema"]] if s])
+    cmd[len(cmd) - 2] = "-c"
+    cmd[len(cmd) - 1] = ";".join(["CREATE SCHEMA IF NOT EXISTS \"{0}\"".format(s) for s in [sync_job["schema"],sync_job["data_schema"],sync_job["outdated_schema"]] if s])
     
-    psql = subprocess.Popen(psql_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
+    psql = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
     psql_output = psql.communicate()
     if psql_output[1] and psql_output[1].strip():
         logger.info("stderr: {}".format(psql_output[1]))
@@ -118,10 +127,10 @@ def create_schema(sync_job,task_metadata,task_status):
 
     if create_role_sql:
         #need authorization, create or alter a role
-        psql_cmd[len(psql_cmd) - 2] = "-c"
-        psql_cmd[len(psql_cmd) - 1] = create_role_sql.format(GEOSERVER_PGSQL_DATABASE,sync_job["schema"],"sso_access",GEOSERVER_PGSQL_USERNAME)
+        cmd[len(cmd) - 2] = "-c"
+        cmd[len(cmd) - 1] = create_role_sql.format(GEOSERVER_PGSQL_DATABASE,sync_job["schema"],"sso_access",GEOSERVER_PGSQL_USERNAME)
 
-        psql = subprocess.Popen(psql_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
+        psql = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
         psql_output = psql.communicate()
         if psql_output[1] and psql_output[1].strip():
             logger.info("stderr: {}".format(psql_output[1]))
@@ -131,6 +140,34 @@ def create_schema(sync_job,task_metadata,task_status):
             raise Exception("Failed to create role. {0}:{1}".format(psql.returncode,task_status.get_message("message")))
     
 
+def create_schema_batch(tasks):
+    """
+    Create the schemas and roles of a batch of jobs in one transaction
+    If the transaction failed, create the schemas and roles job by job
+    """
+    sqls = []
+    for sync_job,task_metadata,task_status in tasks:
+        sqls.append(";".join(["CREATE SCHEMA IF NOT EXISTS \"{0}\"".format(s) for s in [sync_job["schema"],sync_job["data_schema"],sync_job["outdated_schema"]] if s]))
+        create_role_sql = CREATE_RESTRICTED_ROLE if sync_job.get('auth_level',1) == 2 else CREATE_SSO_ROLE
+        sqls.append(create_role_sql.format(GEOSERVER_PGSQL_DATABASE,sync_job["schema"],"sso_access",GEOSERVER_PGSQL_USERNAME))
+
+    cmd = psql_cmd[:-2] + ["-1","-v","ON_ERROR_STOP=1","-f","-"]
+    psql = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
+    psql_output = psql.communicate(";\n".join(sqls))
+    if psql_output[1] and psql_output[1].strip():
+        logger.info("stderr: {}".format(psql_output[1]))
+
+    if psql.returncode == 0 and psql_output[1].find("ERROR") < 0:
+        return
+
+    logger.error("Failed to create {0} schemas in one transaction, try to create them one by one. {1}:{2}".format(len(tasks),psql.returncode,psql_output[1]))
+    for sync_job,task_metadata,task_status in tasks:
+        try:
+            create_schema(sync_job,task_metadata,task_status)
+        except:
+            task_status.failed()
+            task_status.set_message("message",traceback.format_exc())
+
 def move_outdated_table(sync_job,task_metadata,task_status):
 
     #move table to outdated schema
@@ -139,8 +176,9 @@ def move_outdated_table(sync_job,task_metadata,task_status):
     #3.if view  does not exist, drop the outdated table, and move the data table to outdated schema
     #4.if view does not depend on the outdated schema, drop the outdated table and move the data table to outdated schema
     #5.if view depends on the outdated schema, drop the data table
-    psql_cmd[len(psql_cmd) - 2] = "-c"
-    psql_cmd[len(psql_cmd) -1] = """
+    cmd = list(psql_cmd)
+    cmd[len(cmd) - 2] = "-c"
+    cmd[len(cmd) -1] = """
 DO 
 $$BEGIN
     IF EXISTS (SELECT 1 FROM pg_class a join pg_namespace b on a.relnamespace = b.oid WHERE a.relname='{1}' and b.nspname='{0}') THEN
@@ -162,8 +200,8 @@ $$BEGIN
     END IF;
 END$$;
 """.format(sync_job["data_schema"],sync_job["name"],sync_job["outdated_schema"],sync_job["schema"])
-    logger.info("Executing {}...".format(repr(psql_cmd)))
-    psql = subprocess.Popen(psql_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
+    logger.info("Executing {}...".format(repr(cmd)))
+    psql = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
     psql_output = psql.communicate()
     if psql_output[1] and psql_output[1].strip():
         logger.info("stderr: {}".format(psql_output[1]))
@@ -174,7 +212,122 @@ END$$;
 
 
 restore_cmd = ["pg_restore", "-w", "-h", GEOSERVER_PGSQL_HOST, "-p" , GEOSERVER_PGSQL_PORT , "-d", GEOSERVER_PGSQL_DATABASE, "-U", GEOSERVER_PGSQL_USERNAME,"-O","-x","--no-tablespaces","-F",None,None]
-def restore_table(sync_job,task_metadata,task_status):
+#the size of the chunk read from the stream of the remote dump file
+STREAM_CHUNK_SIZE = 1024 * 1024
+
+def remote_dumpfile(sync_job):
+    """
+    Return the (host,remote file,md5) of the table dump file if it can be piped into pg_restore; otherwise return None
+    """
+    if not STREAMING_RESTORE or SHARE_LAYER_DATA:
+        return None
+    data_file = table_dumpfile(sync_job)
+    if not data_file or data_file[0].find(":") <= 0 or DumpCache.cached(data_file[2]):
+        #a local file or a cached file
+        return None
+    host,remote_file = data_file[0].split(":",1)
+    return (host,remote_file,data_file[2])
+
+def stream_restore(dump_format,dumpfile,task_status):
+    """
+    Pipe the remote dump file into pg_restore, the md5 of the stream is computed while piping.
+    pg_restore converts the dump into sql, which is executed by psql in one explicit transaction;
+    the transaction is committed only after the whole file is read and the md5 is verified,
+    psql is killed without committing if the md5 doesn't match or some command failed, so the restore is rolled back.
+    The stream takes the transfer slots of the host like the other transfers, and is throttled to the bandwidth limit of the transfer.
+    Return the output of pg_restore and psql
+    """
+    host,remote_file,md5 = dumpfile
+    with TransferManager.slot("{}:{}".format(host,remote_file)) as bwlimit:
+        return _stream_restore(dump_format,host,remote_file,md5,bwlimit,task_status)
+
+def _stream_restore(dump_format,host,remote_file,md5,bwlimit,task_status):
+    cmd = ["pg_restore","-O","-x","--no-tablespaces","-F",dump_format,"-f","-"]
+    sql_cmd = psql_cmd[:-2] + ["-q","-v","ON_ERROR_STOP=1"]
+    cat_cmd = SSHPool.ssh_cmd(host) + [host,"cat",remote_file]
+    logger.info("Executing {} | {} | {}...".format(repr(cat_cmd),repr(cmd),repr(sql_cmd)))
+    cat_err = tempfile.TemporaryFile()
+    restore_out = tempfile.TemporaryFile()
+    psql = subprocess.Popen(sql_cmd,stdin=subprocess.PIPE,stdout=restore_out,stderr=subprocess.STDOUT,env=env)
+    restore = subprocess.Popen(cmd,stdin=subprocess.PIPE,stdout=subprocess.PIPE,stderr=restore_out,env=env)
+    cat = subprocess.Popen(cat_cmd,stdout=subprocess.PIPE,stderr=cat_err,env=env)
+    #the error of passing the sql to psql
+    relay_errors = []
+    def _relay():
+        #pass the sql generated by pg_restore to psql; keep reading after psql failed, so pg_restore is not blocked
+        while True:
+            data = restore.stdout.read(STREAM_CHUNK_SIZE)
+            if not data:
+                break
+            if relay_errors:
+                continue
+            try:
+                psql.stdin.write(data)
+            except:
+                relay_errors.append(str(sys.exc_info()[1]))
+
+    relay = threading.Thread(target=_relay,name="stream-restore")
+    relay.daemon = True
+    try:
+        psql.stdin.write("BEGIN;\n")
+        relay.start()
+        m = hashlib.md5()
+        chunk_size = min(STREAM_CHUNK_SIZE,bwlimit * 1024) if bwlimit else STREAM_CHUNK_SIZE
+        started = time.time()
+        size = 0
+        while True:
+            chunk = cat.stdout.read(chunk_size)
+            if not chunk:
+                break
+            m.update(chunk)
+            restore.stdin.write(chunk)
+            if bwlimit:
+                #wait until the average rate is not greater than the bandwidth limit
+                size += len(chunk)
+                delay = size / (bwlimit * 1024.0) - (time.time() - started)
+                if delay > 0:
+                    time.sleep(delay)
+        cat.wait()
+        if cat.returncode != 0:
+            cat_err.seek(0)
+            raise Exception("Failed to read the remote file '{}:{}'. {}:{}".format(host,remote_file,cat.returncode,cat_err.read()))
+        if md5 and m.hexdigest() != md5:
+            raise Exception("md5sum checks failed.Expected md5 is {0}; but file's md5 is {1}".format(md5,m.hexdigest()))
+        restore.stdin.close()
+        restore.wait()
+        relay.join()
+        if restore.returncode != 0:
+            raise Exception("pg_restore failed with exit code {}".format(restore.returncode))
+        if relay_errors:
+            raise Exception("Failed to execute the sql generated by pg_restore. {}".format(relay_errors[0]))
+        #the whole file is verified and restored, commit the transaction
+        psql.stdin.write("COMMIT;\n")
+        psql.stdin.close()
+        psql.wait()
+        if psql.returncode != 0:
+            raise Exception("psql failed with exit code {}".format(psql.returncode))
+    except:
+        exc_info = sys.exc_info()
+        #kill psql first, the transaction is rolled back without the commit
+        for p in (psql,restore,cat):
+            if p.poll() is None:
+                p.kill()
+                p.wait()
+        restore_out.seek(0)
+        output = restore_out.read()
+        restore_out.close()
+        if output and output.strip():
+            task_status.set_message("message",output)
+        raise exc_info[0],exc_info[1],exc_info[2]
+    finally:
+        cat_err.close()
+
+    restore_out.seek(0)
+    output = restore_out.read()
+    restore_out.close()
+    return output
+
+def _load_table_dumpfile(sync_job,task_status):
     if not SHARE_LAYER_DATA and task_status.is_stage_not_succeed('load_table_dumpfile'):
         try:
             load_table_dumpfile(sync_job)
@@ -186,17 +339,39 @@ def restore_table(sync_job,task_metadata,task_status):
             logger.error(message)
             raise Exception("Failed to download table dump file.")
 
+def restore_table(sync_job,task_metadata,task_status):
+    cmd = list(restore_cmd)
+    #pipe the remote dump file into pg_restore in streaming mode, otherwise download it first
+    dumpfile = remote_dumpfile(sync_job)
+    if not dumpfile:
+        _load_table_dumpfile(sync_job,task_status)
+
     # load PostgreSQL dump into db with pg_restore
     if os.path.splitext(sync_job["data"]["local_file"])[1].lower() == ".db":
-        restore_cmd[len(restore_cmd) - 2] = 'c'
+        cmd[len(cmd) - 2] = 'c'
     elif os.path.splitext(sync_job["data"]["local_file"])[1].lower() == ".tar":
-        restore_cmd[len(restore_cmd) - 2] = 't'
+        cmd[len(cmd) - 2] = 't'
     else:
         raise Exception("Unknown dumped file format({})".format(os.path.split(sync_job["data"]["local_file"])[1]))
 
-    restore_cmd[len(restore_cmd) - 1] = sync_job["data"]["local_file"]
-    logger.info("Executing {}...".format(repr(restore_cmd)))
-    restore = subprocess.Popen(restore_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
+    if dumpfile:
+        try:
+            restore_output = stream_restore(cmd[len(cmd) - 2],dumpfile,task_status)
+            if restore_output and restore_output.strip():
+                logger.info("stderr: {}".format(restore_output))
+                task_status.set_message("message",restore_output)
+            return
+        except:
+            if "out-of-order restore request" not in task_status.get_message("message"):
+                raise
+            #the custom format dump can't be restored from a stream without the data offsets; the restore is rolled back, download it first
+            logger.warning("Failed to restore the dump file of job({}) from a stream, download it first".format(sync_job["job_file"]))
+            task_status.del_message("message")
+            _load_table_dumpfile(sync_job,task_status)
+
+    cmd[len(cmd) - 1] = sync_job["data"]["local_file"]
+    logger.info("Executing {}...".format(repr(cmd)))
+    restore = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
     restore_output = restore.communicate()
     if restore_output[1] and restore_output[1].strip():
         logger.info("stderr: {}".format(restore_output[1]))
@@ -218,8 +393,9 @@ def restore_table(sync_job,task_metadata,task_status):
 
 
 def restore_foreignkey(sync_job,task_metadata,task_status):
-    psql_cmd[len(psql_cmd) - 2] = "-c"
-    psql_cmd[len(psql_cmd) -1] = """
+    cmd = list(psql_cmd)
+    cmd[len(cmd) - 2] = "-c"
+    cmd[len(cmd) -1] = """
 DO 
 $$DECLARE
     foreign_key record;   
@@ -271,8 +447,8 @@ BEGIN
     END LOOP;
 END$$;
 """.format(sync_job["data_schema"],sync_job["name"],sync_job["outdated_schema"])
-    logger.info("Executing {}...".format(repr(psql_cmd)))
-    psql = subprocess.Popen(psql_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
+    logger.info("Executing {}...".format(repr(cmd)))
+    psql = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
     psql_output = psql.communicate()
     if psql_output[1] and psql_output[1].strip():
         logger.info("stderr: {}".format(psql_output[1]))
@@ -282,11 +458,12 @@ END$$;
         raise Exception("{0}:{1}".format(psql.returncode,task_status.get_message("message")))
 
 def create_access_view(sync_job,task_metadata,task_status):
+    cmd = list(psql_cmd)
     #create a view to access the new layer data.
-    psql_cmd[len(psql_cmd) - 2] = "-c"
-    psql_cmd[len(psql_cmd) -1] = "DROP VIEW IF EXISTS \"{0}\".\"{1}\" CASCADE;CREATE VIEW \"{0}\".\"{1}\" AS SELECT * FROM \"{2}\".\"{1}\";".format(sync_job["schema"],sync_job["name"],sync_job["data_schema"])
-    logger.info("Executing {}...".format(repr(psql_cmd)))
-    psql = subprocess.Popen(psql_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
+    cmd[len(cmd) - 2] = "-c"
+    cmd[len(cmd) -1] = "DROP VIEW IF EXISTS \"{0}\".\"{1}\" CASCADE;CREATE VIEW \"{0}\".\"{1}\" AS SELECT * FROM \"{2}\".\"{1}\";".format(sync_job["schema"],sync_job["name"],sync_job["data_schema"])
+    logger.info("Executing {}...".format(repr(cmd)))
+    psql = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
     psql_output = psql.communicate()
     if psql_output[1] and psql_output[1].strip():
         logger.info("stderr: {}".format(psql_output[1]))
@@ -297,11 +474,12 @@ def create_access_view(sync_job,task_metadata,task_status):
 
 
 def drop_outdated_table(sync_job,task_metadata,task_status):
+    cmd = list(psql_cmd)
     #drop the outdated table
-    psql_cmd[len(psql_cmd) - 2] = "-c"
-    psql_cmd[len(psql_cmd) -1] = "DROP TABLE IF EXISTS \"{0}\".\"{1}\";".format(sync_job["outdated_schema"],sync_job["name"])
-    logger.info("Executing {}...".format(repr(psql_cmd)))
-    psql = subprocess.Popen(psql_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
+    cmd[len(cmd) - 2] = "-c"
+    cmd[len(cmd) -1] = "DROP TABLE IF EXISTS \"{0}\".\"{1}\";".format(sync_job["outdated_schema"],sync_job["name"])
+    logger.info("Executing {}...".format(repr(cmd)))
+    psql = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
     psql_output = psql.communicate()
     if psql_output[1] and psql_output[1].strip():
         logger.info("stderr: {}".format(psql_output[1]))
@@ -311,11 +489,12 @@ def drop_outdated_table(sync_job,task_metadata,task_status):
         raise Exception("{0}:{1}".format(psql.returncode,task_status.get_message("message")))
 
 def drop_table(sync_job,task_metadata,task_status):
+    cmd = list(psql_cmd)
     #drop the table
-    psql_cmd[len(psql_cmd) - 2] = "-c"
-    psql_cmd[len(psql_cmd) -1] = "DROP VIEW IF EXISTS \"{0}\".\"{1}\" CASCADE;DROP TABLE IF EXISTS \"{2}\".\"{1}\" CASCADE;DROP TABLE IF EXISTS \"{3}\".\"{1}\" CASCADE;".format(sync_job["schema"], sync_job["name"],sync_job["data_schema"],sync_job["outdated_schema"])
-    logger.info("Executing {}...".format(repr(psql_cmd)))
-    psql = subprocess.Popen(psql_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
+    cmd[len(cmd) - 2] = "-c"
+    cmd[len(cmd) -1] = "DROP VIEW IF EXISTS \"{0}\".\"{1}\" CASCADE;DROP TABLE IF EXISTS \"{2}\".\"{1}\" CASCADE;DROP TABLE IF EXISTS \"{3}\".\"{1}\" CASCADE;".format(sync_job["schema"], sync_job["name"],sync_job["data_schema"],sync_job["outdated_schema"])
+    logger.info("Executing {}...".format(repr(cmd)))
+    psql = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
     psql_output = psql.communicate()
     if psql_output[1] and psql_output[1].strip():
         logger.info("stderr: {}".format(psql_output[1]))
@@ -327,8 +506,8 @@ def drop_table(sync_job,task_metadata,task_status):
 tasks_metadata = [
                     ("update_auth"                      , update_auth_job   , None      , "update_roles", update_auth),
                     ("create_postgis_extension"         , update_feature_job, db_feature_task_filter, "postgis_extension"   , create_postgis_extension),
-                    ("create_db_schema"                 , update_feature_job , db_feature_task_filter, schema_name   , create_schema),
-                    ("create_db_schema"                 , update_workspace_job,db_feature_task_filter, schema_name   , create_schema),
+                    ("create_db_schema"                 , update_feature_job , db_feature_task_filter, schema_name   , create_schema, create_schema_batch),
+                    ("create_db_schema"                 , update_workspace_job,db_feature_task_filter, schema_name   , create_schema, create_schema_batch),
                     ("move_outdated_table"              , update_feature_job, db_feature_task_filter, table_name    , move_outdated_table),
                     ("restore_table"                    , update_feature_job, db_feature_task_filter, table_name    , restore_table),
                     ("restore_foreignkey"               , update_feature_job, foreignkey_task_filter, table_name    , restore_foreignkey),
@@ -337,3 +516,15 @@ tasks_metadata = [
                     ("drop_table"                       , remove_feature_job, db_feature_task_filter, table_name    , drop_table),
 ]
 
+tasks_resource = {
+                    "update_auth"                       : DB_RESOURCE,
+                    "create_postgis_extension"          : DB_RESOURCE,
+                    "create_db_schema"                  : DB_RESOURCE,
+                    "move_outdated_table"               : DB_RESOURCE,
+                    "restore_table"                     : DB_RESOURCE,
+                    "restore_foreignkey"                : DB_RESOURCE,
+                    "create_access_view"                : DB_RESOURCE,
+                    "drop_outdated_table"               : DB_RESOURCE,
+                    "drop_table"                        : DB_RESOURCE,
+}
+
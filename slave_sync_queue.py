@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+"""
+A durable local queue of the pulled changesets.
+
+The hg hook (slave_sync_hook.py --queue) adds the pulled changeset into the queue and returns at once, so the hg transaction is not held during the sync.
+The executor (run this module) drains the queue: all pending changesets are synchronized together from the earliest one to the tip;
+the changesets are removed from the queue if the sync succeeds, otherwise they are kept and retried later.
+If the sync still fails after SYNC_QUEUE_MAX_ATTEMPTS attempts, the earliest changeset is reported and parked in the table "sync_queue_parked",
+so the later changesets are synchronized without it.
+
+Only the standard library is imported at module level, so the hook can use the queue without loading the sync modules.
+"""
+import os
+import sys
+import time
+import fcntl
+import sqlite3
+import logging
+import traceback
+
+CODE_PATH = os.path.dirname(os.path.realpath(__file__))
+SYNC_QUEUE_FILE = os.environ.get("SYNC_QUEUE_FILE",os.path.join(CODE_PATH,".sync_queue.db"))
+#seconds between two checks of the queue
+try:
+    SYNC_QUEUE_POLL_INTERVAL = max(int(os.environ.get("SYNC_QUEUE_POLL_INTERVAL","5")),1)
+except:
+    SYNC_QUEUE_POLL_INTERVAL = 5
+#seconds before retrying the failed changesets if no new changeset is pulled
+try:
+    SYNC_QUEUE_RETRY_INTERVAL = max(int(os.environ.get("SYNC_QUEUE_RETRY_INTERVAL","300")),0)
+except:
+    SYNC_QUEUE_RETRY_INTERVAL = 300
+#the earliest changeset is parked after the attempts; 0 means retry forever
+try:
+    SYNC_QUEUE_MAX_ATTEMPTS = max(int(os.environ.get("SYNC_QUEUE_MAX_ATTEMPTS","5")),0)
+except:
+    SYNC_QUEUE_MAX_ATTEMPTS = 5
+
+logger = logging.getLogger(__name__)
+
+class SyncQueue(object):
+    """
+    The queue of the changesets to synchronize, saved in a sqlite database
+    """
+    def __init__(self,path=SYNC_QUEUE_FILE):
+        self._path = path
+        self._conn = sqlite3.connect(path,timeout=60)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+CREATE TABLE IF NOT EXISTS sync_queue (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    hg_node TEXT NOT NULL,
+    queued_time REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_attempt_time REAL,
+    message TEXT
+)""")
+        self._conn.execute("""
+CREATE TABLE IF NOT EXISTS sync_queue_parked (
+    id INTEGER PRIMARY KEY,
+    hg_node TEXT NOT NULL,
+    queued_time REAL NOT NULL,
+    attempts INTEGER NOT NULL,
+    last_attempt_time REAL,
+    message TEXT,
+    parked_time REAL NOT NULL
+)""")
+        self._conn.commit()
+
+    def enqueue(self,hg_node):
+        with self._conn:
+            self._conn.execute("INSERT INTO sync_queue (hg_node,queued_time) VALUES (?,?)",(hg_node,time.time()))
+
+    def pending(self):
+        """
+        Return the list of (id,hg_node,attempts,last_attempt_time) of all the queued changesets, ordered by queued time
+        """
+        return self._conn.execute("SELECT id,hg_node,attempts,last_attempt_time FROM sync_queue ORDER BY id").fetchall()
+
+    def ready(self,retry_interval=SYNC_QUEUE_RETRY_INTERVAL):
+        """
+        Return the pending changesets if some changeset is not synchronized before or the retry interval is elapsed; otherwise return []
+        """
+        entries = self.pending()
+        now = time.time()
+        if any(e[2] == 0 or e[3] + retry_interval <= now for e in entries):
+            return entries
+        return []
+
+    def done(self,ids):
+        with self._conn:
+            self._conn.executemany("DELETE FROM sync_queue WHERE id = ?",[(i,) for i in ids])
+
+    def failed(self,ids,message):
+        with self._conn:
+            self._conn.executemany("UPDATE sync_queue SET attempts = attempts + 1, last_attempt_time = ?, message = ? WHERE id = ?",[(time.time(),message,i) for i in ids])
+
+    def park(self,max_attempts=SYNC_QUEUE_MAX_ATTEMPTS):
+        """
+        Park the earliest changeset if it was attempted max_attempts times, the attempts of the other changesets are reset
+        so they are synchronized again at once without it.
+        Return the parked (id,hg_node,attempts,message); return None if nothing is parked
+        """
+        if not max_attempts:
+            return None
+        entry = self._conn.execute("SELECT id,hg_node,attempts,message FROM sync_queue ORDER BY id LIMIT 1").fetchone()
+        if not entry or entry[2] < max_attempts:
+            return None
+        with self._conn:
+            self._conn.execute("INSERT INTO sync_queue_parked (id,hg_node,queued_time,attempts,last_attempt_time,message,parked_time) SELECT id,hg_node,queued_time,attempts,last_attempt_time,message,? FROM sync_queue WHERE id = ?",(time.time(),entry[0]))
+            self._conn.execute("DELETE FROM sync_queue WHERE id = ?",(entry[0],))
+            self._conn.execute("UPDATE sync_queue SET attempts = 0")
+        return entry
+
+    def parked(self):
+        """
+        Return the list of (id,hg_node,attempts,message,parked_time) of the parked changesets
+        """
+        return self._conn.execute("SELECT id,hg_node,attempts,message,parked_time FROM sync_queue_parked ORDER BY id").fetchall()
+
+    def close(self):
+        self._conn.close()
+
+def drain(queue,sync):
+    """
+    Synchronize all the ready changesets together; return True if some changesets are synchronized
+    """
+    entries = queue.ready()
+    if not entries:
+        return False
+    ids = [e[0] for e in entries]
+    logger.info("Begin to synchronize {} queued changesets from '{}'".format(len(entries),entries[0][1]))
+    try:
+        sync(entries[0][1])
+        queue.done(ids)
+    except:
+        logger.error("Failed to synchronize the queued changesets from '{}'. {}".format(entries[0][1],traceback.format_exc()))
+        queue.failed(ids,str(sys.exc_info()[1]))
+        parked = queue.park()
+        if parked:
+            logger.error("The changeset '{}' failed to synchronize {} times and is parked, the later changesets are synchronized without it. {}".format(parked[1],parked[2],parked[3]))
+    return True
+
+if __name__ == "__main__":
+    import slave_sync
+    from slave_sync_daemon import code_modified_time
+    with open(SYNC_QUEUE_FILE + ".lock","w") as lock_file:
+        try:
+            fcntl.flock(lock_file,fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except IOError:
+            logger.error("Another executor is draining the queue '{}'".format(SYNC_QUEUE_FILE))
+            sys.exit(1)
+
+        queue = SyncQueue()
+        started = time.time()
+        logger.info("Begin to drain the queue '{}'".format(SYNC_QUEUE_FILE))
+        while code_modified_time() <= started:
+            if not drain(queue,slave_sync.sync):
+                time.sleep(SYNC_QUEUE_POLL_INTERVAL)
+        #the code or the settings were changed, exit and let the process supervisor restart the executor
+        logger.info("The code or the settings were changed, stop the executor.")
+        queue.close()
@@ -0,0 +1,335 @@
+"""
+Execute the sync tasks based on a dependency graph instead of the global task order.
+
+Each unshared task or shared task is a node in the graph.
+    1. A node depends on the preceding nodes of the same job, the order of the nodes in a job is defined by "ordered_sync_task_type"
+    2. A shared node depends on the preceding nodes of all its jobs
+    3. A node depends on the nodes declared in "task_dependencies" in slave_sync_task.py
+
+A node is executed as soon as all the nodes it depends on are executed, so unrelated jobs are executed at their own pace.
+
+If a task has a batch handler, all ready nodes of the same task type are executed together by the batch handler.
+A ready node with a batch handler is held until all nodes of the same task type are ready, so the nodes of all jobs are executed in one batch;
+the held nodes are released earlier only if nothing else can be executed.
+
+The ready nodes are executed in the order of the estimated cost of their jobs, so cheap jobs are finished first;
+the cost of a job is the sum of the estimated duration of its tasks, estimated from the execution history(slave_sync_history.py).
+When all nodes of a job are executed, the job is passed to the "job_done" callback, e.g. to send the notify of the job.
+Each executed node is passed to the "task_done" callback, e.g. to checkpoint the sync status.
+
+If a task type is mapped to a resource class, a node of that type is only started when the resource class has a free slot;
+the number of slots of each resource class is configured by RESOURCE_LIMITS.
+"""
+import heapq
+import logging
+import threading
+import time
+import traceback
+
+from slave_sync_env import RESOURCE_LIMITS
+from slave_sync_history import TaskHistory
+from slave_sync_task import (
+    ordered_sync_task_type,task_dependencies,execute_task,execute_batch_task,batch_handler
+)
+
+logger = logging.getLogger(__name__)
+
+class SyncTaskNode(object):
+    """
+    A node in the task dependency graph.
+    """
+    def __init__(self,task_type,task_name,tasks,resource=None):
+        self.task_type = task_type
+        self.task_name = task_name
+        #list of (sync_job,task_metadata,task_logger)
+        self.tasks = tasks
+        self.jobs = [t[0] for t in tasks]
+        self.order = ordered_sync_task_type.index(task_type)
+        self.resource = resource
+        #the estimated cost of the cheapest job of this node
+        self.cost = 0
+        self.batch = any(batch_handler(t[1]) for t in tasks)
+        self.upstreams = set()
+        self.downstreams = set()
+        self.pending = 0
+
+    def depends_on(self,node):
+        if node is self or node in self.upstreams:
+            return
+        self.upstreams.add(node)
+        node.downstreams.add(self)
+
+    def execute(self):
+        if self.batch:
+            execute_batch_task(self.tasks)
+        else:
+            for task in self.tasks:
+                execute_task(*task)
+
+    def __str__(self):
+        return "{0} {1}".format(self.task_type,self.task_name)
+
+class BatchSyncTaskNode(SyncTaskNode):
+    """
+    A group of nodes with the same task type, executed by the batch handler together.
+    """
+    def __init__(self,nodes):
+        super(BatchSyncTaskNode,self).__init__(nodes[0].task_type,"[{}]".format(",".join([n.task_name for n in nodes])),[t for n in nodes for t in n.tasks],nodes[0].resource)
+        self.cost = min(n.cost for n in nodes)
+        self.nodes = nodes
+
+class SyncTaskScheduler(object):
+    """
+    Build the dependency graph from the sync tasks and execute the nodes with a number of worker threads
+    """
+    def __init__(self,sync_tasks,workers=1,tasks_resource=None,job_done=None,task_done=None):
+        self._workers = workers
+        self._tasks_resource = tasks_resource or {}
+        self._job_done = job_done
+        self._task_done = task_done
+        #the number of unexecuted nodes of each job
+        self._job_pending = {}
+        #the jobs ordered by the estimated cost
+        self.jobs = []
+        #job file -> the task types scheduled for the job
+        self.job_task_types = {}
+        self._resources = dict([(resource,threading.BoundedSemaphore(limit)) for resource,limit in RESOURCE_LIMITS.iteritems()])
+        self._nodes = []
+        self._ready = []
+        #task type -> the held ready nodes with a batch handler
+        self._held = {}
+        #task type -> the number of the nodes with a batch handler which are not ready yet
+        self._unready_batch = {}
+        self._seq = 0
+        self._running = 0
+        self._executed = 0
+        self._lock = threading.Condition()
+        self._build(sync_tasks)
+
+    def _build(self,sync_tasks):
+        job_nodes = {}
+        #job file -> sync job
+        sync_jobs = {}
+        type_nodes = {}
+        for task_type in ordered_sync_task_type:
+            type_nodes[task_type] = []
+            for task_name,task in sync_tasks.get(task_type,{}).iteritems():
+                node = SyncTaskNode(task_type,task_name,task if isinstance(task,list) else [task],self._tasks_resource.get(task_type))
+                self._nodes.append(node)
+                type_nodes[task_type].append(node)
+                for sync_job in node.jobs:
+                    if sync_job["job_file"] not in job_nodes:
+                        job_nodes[sync_job["job_file"]] = []
+                        sync_jobs[sync_job["job_file"]] = sync_job
+                    job_nodes[sync_job["job_file"]].append(node)
+
+        for job_file,nodes in job_nodes.iteritems():
+            self.job_task_types[job_file] = set([n.task_type for n in nodes])
+
+        #dependencies between the nodes of the same job
+        for nodes in job_nodes.itervalues():
+            nodes.sort(key=lambda n:n.order)
+            for i in range(1,len(nodes)):
+                nodes[i].depends_on(nodes[i - 1])
+
+        #estimate the cost of each job
+        job_costs = {}
+        for job_file,nodes in job_nodes.iteritems():
+            self._job_pending[job_file] = len(nodes)
+            job_costs[job_file] = 0
+            for node in nodes:
+                job_costs[job_file] += TaskHistory.estimate(node.task_type,sync_jobs[job_file])[0]
+        for node in self._nodes:
+            node.cost = min(job_costs[j["job_file"]] for j in node.jobs)
+        self.jobs = sorted(sync_jobs.itervalues(),key=lambda j:job_costs[j["job_file"]])
+        logger.info("Estimated job costs: {0}".format(", ".join(["{0}={1:.1f}s".format(k,v) for k,v in sorted(job_costs.iteritems(),key=lambda item:item[1])])))
+
+        #declared dependencies across jobs
+        for task_type,depended_task_type,depended_keys,keys in task_dependencies:
+            if not type_nodes.get(task_type) or not type_nodes.get(depended_task_type):
+                continue
+            providers = {}
+            for node in type_nodes[depended_task_type]:
+                for key in self._keys(node,depended_keys):
+                    if key not in providers:
+                        providers[key] = []
+                    providers[key].append(node)
+            for node in type_nodes[task_type]:
+                for key in self._keys(node,keys):
+                    for depended_node in providers.get(key,[]):
+                        node.depends_on(depended_node)
+
+        for node in self._nodes:
+            if node.batch:
+                self._unready_batch[node.task_type] = self._unready_batch.get(node.task_type,0) + 1
+        for node in self._nodes:
+            node.pending = len(node.upstreams)
+            if not node.pending:
+                self._push(node)
+
+    def _keys(self,node,keys_func):
+        keys = set()
+        for sync_job in node.jobs:
+            try:
+                keys.update(keys_func(sync_job))
+            except:
+                #job doesn't have the required properties, no dependencies
+                pass
+        return keys
+
+    def _push(self,node):
+        if node.batch:
+            #hold the node until all nodes of the same task type are ready
+            self._held.setdefault(node.task_type,[]).append(node)
+            self._unready_batch[node.task_type] -= 1
+            if self._unready_batch[node.task_type] > 0:
+                return
+            nodes = self._held.pop(node.task_type)
+        else:
+            nodes = [node]
+        for n in nodes:
+            self._seq += 1
+            heapq.heappush(self._ready,(n.cost,n.order,self._seq,n))
+
+    def _release_held(self):
+        """
+        Release all held nodes, called if nothing else can be executed
+        """
+        held = self._held
+        self._held = {}
+        for nodes in held.itervalues():
+            for n in nodes:
+                self._seq += 1
+                heapq.heappush(self._ready,(n.cost,n.order,self._seq,n))
+
+    def _acquire(self,node):
+        """
+        Acquire a slot of the node's resource class without blocking, return True if succeed.
+        """
+        if node.resource not in self._resources:
+            return True
+        return self._resources[node.resource].acquire(False)
+
+    def _release(self,node):
+        if node.resource in self._resources:
+            self._resources[node.resource].release()
+
+    def _pop(self):
+        """
+        Return the ready node with highest priority whose resource class has a free slot; return None if not found
+        if the node has a batch handler, return a batch node including all ready nodes with the same task type.
+        """
+        skipped = []
+        node = None
+        while self._ready:
+            item = heapq.heappop(self._ready)
+            if self._acquire(item[3]):
+                node = item[3]
+                break
+            skipped.append(item)
+
+        if node and node.batch:
+            nodes = [node]
+            for item in self._ready:
+                if item[3].batch and item[3].task_type == node.task_type:
+                    nodes.append(item[3])
+                else:
+                    skipped.append(item)
+            self._ready = []
+            if len(nodes) > 1:
+                node = BatchSyncTaskNode(nodes)
+
+        for item in skipped:
+            heapq.heappush(self._ready,item)
+        return node
+
+    def _finish(self,node):
+        """
+        Return the jobs whose nodes are all executed
+        """
+        self._release(node)
+        self._running -= 1
+        done_jobs = []
+        for n in (node.nodes if isinstance(node,BatchSyncTaskNode) else [node]):
+            self._executed += 1
+            for downstream in n.downstreams:
+                downstream.pending -= 1
+                if not downstream.pending:
+                    self._push(downstream)
+            for sync_job in n.jobs:
+                self._job_pending[sync_job["job_file"]] -= 1
+                if not self._job_pending[sync_job["job_file"]]:
+                    done_jobs.append(sync_job)
+        self._lock.notify_all()
+        return done_jobs
+
+    def _execute(self,node):
+        start = time.time()
+        try:
+            node.execute()
+        except:
+            logger.error("Failed to execute the task ({0}). {1}".format(node,traceback.format_exc()))
+        TaskHistory.record(node.task_type,node.jobs,time.time() - start)
+
+    def _next(self):
+        """
+        Return the next ready node; return None if all nodes are executed.
+        """
+        with self._lock:
+            while True:
+                node = self._pop() if self._ready else None
+                if node:
+                    self._running += 1
+                    return node
+                elif self._running:
+                    #no ready nodes or all resource slots required by ready nodes are taken, wait for running nodes
+                    self._lock.wait()
+                elif self._held:
+                    #the other nodes of the same task type depend on the held nodes, execute the held nodes now
+                    self._release_held()
+                elif self._executed < len(self._nodes):
+                    #some nodes can't be ready because of circular dependencies; release the blocked nodes of the earliest task type in the predefined order,
+                    #the other blocked nodes are released by the dependencies, so the nodes of a job are still executed in order.
+                    blocked = sorted([n for n in self._nodes if n.pending > 0],key=lambda n:n.order)
+                    logger.warning("Circular dependencies found between tasks ({0}), execute them in order".format(", ".join([str(n) for n in blocked])))
+                    for n in blocked:
+                        if n.order != blocked[0].order:
+                            break
+                        n.pending = 0
+                        self._push(n)
+                else:
+                    return None
+
+    def _work(self):
+        while True:
+            node = self._next()
+            if not node:
+                return
+            self._execute(node)
+            if self._task_done:
+                try:
+                    self._task_done(node)
+                except:
+                    logger.error("Failed to process the executed task ({0}). {1}".format(node,traceback.format_exc()))
+            with self._lock:
+                done_jobs = self._finish(node)
+            if done_jobs and self._job_done:
+                try:
+                    self._job_done(done_jobs)
+                except:
+                    logger.error("Failed to process the finished jobs ({0}). {1}".format(",".join([j["job_file"] for j in done_jobs]),traceback.format_exc()))
+
+    def run(self):
+        try:
+            if self._workers <= 1:
+                self._work()
+                return
+
+            threads = [threading.Thread(target=self._work,name="sync-worker-{}".format(i)) for i in range(self._workers)]
+            for t in threads:
+                t.daemon = True
+                t.start()
+            for t in threads:
+                t.join()
+        finally:
+            TaskHistory.save()
@@ -0,0 +1,85 @@
+"""
+A pool of ssh master connections, one master connection for each remote host.
+
+The ssh commands (rsync, remote md5sum and upload) to the same host share one ssh connection through the ssh ControlMaster,
+so the ssh handshake is done once per host instead of once per command.
+The master connection is started when the host is used first time, and closed when the sync is finished;
+it exits by itself SSH_CONTROL_PERSIST seconds after the last command if the process is killed.
+If the master connection can't be started, the commands are executed without it.
+"""
+import os
+import hashlib
+import logging
+import tempfile
+import threading
+import traceback
+import subprocess
+
+from slave_sync_env import BORGCOLLECTOR_SSH,SSH_CONTROL_PERSIST,env
+
+logger = logging.getLogger(__name__)
+
+class SSHPool(object):
+    """
+    The ssh master connections
+    """
+    #host -> control path; control path is None if the master connection can't be started
+    _masters = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def _control_path(cls,host):
+        #the path of a unix socket is limited to about 100 characters
+        return os.path.join(tempfile.gettempdir(),"slave_sync_ssh_{}_{}".format(os.getpid(),hashlib.md5(host).hexdigest()[:8]))
+
+    @classmethod
+    def _master(cls,host):
+        """
+        Return the control path of the master connection to the host, start the master connection if not started
+        """
+        with cls._lock:
+            if host in cls._masters:
+                return cls._masters[host]
+            control_path = cls._control_path(host)
+            cmd = BORGCOLLECTOR_SSH.split() + ["-o","ControlMaster=yes","-o","ControlPersist={}".format(SSH_CONTROL_PERSIST),"-o","ControlPath={}".format(control_path),"-N","-f",host]
+            try:
+                logger.info("Start the ssh master connection to '{}'".format(host))
+                subprocess.check_call(cmd,env=env)
+            except:
+                logger.error("Failed to start the ssh master connection to '{}', execute the commands without it. {}".format(host,traceback.format_exc()))
+                control_path = None
+            cls._masters[host] = control_path
+            return control_path
+
+    @classmethod
+    def ssh_cmd(cls,host):
+        """
+        Return the ssh command(list) to execute a command in the host through the master connection
+        """
+        control_path = cls._master(host) if host and SSH_CONTROL_PERSIST else None
+        if not control_path:
+            return BORGCOLLECTOR_SSH.split()
+        return BORGCOLLECTOR_SSH.split() + ["-o","ControlMaster=no","-o","ControlPath={}".format(control_path)]
+
+    @classmethod
+    def rsync_ssh(cls,remote_path):
+        """
+        Return the ssh command(string) used by rsync("-e") to transfer the remote file "user@host:path"
+        """
+        host = remote_path.split(":",1)[0] if remote_path.find("@") > 0 and remote_path.find(":") > 0 else None
+        return " ".join(cls.ssh_cmd(host))
+
+    @classmethod
+    def close_all(cls):
+        """
+        Close all the master connections
+        """
+        with cls._lock:
+            for host,control_path in cls._masters.iteritems():
+                if not control_path:
+                    continue
+                try:
+                    subprocess.call(BORGCOLLECTOR_SSH.split() + ["-o","ControlPath={}".format(control_path),"-O","exit",host],stdout=subprocess.PIPE,stderr=subprocess.PIPE,env=env)
+                except:
+                    logger.error("Failed to close the ssh master connection to '{}'. {}".format(host,traceback.format_exc()))
+            cls._masters = {}
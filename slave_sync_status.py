@@ -1,14 +1,20 @@
 import os
 import hashlib
 import json
+import zlib
+import sqlite3
 import logging
+import threading
+import traceback
 import pytz
 from datetime import datetime
 import time
 from jinja2 import Template
 
 from slave_sync_task import ordered_sync_task_type
-from slave_sync_env import SYNC_STATUS_PATH,now,DEFAULT_TIMEZONE
+from slave_sync_env import (
+    SYNC_STATUS_PATH,SYNC_STATUS_CHECKPOINT_INTERVAL,STATUS_MESSAGE_MAX_SIZE,STATUS_MESSAGE_SPILL_FILES,now,DEFAULT_TIMEZONE
+)
 
 logger = logging.getLogger(__name__)
 
@@ -26,6 +32,210 @@ def date_from_str(d_str):
 
     return None
 
+#the folder of the large messages spilled from the sync status
+SPILL_PATH = os.path.join(SYNC_STATUS_PATH,".messages")
+
+def intern_key(key):
+    """
+    Intern the key of the status data, the same task types and message keys are used by thousands of status objects
+    """
+    try:
+        return intern(str(key))
+    except:
+        return key
+
+def cap_message(message):
+    """
+    Return the message if it is not longer than STATUS_MESSAGE_MAX_SIZE;
+    otherwise save the full message into a file in SPILL_PATH and return the head and tail of the message with the file path
+    """
+    if not STATUS_MESSAGE_MAX_SIZE or not isinstance(message,basestring) or len(message) <= STATUS_MESSAGE_MAX_SIZE:
+        return message
+    if isinstance(message,unicode):
+        message = message.encode("utf-8")
+    #the same message(e.g. the same error of many jobs) is saved once
+    spill_file = os.path.join(SPILL_PATH,"{}.txt".format(hashlib.md5(message).hexdigest()))
+    try:
+        if not os.path.exists(SPILL_PATH):
+            os.makedirs(SPILL_PATH)
+        if not os.path.exists(spill_file):
+            with open(spill_file,"w") as f:
+                f.write(message)
+        else:
+            os.utime(spill_file,None)
+    except:
+        logger.error("Failed to save the message to file '{}'. {}".format(spill_file,traceback.format_exc()))
+        spill_file = None
+    half = STATUS_MESSAGE_MAX_SIZE / 2
+    return "{}\n...... {} characters are truncated{} ......\n{}".format(
+        message[:half],len(message) - half * 2,", the full message is saved in '{}'".format(spill_file) if spill_file else "",message[-half:])
+
+def evict_spilled_messages():
+    """
+    Keep the latest STATUS_MESSAGE_SPILL_FILES spilled message files, remove the others
+    """
+    if not os.path.exists(SPILL_PATH):
+        return
+    spill_files = [os.path.join(SPILL_PATH,f) for f in os.listdir(SPILL_PATH)]
+    if len(spill_files) <= STATUS_MESSAGE_SPILL_FILES:
+        return
+    spill_files.sort(key=lambda f:os.path.getmtime(f),reverse=True)
+    for f in spill_files[STATUS_MESSAGE_SPILL_FILES:]:
+        try:
+            os.remove(f)
+        except:
+            pass
+
+class SyncStatusStore(object):
+    """
+    The sqlite database ".sync_status.db" in SYNC_STATUS_PATH to save the sync status of the jobs.
+    file, action, md5, status and last_process_time are saved in indexed columns; 
+    the other status data(task and stage status) are saved as compressed json in column "info".
+    The status files saved by the previous version are migrated into the database when it is created.
+    The status checkpointed during a sync is appended into the journal ".sync_status.journal", 
+    the journal is compacted into the database when the status is saved or the database is opened after the process was killed.
+    """
+    _db_file = os.path.join(SYNC_STATUS_PATH,".sync_status.db")
+    _journal_file = os.path.join(SYNC_STATUS_PATH,".sync_status.journal")
+    _columns = ("file","action","md5","status","last_process_time")
+    _conn = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def _connect(cls):
+        if cls._conn is None:
+            created = not os.path.exists(cls._db_file)
+            cls._conn = sqlite3.connect(cls._db_file,timeout=60,check_same_thread=False)
+            cls._conn.execute("PRAGMA journal_mode=WAL")
+            with cls._conn:
+                cls._conn.execute("""
+CREATE TABLE IF NOT EXISTS job_status (
+    file TEXT PRIMARY KEY,
+    action TEXT,
+    md5 TEXT,
+    status INTEGER,
+    last_process_time TEXT,
+    info BLOB
+)""")
+                for column in cls._columns[1:]:
+                    cls._conn.execute("CREATE INDEX IF NOT EXISTS job_status_{0} ON job_status ({0})".format(column))
+            if created:
+                cls._migrate()
+            cls._compact()
+        return cls._conn
+
+    @classmethod
+    def _row(cls,info):
+        info = dict(info)
+        row = [info.pop(column,None) for column in cls._columns]
+        row.append(buffer(zlib.compress(json.dumps(info,separators=(',',':')))))
+        return row
+
+    @classmethod
+    def _migrate(cls):
+        """
+        Migrate the status files into the database, the migrated files are removed
+        """
+        migrated = []
+        for root,dirs,files in os.walk(SYNC_STATUS_PATH):
+            for f in files:
+                status_file = os.path.join(root,f)
+                if f.startswith(".") or (root == SYNC_STATUS_PATH and f == "bitbucket"):
+                    continue
+                try:
+                    with open(status_file,'r') as status:
+                        info = json.loads(status.read())
+                    if not isinstance(info,dict) or "md5" not in info or "action" not in info:
+                        continue
+                    info["file"] = os.path.relpath(status_file,SYNC_STATUS_PATH)
+                    migrated.append((status_file,info))
+                except:
+                    #not a status file
+                    continue
+        if not migrated:
+            return
+        with cls._conn:
+            cls._conn.executemany("INSERT OR REPLACE INTO job_status (file,action,md5,status,last_process_time,info) VALUES (?,?,?,?,?,?)",[cls._row(status_info) for _,status_info in migrated])
+        for status_file,info in migrated:
+            os.remove(status_file)
+        logger.info("{} status files are migrated into the status database '{}'".format(len(migrated),cls._db_file))
+
+    @classmethod
+    def _replay(cls):
+        """
+        Return the status data in the journal, the last one of each file
+        """
+        infos = {}
+        if not os.path.exists(cls._journal_file):
+            return []
+        with open(cls._journal_file,'r') as f:
+            for line in f:
+                try:
+                    info = json.loads(line)
+                    infos[info["file"]] = info
+                except:
+                    #the last line is half-written if the process was killed
+                    logger.warning("Ignore the invalid line in the status journal '{}'".format(cls._journal_file))
+        return infos.values()
+
+    @classmethod
+    def _compact(cls,infos=[]):
+        """
+        Save the status data in the journal and the status data of the files into database in one transaction, and then remove the journal
+        """
+        infos = cls._replay() + list(infos)
+        if infos:
+            with cls._conn:
+                cls._conn.executemany("INSERT OR REPLACE INTO job_status (file,action,md5,status,last_process_time,info) VALUES (?,?,?,?,?,?)",[cls._row(info) for info in infos])
+        if os.path.exists(cls._journal_file):
+            os.remove(cls._journal_file)
+
+    @classmethod
+    def append(cls,lines):
+        """
+        Append the serialized status data into the journal
+        """
+        with cls._lock:
+            with open(cls._journal_file,'a') as f:
+                for line in lines:
+                    f.write(line)
+                    f.write("\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+    @classmethod
+    def get(cls,sync_file):
+        """
+        Return the saved status data of the file; return None if not found
+        """
+        with cls._lock:
+            row = cls._connect().execute("SELECT file,action,md5,status,last_process_time,info FROM job_status WHERE file = ?",(sync_file,)).fetchone()
+        if not row:
+            return None
+        info = json.loads(zlib.decompress(row[5])) if row[5] else {}
+        for column,value in zip(cls._columns,row):
+            if value is not None:
+                info[column] = bool(value) if column == "status" else value
+        return info
+
+    @classmethod
+    def save(cls,infos):
+        """
+        Save the status data of the files and compact the journal in one transaction
+        """
+        with cls._lock:
+            if cls._conn is None:
+                #the journal is compacted when connected
+                cls._connect()
+            cls._compact(infos)
+
+    @classmethod
+    def close(cls):
+        with cls._lock:
+            if cls._conn:
+                cls._conn.close()
+                cls._conn = None
+
 class SlaveSyncStatus(object):
     """
     manage sync status information of a sync job
@@ -35,20 +245,51 @@ class SlaveSyncStatus(object):
     @classmethod
     def get_bitbucket_status(cls):
         if not hasattr(cls,"_bitbucket_status"):
-            cls._bitbucket_status = SlaveSyncStatus("bitbucket","sync",str(now()))
+            #the pull status is saved in file, its modify time is checked by slave_poll.py
+            cls._bitbucket_status = SlaveSyncStatus("bitbucket","sync",str(now()),in_file=True)
 
         return cls._bitbucket_status
 
+    __slots__ = ("_status_file","_info","_persistent","_previous_task_status","_version","_saved_version","_counts","_state","_json")
     update = "update"
     remove = "remove"
+    #the states of a status object: all tasks succeed; some task failed; some task is not executed and no task failed
+    SUCCEED = "succeed"
+    FAILED = "failed"
+    PENDING = "pending"
     _status_objects = []
+    #the status objects indexed by state
+    _state_index = {SUCCEED:set(),FAILED:set(),PENDING:set()}
+    #protect the task counters and the state index, the task status is changed by multiple threads
+    _state_lock = threading.Lock()
     _modified = False
-    def __init__(self,sync_file,action = "update",file_content = None):
-        if file_content:
+    #the number of the tasks executed after the last checkpoint
+    _unsaved_tasks = 0
+    _checkpoint_lock = threading.Lock()
+    #the status objects changed after the last checkpoint
+    _changed_objects = set()
+    _changed_lock = threading.Lock()
+    def __init__(self,sync_file,action = "update",file_content = None,md5 = None,in_file = False):
+        """
+        md5: the md5 of the file content; computed from file content if it is None
+        in_file: save the status in a file in SYNC_STATUS_PATH instead of the status database
+        """
+        #increased when the status data is changed; compared with the version saved last time to find the modified status objects
+        self._version = 0
+        self._saved_version = None
+        #the number of the succeed, failed and not executed tasks
+        self._counts = [0,0,0]
+        self._state = SlaveSyncStatus.SUCCEED
+        #the cached (version,json) of the status
+        self._json = None
+        if file_content or md5:
             #file content is not null, worked in persistent mode
-            self._status_file = os.path.join(SYNC_STATUS_PATH,sync_file)
+            self._status_file = os.path.join(SYNC_STATUS_PATH,sync_file) if in_file else None
             self._info = None
-            if os.path.isfile(self._status_file):
+            if not self._status_file:
+                #load the status from the status database
+                self._info = SyncStatusStore.get(sync_file) or {}
+            elif os.path.isfile(self._status_file):
                 #load the status file
                 with open(self._status_file,'r') as f:
                     txt = f.read()
@@ -62,9 +303,12 @@ class SlaveSyncStatus(object):
                     os.makedirs(os.path.dirname(self._status_file))
                 self._info = {}
 
-            m = hashlib.md5()
-            m.update(file_content)
-            md5_hash = m.hexdigest()
+            if md5:
+                md5_hash = md5
+            else:
+                m = hashlib.md5()
+                m.update(file_content)
+                md5_hash = m.hexdigest()
             if self._info.get('md5',None) != md5_hash or self._info.get('action',None) != action:
                 self._info.clear()
                 self._info = {"file":sync_file}
@@ -75,17 +319,20 @@ class SlaveSyncStatus(object):
         else:
             #file content is null, worked in non persistent mode
             self._persistent = False
+            self._status_file = None
             self._info = {'action':action}
             self._info = {'file':sync_file}
 
         if "tasks" in self._info:
-            self._previous_task_status = self._info.pop("tasks")
+            self._previous_task_status = dict([(intern_key(k),v) for k,v in self._info.pop("tasks").iteritems()])
         else:
             self._previous_task_status = {}
 
         self._info['tasks'] = {}
 
         SlaveSyncStatus._status_objects.append(self)
+        with SlaveSyncStatus._state_lock:
+            SlaveSyncStatus._state_index[self._state].add(self)
 
     @property
     def file(self):
@@ -102,54 +349,184 @@ class SlaveSyncStatus(object):
         try:
             return self._info['tasks'][name]
         except:
-            self._info['tasks'][name] = SlaveSyncTaskStatus(self._previous_task_status.get(name,{}))
-            return self._info['tasks'][name]
+            return self._add_task_status(name,SlaveSyncTaskStatus(self._previous_task_status.get(intern_key(name),{})))
 
     def set_task_status(self,name,task_status):
         if task_status:
-            if isinstance(task_status,SlaveSyncTaskStatus):
-                self._info['tasks'][name] = task_status
-            else:
-                self._info['tasks'][name] = SlaveSyncTaskStatus(task_status)
+            self._add_task_status(name,task_status if isinstance(task_status,SlaveSyncTaskStatus) else SlaveSyncTaskStatus(task_status))
+            self._version += 1
+
+    def _add_task_status(self,name,task_status):
+        """
+        Add the task status and update the task counters
+        """
+        name = intern_key(name)
+        with SlaveSyncStatus._state_lock:
+            previous = self._info['tasks'].get(name)
+            if previous is not None:
+                previous._owners.remove(self)
+                self._counts[previous.state_index] -= 1
+            self._info['tasks'][name] = task_status
+            task_status._owners.append(self)
+            self._counts[task_status.state_index] += 1
+            self._update_state()
+        SlaveSyncStatus.mark_changed([self])
+        return task_status
+
+    @classmethod
+    def mark_changed(cls,status_objects):
+        """
+        Mark the status objects as changed, they are checked in the next checkpoint
+        """
+        if not status_objects:
+            return
+        with cls._changed_lock:
+            cls._changed_objects.update(status_objects)
+
+    def _task_state_changed(self,previous,current):
+        """
+        Called by the task status when its state is changed, the state lock is held by the caller
+        """
+        self._counts[previous] -= 1
+        self._counts[current] += 1
+        self._update_state()
+
+    def _update_state(self):
+        state = SlaveSyncStatus.FAILED if self._counts[1] else (SlaveSyncStatus.PENDING if self._counts[2] else SlaveSyncStatus.SUCCEED)
+        if state != self._state:
+            SlaveSyncStatus._state_index[self._state].discard(self)
+            SlaveSyncStatus._state_index[state].add(self)
+            self._state = state
+
+    @property
+    def state(self):
+        return self._state
+
+    @property
+    def version(self):
+        """
+        The version of the status data, including the versions of the task status; a task status can be shared by multiple status objects
+        """
+        return (self._version,dict([(name,s._version) for name,s in self._info['tasks'].iteritems()]))
+
+    @property
+    def is_dirty(self):
+        """
+        Return True if the status should be saved: processed in this run and changed since last save
+        """
+        return self._persistent and self.is_processed and self.version != self._saved_version
 
     @property
     def is_succeed(self):
-        return all([s.is_succeed for s in self._info.get("tasks",{}).itervalues()])
+        return self._state == SlaveSyncStatus.SUCCEED
 
     @property
     def is_failed(self):
-        return any([s.is_failed for s in self._info.get("tasks",{}).itervalues()])
+        return self._state == SlaveSyncStatus.FAILED
 
     @property
     def is_not_succeed(self):
-        return any([s.is_not_succeed  for s in self._info.get("tasks",{}).itervalues()])
+        return self._state != SlaveSyncStatus.SUCCEED
         
+    @classmethod
+    def reset(cls):
+        """
+        Forget all status objects, called after a sync is finished
+        """
+        cls._status_objects = []
+        cls._state_index = {cls.SUCCEED:set(),cls.FAILED:set(),cls.PENDING:set()}
+        cls._modified = False
+        cls._unsaved_tasks = 0
+        cls._changed_objects = set()
+        if hasattr(cls,"_bitbucket_status"):
+            del cls._bitbucket_status
+        SyncStatusStore.close()
+
     @staticmethod
     def all_succeed():
         """
         Return true, if all files are processed successfully; otherwise return False
         """
-        return all([s.is_succeed for s in SlaveSyncStatus._status_objects])
+        return not SlaveSyncStatus._state_index[SlaveSyncStatus.FAILED] and not SlaveSyncStatus._state_index[SlaveSyncStatus.PENDING]
+
+    @classmethod
+    def get_status_objects(cls,state):
+        """
+        Return the status objects in the state, ordered by file
+        """
+        with cls._state_lock:
+            return sorted(cls._state_index[state],key=lambda s:s.file)
 
     @staticmethod
     def save_all():
         """
-        save all status object into file system
+        save the modified status objects into the status database in one transaction, and the status files into file system
         """
+        saved = []
         for s in SlaveSyncStatus._status_objects:
-            s.save()
+            if not s.is_dirty:
+                continue
+            if s._status_file:
+                s.save()
+            else:
+                s._info['status'] = s.is_succeed
+                saved.append((s,s.version,s.to_dict()))
+        SyncStatusStore.save([data for s,version,data in saved])
+        for s,version,data in saved:
+            s._saved_version = version
+        evict_spilled_messages()
+
+    @classmethod
+    def checkpoint(cls,force=False):
+        """
+        Append the modified status objects into the journal every SYNC_STATUS_CHECKPOINT_INTERVAL executed tasks,
+        so the executed tasks are not executed again if the process is killed; the journal is compacted by save_all.
+        Only the status objects changed after the last checkpoint are checked.
+        """
+        with cls._checkpoint_lock:
+            cls._unsaved_tasks += 1
+            if not SYNC_STATUS_CHECKPOINT_INTERVAL or (cls._unsaved_tasks < SYNC_STATUS_CHECKPOINT_INTERVAL and not force):
+                return
+            cls._unsaved_tasks = 0
+            with cls._changed_lock:
+                changed_objects = cls._changed_objects
+                cls._changed_objects = set()
+            lines = []
+            saved = []
+            for s in changed_objects:
+                if s._status_file:
+                    continue
+                try:
+                    if not s.is_dirty:
+                        continue
+                    version = s.version
+                    s._info['status'] = s.is_succeed
+                    lines.append(json.dumps(s.to_dict()))
+                    saved.append((s,version))
+                except:
+                    #the status is being changed by a running task, checkpoint it next time
+                    cls.mark_changed([s])
+                    continue
+            if lines:
+                SyncStatusStore.append(lines)
+                for s,version in saved:
+                    s._saved_version = version
 
     @staticmethod
     def get_failed_status_objects():
         """
         Return all status object for failed files.
         """
-        return [s for s in SlaveSyncStatus._status_objects if s.is_not_succeed]
+        return SlaveSyncStatus.get_status_objects(SlaveSyncStatus.FAILED) + SlaveSyncStatus.get_status_objects(SlaveSyncStatus.PENDING)
 
     @property
     def is_processed(self):
         return any([s.is_processed for s in self._info["tasks"].values()])
 
+    @property
+    def md5(self):
+        return self._info.get('md5')
+
     @property
     def file(self):
         """
@@ -177,7 +554,7 @@ Synchronize file from repository
     Task {{task_index}} : {{task_type}}
         Succeed : {{task_status.task_status}}
         Process Time : {{task_status.last_process_time}}
-        {% for key,value in task_status["messages"].iteritems() -%}
+        {% for key,value in task_status.messages.iteritems() -%}
         {{key|capitalize}} : {{value}}
         {% endfor -%}
 """)
@@ -196,6 +573,44 @@ Synchronize file from repository
             {% endfor -%}
 """)
 
+    def to_dict(self):
+        """
+        Return the status data to save, the task status objects are converted into dicts
+        """
+        data = dict(self._info)
+        data["tasks"] = dict([(name,task_status.to_dict()) for name,task_status in self._info["tasks"].iteritems()])
+        return data
+
+    def _ordered_task_types(self):
+        if self == SlaveSyncStatus.get_bitbucket_status():
+            return self._info["tasks"].keys()
+        return [t for task_types in [["load_metadata","prepare"],ordered_sync_task_type] for t in task_types if t in self._info["tasks"]]
+
+    def to_json(self):
+        """
+        Return the status as json, used by the notify; the json is cached until the status is changed.
+        The text rendered by __str__ is only used in logs.
+        """
+        version = self.version
+        if self._json is None or self._json[0] != version:
+            tasks = []
+            for task_type in self._ordered_task_types():
+                task_status = self._info["tasks"][task_type]
+                tasks.append({
+                    "task":task_type,
+                    "succeed":task_status.task_status,
+                    "last_process_time":task_status._last_process_time,
+                    "messages":task_status.messages,
+                    "stages":[dict([("stage",stage_name)] + [(k,v) for k,v in stage_status.iteritems()]) for stage_name,stage_status in task_status.stages.iteritems()]
+                })
+            self._json = (version,json.dumps({
+                "file":self.file,
+                "succeed":self.is_succeed,
+                "last_process_time":self._info.get("last_process_time"),
+                "tasks":tasks
+            }))
+        return self._json[1]
+
     def __str__(self):
         message = self.header_template.render({"task":self._info,"is_succeed":self.is_succeed})
         task_index = 0
@@ -204,8 +619,8 @@ Synchronize file from repository
             for task_type,task_status in self._info["tasks"].iteritems():
                 task_index += 1
                 message += os.linesep + (self.task_header_template_2 if task_status.has_message() else self.task_header_template_1 ).render({"task_index":task_index,"task_type":task_type,"task_status":task_status})
-                for stage_name,stage_status in self._info["tasks"][task_type].get("stages",{}).iteritems():
-                    message += os.linesep +  (self.stage_template_2 if stage_status.has_message() else self.stage_template_1 ).render({"stage_name":stage_name, "stage_status":stage_status})
+                for stage_name,stage_status in task_status.stages.iteritems():
+                    message += os.linesep +  (self.stage_template_2 if "messages" in stage_status else self.stage_template_1 ).render({"stage_name":stage_name, "stage_status":stage_status})
            
         else:
             message = self.header_template.render({"task":self._info,"is_succeed":self.is_succeed})
@@ -215,19 +630,29 @@ Synchronize file from repository
                     task_status = self._info["tasks"][task_type]
                     task_index += 1
                     message += os.linesep + (self.task_header_template_2 if task_status.has_message() else self.task_header_template_1 ).render({"task_index":task_index,"task_type":task_type,"task_status":task_status})
-                    for stage_name,stage_status in self._info["tasks"][task_type].get("stages",{}).iteritems():
+                    for stage_name,stage_status in task_status.stages.iteritems():
                         message += os.linesep +  (self.stage_template_2 if "messages" in stage_status else self.stage_template_1 ).render({"stage_name":stage_name, "stage_status":stage_status})
            
         return message
 
     def save(self):
         """
-        save the status to file
+        save the status to file or the status database if modified; 
+        the status file is written into a temporary file and then renamed, so a half-written status file is never left.
         """
-        if self._persistent and self.is_processed:
+        if self.is_dirty:
+            version = self.version
             self._info['status'] = self.is_succeed
-            with open(self._status_file,'w') as f:
-                f.write(json.dumps(self._info))
+            if self._status_file:
+                tmp_file = "{}.{}".format(self._status_file,os.getpid())
+                with open(tmp_file,'w') as f:
+                    f.write(json.dumps(self.to_dict()))
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.rename(tmp_file,self._status_file)
+            else:
+                SyncStatusStore.save([self.to_dict()])
+            self._saved_version = version
 
     @property
     def last_process_time(self):
@@ -239,61 +664,97 @@ Synchronize file from repository
     @last_process_time.setter
     def last_process_time(self,d):
         self._info["last_process_time"] = date_to_str(d)  
+        self._version += 1
+        SlaveSyncStatus.mark_changed([self])
 
-class SlaveSyncTaskStatus(dict):
+class SlaveSyncTaskStatus(object):
     """
     status object for a task.
+    The status data are kept in slots and converted into a dict by to_dict when the sync status is saved.
+    The messages longer than STATUS_MESSAGE_MAX_SIZE are truncated, and the full messages are saved into files.
     """
-    _modified = False
+    __slots__ = ("_status","_task_status","_last_process_time","_shared","_messages","_stages","_modified","_version","_owners")
     def __init__(self,task_status={}):
-        super(SlaveSyncTaskStatus,self).__init__(task_status)
+        self._modified = False
+        #increased when the task status is changed
+        self._version = 0
+        #the sync status objects which contain this task status, a shared task status is contained by multiple sync status objects
+        self._owners = []
 
         #remove failed stages
-        for s in self.get("stages",{}).keys():
-            if self.is_stage_not_succeed(s):
-                del self["stages"][s]
-
-        #if no succeed stages and current task  is not succeed, clear all task status data.
-        if self.is_not_succeed: 
-            #current task  is not succeed.
-            stages = self.get("stages")
-            self.clear()
-            if stages:
-                self["stages"] = stages
-                
-        #init a messages dictionary object
-        if "messages" not in self :
-            self["messages"] = {}
+        self._stages = dict([(intern_key(k),v) for k,v in (task_status.get("stages") or {}).iteritems() if v.get("status",False)])
+
+        if task_status.get("status",False):
+            self._status = True
+            self._task_status = task_status.get("task_status")
+            self._last_process_time = task_status.get("last_process_time")
+            self._shared = task_status.get("shared",False)
+            self._messages = dict([(intern_key(k),v) for k,v in (task_status.get("messages") or {}).iteritems()])
+        else:
+            #if current task is not succeed, clear all task status data except the succeed stages
+            self._status = None
+            self._task_status = None
+            self._last_process_time = None
+            self._shared = False
+            self._messages = {}
+
+    def to_dict(self):
+        """
+        Return the status data as a dict, which is saved as json
+        """
+        data = {"messages":dict(self._messages)}
+        if self._status is not None:
+            data["status"] = self._status
+        if self._task_status is not None:
+            data["task_status"] = self._task_status
+        if self._last_process_time:
+            data["last_process_time"] = self._last_process_time
+        if self._shared:
+            data["shared"] = True
+        if self._stages:
+            data["stages"] = dict(self._stages)
+        return data
 
     #status of the task, succeed job can have failed failed task
     @property
     def task_status(self):
-        return self["task_status"] if "task_status" in self else self.get("status",False)
+        return self._task_status if self._task_status is not None else bool(self._status)
 
     def task_failed(self):
-        self["task_status"] = False
+        self._task_status = False
+        self._changed(False)
 
     def clean_task_failed(self):
-        if "task_status" in self :
-            del self["task_status"]
+        if self._task_status is not None:
+            self._task_status = None
+            self._changed(False)
 
     @property
     def is_processed(self):
         return self._modified
 
+    def _changed(self,modified=True):
+        """
+        Increase the version and mark the sync status objects containing this task status as changed
+        """
+        if modified:
+            self._modified = True
+        self._version += 1
+        SlaveSyncStatus.mark_changed(self._owners)
+
     @property
     def is_succeed(self):
         """
         Return true, if the file is processed successfully; otherwise return False
         """
-        return self.get('status',False)
+        return bool(self._status)
 
     @property
     def is_failed(self):
         """
         Return true, if the file is processed failed; otherwise return False
         """
-        return self.get('status',None) == False
+        return self._status == False
 
     @property
     def is_not_succeed(self):
@@ -304,36 +765,58 @@ class SlaveSyncTaskStatus(dict):
 
     @property
     def last_process_time(self):
-        if "last_process_time" in self:
-            return date_from_str(self["last_process_time"])
+        if self._last_process_time:
+            return date_from_str(self._last_process_time)
         else:
             return None
  
     @last_process_time.setter
     def last_process_time(self,d):
-        self["last_process_time"] = date_to_str(d)  
+        self._last_process_time = date_to_str(d)  
+        self._changed(False)
 
     @property
     def shared(self):
-        return self.get("shared",False)
+        return self._shared
     
     @shared.setter
     def shared(self,value):
-        self["shared"] = bool(value)
+        self._shared = bool(value)
+        self._changed(False)
+
+    @property
+    def state_index(self):
+        """
+        The index of the state in the task counters of the sync status: 0 succeed, 1 failed, 2 not executed
+        """
+        return 2 if self._status is None else (0 if self._status else 1)
+
+    def _set_status(self,status):
+        with SlaveSyncStatus._state_lock:
+            previous = self.state_index
+            self._status = status
+            current = self.state_index
+            if previous != current:
+                for owner in self._owners:
+                    owner._task_state_changed(previous,current)
 
     def failed(self):
         """
         Set a flag indicate this file is processed failed
         """
-        self['status'] = False
-        self._modified = True
+        self._set_status(False)
+        self._changed()
     
     def succeed(self):
         """
         Set a flag indicate this file is processed successfully
         """
-        self['status'] = True
-        self._modified = True
+        self._set_status(True)
+        self._changed()
+
+    @property
+    def messages(self):
+        return self._messages
 
     def get_message(self,key,stage=None):
         """
@@ -342,16 +825,13 @@ class SlaveSyncTaskStatus(dict):
         if stage:
             return self.get_stage_message(stage,key)
 
-        try:
-            return self["messages"][key]
-        except:
-            return ""
+        return self._messages.get(key,"")
 
     def has_message(self,stage=None):
         if stage:
             return self.has_stage_message(stage)
         else:
-            return True if self["messages"] else False
+            return True if self._messages else False
 
     def set_message(self,key,message,stage=None):
         """
@@ -361,8 +841,8 @@ class SlaveSyncTaskStatus(dict):
             self.set_stage_message(stage,key,message)
             return
 
-        self["messages"][key] = message
-        self._modified = True
+        self._messages[intern_key(key)] = cap_message(message)
+        self._changed()
 
     def del_message(self,key,stage=None):
         """
@@ -371,32 +851,26 @@ class SlaveSyncTaskStatus(dict):
         if stage:
             self.del_stage_message(stage,key)
             return
-        try:
-            del self["messages"][key]
-        except:
-            pass
-        self._modified = True
+        self._messages.pop(key,None)
+        self._changed()
 
     @property
     def all_stages_succeed(self):
         """
         Return True if all stages succeed, or no stages
         """
-        return all([s.get('status',False) for s in self.get("stages",{}).values()])
+        return all([s.get('status',False) for s in self._stages.values()])
 
     @property
     def stages(self):
-        return self._info.get("stages",{})
+        return self._stages
 
     def is_stage_succeed(self,stage):
         """
         Return true, if the stage is processed successfully; otherwise return False
         Return false, if it does not executed.
         """
-        try:
-            return self["stages"][stage]['status']
-        except:
-            return False
+        return self._stages.get(stage,{}).get('status',False)
 
     def is_stage_not_succeed(self,stage):
         """
@@ -404,69 +878,50 @@ class SlaveSyncTaskStatus(dict):
         """
         return not self.is_stage_succeed(stage)
 
+    def _stage(self,stage):
+        """
+        Return the status object of the stage, create it if not exist.
+        setdefault is used to make sure stages can be updated by multiple threads concurrently.
+        """
+        return self._stages.setdefault(intern_key(stage),{})
+
     def stage_failed(self,stage):
         """
         Set a flag indicate this stage is processed failed
         """
-        if "stages" not in self:
-            self["stages"] = {}
-        if stage not in self["stages"]:
-            self["stages"][stage] = {}
-
-        self["stages"][stage]['status'] = False
-        self["stages"][stage]['last_process_time'] = date_to_str(now())
-        self._modified = True
+        stage_status = self._stage(stage)
+        stage_status['status'] = False
+        stage_status['last_process_time'] = date_to_str(now())
+        self._changed()
     
     def stage_succeed(self,stage):
         """
         Set a flag indicate this state is processed successfully
         """
-        if "stages" not in self:
-            self["stages"] = {}
-        if stage not in self["stages"]:
-            self["stages"][stage] = {}
-
-        self["stages"][stage]['status'] = True
-        self["stages"][stage]['last_process_time'] = date_to_str(now())
-        self._modified = True
+        stage_status = self._stage(stage)
+        stage_status['status'] = True
+        stage_status['last_process_time'] = date_to_str(now())
+        self._changed()
 
     def has_stage_message(self,stage):
-        try:
-            return True if self["stages"][stage]["messages"] else None
-        except:
-            return False
+        return True if self._stages.get(stage,{}).get("messages") else False
     
     def get_stage_message(self,stage,key):
         """
         get the stage message with key
         """
-        try:
-            return self["stages"][stage]["messages"][key]
-        except:
-            return ''
+        return self._stages.get(stage,{}).get("messages",{}).get(key,'')
 
     def set_stage_message(self,stage,key,message):
         """
         set a stage message with key
         """
-        if "stages" not in self:
-            self["stages"] = {}
-        if stage not in self["stages"]:
-            self["stages"][stage] = {}
-        if "messages" not in self["stages"][stage]:
-            self["stages"][stage]["messages"] = {}
-
-        self["stages"][stage]["messages"][key] = message
-        self._modified = True
+        self._stage(stage).setdefault("messages",{})[intern_key(key)] = cap_message(message)
+        self._changed()
 
     def del_stage_message(self,stage,key):
         """
         delete a stage message
         """
-        try:
-            del self["stages"][stage]["messages"][key]
-        except:
-            pass
-        self._modified = True
-
-
+        self._stages.get(stage,{}).get("messages",{}).pop(key,None)
+        self._changed()
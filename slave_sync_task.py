@@ -1,7 +1,10 @@
+import time
+import threading
 import traceback
 from slave_sync_env import (
     SKIP_AUTH,SKIP_GS,SKIP_DB,SKIP_RULES,
-    FEATURE_FILTER,WMS_FILTER,LAYERGROUP_FILTER,now
+    FEATURE_FILTER,WMS_FILTER,LAYERGROUP_FILTER,now,
+    NOTIFY_BATCH_SIZE,NOTIFY_BATCH_INTERVAL
 )
 
 TASK_TYPE_INDEX = 0
@@ -9,6 +12,7 @@ JOB_DEF_INDEX = 1
 TASK_FILTER_INDEX = 2
 TASK_NAME_INDEX = 3
 TASK_HANDLER_INDEX = 4
+TASK_BATCH_HANDLER_INDEX = 5
 
 JOB_TYPE_INDEX = 0
 JOB_NAME_INDEX = 1
@@ -20,6 +24,7 @@ IS_VALID_JOB_INDEX = 6
 
 json_task = lambda file_name: len(file_name.split("/")) == 1 and file_name.endswith(".json")
 taskname = lambda task,task_metadata: task_metadata[TASK_NAME_INDEX](task) if hasattr(task_metadata[TASK_NAME_INDEX],"__call__") else task_metadata[TASK_NAME_INDEX]
+batch_handler = lambda task_metadata: task_metadata[TASK_BATCH_HANDLER_INDEX] if len(task_metadata) > TASK_BATCH_HANDLER_INDEX else None
 jobname = lambda task,task_metadata: task_metadata[JOB_DEF_INDEX][JOB_NAME_INDEX](task) if hasattr(task_metadata[JOB_DEF_INDEX][JOB_NAME_INDEX],"__call__") else task_metadata[JOB_DEF_INDEX][JOB_NAME_INDEX]
 
 sync_tasks = {
@@ -94,6 +99,46 @@ ordered_sync_task_type = [
             "delete_dumpfile"
 ]
 
+#cross job dependencies, declared with a tuple (task type, depended task type, depended job keys, job keys)
+#   depended job keys: a function which has a sync_job argument and return the keys provided by the depended job
+#   job keys: a function which has a sync_job argument and return the keys required by the job
+#a task depends on all tasks of the depended task type whose job provides a key required by the task's job.
+#a task always depends on the preceding tasks of the same job, and a shared task depends on the preceding tasks of all its jobs;
+#these dependencies are implicit and not declared here.
+#depended task type should not be after the task type in "ordered_sync_task_type", unless the depended jobs never depend on the task's jobs.
+layer_key = lambda sync_job: ["{0}:{1}".format(sync_job["workspace"],sync_job["name"])]
+wmsstore_key = lambda sync_job: ["{0}:{1}".format(sync_job["workspace"],sync_job["store"])]
+livestore_key = lambda sync_job: layer_key(sync_job) if sync_job.get("job_type") == "live_store" else []
+livelayer_store_key = lambda sync_job: ["{0}:{1}".format(sync_job["workspace"],sync_job["datastore"])] if sync_job.get("job_type") == "live_layer" else []
+layergroup_member_keys = lambda sync_job: [l["name"] if ":" in l["name"] else "{0}:{1}".format(sync_job["workspace"],l["name"]) for l in sync_job.get("layers") or []]
+workspace_key = lambda sync_job: [sync_job["workspace"]]
+
+#the geoserver task types which require the workspace of the job
+geoserver_task_types = [
+    "delete_feature","delete_datastore","create_datastore",
+    "update_wmsstore","update_wmslayer","update_layergroup","remove_layergroup","remove_wmslayer","remove_wmsstore",
+    "create_feature","create_style","update_gwc","empty_gwc","get_layer_preview"
+]
+
+task_dependencies = [(task_type,"create_workspace",workspace_key,workspace_key) for task_type in geoserver_task_types] + [
+    ("update_wmslayer","update_wmsstore",layer_key,wmsstore_key),
+    ("remove_wmsstore","remove_wmslayer",wmsstore_key,layer_key),
+    ("create_feature","create_datastore",livestore_key,livelayer_store_key),
+    ("delete_datastore","delete_feature",livelayer_store_key,livestore_key),
+    ("update_layergroup","update_wmslayer",layer_key,layergroup_member_keys),
+    ("update_layergroup","update_layergroup",layer_key,layergroup_member_keys),
+    #the feature jobs never depend on the layergroup jobs
+    ("update_layergroup","create_feature",layer_key,layergroup_member_keys),
+    ("remove_wmslayer","remove_layergroup",layergroup_member_keys,layer_key),
+]
+
+#resource classes, each plugin module can declare a "tasks_resource" dict to map its task types to a resource class
+#the number of concurrent tasks using the same resource class is limited by RESOURCE_LIMITS
+DB_RESOURCE = "db"
+NETWORK_RESOURCE = "network"
+GEOSERVER_RESOURCE = "geoserver-rest"
+RENDER_RESOURCE = "render"
+
 #predefined sync_job filters
 gs_task_filter = lambda sync_job: not SKIP_GS
 
@@ -321,3 +366,146 @@ def execute_task(sync_job,task_metadata,task_logger):
         task_status.set_message("message",message)
         task_logger.error("Failed to Process the {4}task ({0} - {1} {2}).{3}".format(task_metadata[TASK_TYPE_INDEX],task_name,sync_job["job_file"],message,"shared " if task_status.shared else ""))
 
+def execute_notify_batch_task(tasks):
+    """
+    execute the notify tasks; the tasks with the same batch handler are executed by one call of the batch handler
+    tasks: a list of (sync_job,task_metadata,task_logger)
+    """
+    batches = []
+    for sync_job,task_metadata,task_logger in tasks:
+        handler = batch_handler(task_metadata)
+        if not handler:
+            execute_notify_task(sync_job,task_metadata,task_logger)
+            continue
+        batch = next((b for b in batches if b[0] == handler),None)
+        if not batch:
+            batch = (handler,[],task_logger)
+            batches.append(batch)
+        batch[1].append((sync_job,task_metadata,None))
+
+    for handler,batch,task_logger in batches:
+        task_logger.info("Begin to process the batch task ({0} - {1} jobs).".format(batch[0][1][TASK_TYPE_INDEX],len(batch)))
+        try:
+            handler(batch)
+            task_logger.info("Succeed to process the batch task ({0} - {1} jobs).".format(batch[0][1][TASK_TYPE_INDEX],len(batch)))
+        except:
+            message = traceback.format_exc()
+            task_logger.error("Failed to Process the batch task ({0} - {1} jobs).{2}".format(batch[0][1][TASK_TYPE_INDEX],len(batch),message))
+
+class NotifyTaskBuffer(object):
+    """
+    Buffer the notify tasks of the finished jobs and send them in batch
+    """
+    def __init__(self,notify_tasks,batch_size=NOTIFY_BATCH_SIZE,interval=NOTIFY_BATCH_INTERVAL):
+        #the notify tasks of the unfinished jobs
+        self._tasks = {}
+        for task in notify_tasks:
+            self._tasks.setdefault(task[0]["job_file"],[]).append(task)
+        self._buffer = []
+        self._jobs = 0
+        self._batch_size = batch_size
+        self._interval = interval
+        self._last_send_time = time.time()
+        self._lock = threading.Lock()
+
+    def job_done(self,sync_jobs):
+        """
+        buffer the notify tasks of the finished jobs; send the buffered tasks if the batch size or the interval is reached
+        """
+        with self._lock:
+            for sync_job in sync_jobs:
+                tasks = self._tasks.pop(sync_job["job_file"],None)
+                if tasks:
+                    self._buffer.extend(tasks)
+                    self._jobs += 1
+            if not self._buffer or (self._jobs < self._batch_size and time.time() - self._last_send_time < self._interval):
+                return
+            tasks = self._buffer
+            self._buffer = []
+            self._jobs = 0
+            self._last_send_time = time.time()
+        execute_notify_batch_task(tasks)
+
+    def flush(self):
+        """
+        send the buffered tasks and the notify tasks of the unfinished jobs
+        """
+        with self._lock:
+            tasks = self._buffer
+            for job_tasks in self._tasks.itervalues():
+                tasks.extend(job_tasks)
+            self._buffer = []
+            self._tasks.clear()
+            self._jobs = 0
+        execute_notify_batch_task(tasks)
+
+def execute_batch_task(tasks):
+    """
+    execute the tasks of the same task type with the batch handler declared in tasks_metadata
+    tasks: a list of (sync_job,task_metadata,task_logger); a shared task is included once for each job.
+    The batch handler is called once with a list of (sync_job,task_metadata,task_status) for all tasks which need to execute.
+    The batch handler can set the status of each task to failed; a task whose status is not failed after the batch handler returns is succeed.
+    If the batch handler throws a exception, all tasks which are not succeed are failed.
+    """
+    batches = []
+    task_statuses = set()
+    for sync_job,task_metadata,task_logger in tasks:
+        handler = batch_handler(task_metadata)
+        if not handler:
+            execute_task(sync_job,task_metadata,task_logger)
+            continue
+
+        task_status = sync_job['status'].get_task_status(task_metadata[TASK_TYPE_INDEX])
+        if task_status.is_succeed: 
+            #this task has been executed successfully
+            continue
+
+        if sync_job['status'].is_failed:
+            #some proceding task are failed,so can't execute this task
+            if task_status.shared:
+                #this task is shared, but this task can't executed for this job, change the task's status object to a private status object
+                from slave_sync_status import SlaveSyncTaskStatus
+                sync_job['status'].set_task_status(task_metadata[TASK_TYPE_INDEX],SlaveSyncTaskStatus())
+            continue
+
+        if id(task_status) in task_statuses:
+            #shared task, already included
+            continue
+        task_statuses.add(id(task_status))
+
+        batch = next((b for b in batches if b[0] == handler),None)
+        if not batch:
+            batch = (handler,[],task_logger)
+            batches.append(batch)
+        batch[1].append((sync_job,task_metadata,task_status))
+
+        sync_job['status'].last_process_time = now()
+        task_status.last_process_time = now()
+        task_status.del_message("message")
+
+    for handler,batch,task_logger in batches:
+        task_type = batch[0][1][TASK_TYPE_INDEX]
+        task_logger.info("Begin to process the batch task ({0} - {1}).".format(task_type," , ".join([t[0]["job_file"] for t in batch])))
+        try:
+            handler(batch)
+        except:
+            message = traceback.format_exc()
+            for sync_job,task_metadata,task_status in batch:
+                if not task_status.is_failed:
+                    task_status.failed()
+                    task_status.set_message("message",message)
+            task_logger.error("Failed to Process the batch task ({0} - {1} jobs).{2}".format(task_type,len(batch),message))
+
+        failed = 0
+        for sync_job,task_metadata,task_status in batch:
+            if task_status.is_failed:
+                failed += 1
+                continue
+            if not task_status.get_message("message"):
+                task_status.set_message("message","succeed")
+            task_status.succeed()
+
+        if failed:
+            task_logger.error("Failed to process {2} of {1} tasks in the batch task ({0}).".format(task_type,len(batch),failed))
+        else:
+            task_logger.info("Succeed to process the batch task ({0} - {1} jobs).".format(task_type,len(batch)))
@@ -0,0 +1,19 @@
+"""
+Unit tests of the sync modules.
+
+The folders used by the settings are pointed to a temporary folder before the sync modules are imported.
+Run the tests in the code folder:
+    python -m unittest discover -s tests -t .
+"""
+import os
+import sys
+import tempfile
+
+CODE_PATH = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+TEST_PATH = tempfile.mkdtemp(prefix="slave_sync_test_")
+
+os.environ.setdefault("CACHE_PATH",os.path.join(TEST_PATH,"dumps"))
+os.environ.setdefault("SYNC_STATUS_PATH",os.path.join(TEST_PATH,"sync_status"))
+
+if CODE_PATH not in sys.path:
+    sys.path.insert(0,CODE_PATH)
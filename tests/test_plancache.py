@@ -0,0 +1,95 @@
+import os
+import time
+import shutil
+import tempfile
+import unittest
+
+import tests
+from slave_sync_plancache import PlanCache,PLAN_CACHE_EXPIRE_DAYS
+
+JOB = {"job_file":"layers/job.json","name":"layer"}
+
+class PlanCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp(dir=tests.TEST_PATH)
+        self.path = os.path.join(self.folder,".plan_cache.db")
+        self._environ = dict(os.environ)
+        self._fingerprint = PlanCache._fingerprint
+        PlanCache._fingerprint = None
+
+    def tearDown(self):
+        os.environ.clear()
+        os.environ.update(self._environ)
+        PlanCache._fingerprint = self._fingerprint
+        shutil.rmtree(self.folder)
+
+    def reload(self):
+        """
+        Return a new cache with the fingerprint of the current code and settings, as a new sync process does
+        """
+        PlanCache._fingerprint = None
+        return PlanCache(self.path)
+
+    def put(self,cache,file_node="node1",action="update"):
+        key = cache.key(file_node,action)
+        cache.put(key,JOB,"md5",[1,2])
+        cache.close()
+        return key
+
+    def test_cached_entry(self):
+        key = self.put(PlanCache(self.path))
+        cache = self.reload()
+        self.assertEqual(cache.get_all([key,cache.key("node2","update"),cache.key("node1","remove")]),{key:(JOB,"md5",[1,2])})
+        cache.close()
+
+    def test_invalidated_when_settings_changed(self):
+        key = self.put(PlanCache(self.path))
+        os.environ["GEOSERVER_WORKSPACE"] = "changed"
+        cache = self.reload()
+        self.assertNotEqual(cache.key("node1","update"),key)
+        self.assertEqual(cache.get_all([cache.key("node1","update")]),{})
+        cache.close()
+
+    def test_not_invalidated_by_hg_variables(self):
+        key = self.put(PlanCache(self.path))
+        os.environ["HG_NODE"] = "changed"
+        cache = self.reload()
+        self.assertEqual(cache.key("node1","update"),key)
+        self.assertEqual(len(cache.get_all([key])),1)
+        cache.close()
+
+    def test_expired_entries_removed(self):
+        cache = PlanCache(self.path)
+        key = self.put(cache)
+        cache = PlanCache(self.path)
+        with cache._conn:
+            cache._conn.execute("UPDATE plan_cache SET used = ?",(time.time() - PLAN_CACHE_EXPIRE_DAYS * 86400 - 1,))
+        cache.close()
+        cache = PlanCache(self.path)
+        self.assertEqual(cache.get_all([key]),{})
+        cache.close()
+
+    def test_read_only(self):
+        cache = PlanCache(self.path,read_only=True)
+        key = self.put(cache)
+        self.assertFalse(os.path.exists(self.path))
+
+        self.put(PlanCache(self.path))
+        used = self.used(key)
+        cache = PlanCache(self.path,read_only=True)
+        self.assertEqual(len(cache.get_all([key])),1)
+        self.put(cache,file_node="node2")
+        self.assertEqual(self.used(key),used)
+        cache = PlanCache(self.path)
+        self.assertEqual(cache.get_all([cache.key("node2","update")]),{})
+        cache.close()
+
+    def used(self,key):
+        cache = PlanCache(self.path)
+        try:
+            return cache._conn.execute("SELECT used FROM plan_cache WHERE key = ?",(key,)).fetchone()[0]
+        finally:
+            cache._conn.close()
+
+if __name__ == "__main__":
+    unittest.main()
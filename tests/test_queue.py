@@ -0,0 +1,82 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import tests
+from slave_sync_queue import SyncQueue,drain,SYNC_QUEUE_MAX_ATTEMPTS
+
+class SyncQueueTestCase(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp(dir=tests.TEST_PATH)
+        self.queue = SyncQueue(os.path.join(self.folder,".sync_queue.db"))
+        self.synced = []
+
+    def tearDown(self):
+        self.queue.close()
+        shutil.rmtree(self.folder)
+
+    def sync(self,hg_node):
+        self.synced.append(hg_node)
+
+    def failed_sync(self,hg_node):
+        self.synced.append(hg_node)
+        raise Exception("Failed to sync '{}'".format(hg_node))
+
+    def expire_retry_interval(self):
+        with self.queue._conn:
+            self.queue._conn.execute("UPDATE sync_queue SET last_attempt_time = 0 WHERE last_attempt_time IS NOT NULL")
+
+    def test_drain_synchronizes_from_earliest(self):
+        for hg_node in ("node1","node2","node3"):
+            self.queue.enqueue(hg_node)
+        self.assertTrue(drain(self.queue,self.sync))
+        self.assertEqual(self.synced,["node1"])
+        self.assertEqual(self.queue.pending(),[])
+        self.assertFalse(drain(self.queue,self.sync))
+
+    def test_failed_changesets_wait_for_retry_interval(self):
+        self.queue.enqueue("node1")
+        self.assertTrue(drain(self.queue,self.failed_sync))
+        self.assertEqual(self.queue.ready(retry_interval=300),[])
+        self.assertFalse(drain(self.queue,self.failed_sync))
+        self.assertEqual(len(self.queue.ready(retry_interval=0)),1)
+
+        #a new changeset is synchronized at once with the failed one
+        self.queue.enqueue("node2")
+        self.assertEqual([e[1] for e in self.queue.ready(retry_interval=300)],["node1","node2"])
+
+    def test_park_after_max_attempts(self):
+        self.queue.enqueue("node1")
+        self.queue.enqueue("node2")
+        for attempt in range(SYNC_QUEUE_MAX_ATTEMPTS):
+            self.assertEqual(self.queue.parked(),[])
+            self.expire_retry_interval()
+            self.assertTrue(drain(self.queue,self.failed_sync))
+        self.assertEqual(self.synced,["node1"] * SYNC_QUEUE_MAX_ATTEMPTS)
+
+        parked = self.queue.parked()
+        self.assertEqual([(p[1],p[2]) for p in parked],[("node1",SYNC_QUEUE_MAX_ATTEMPTS)])
+        self.assertEqual(parked[0][3],"Failed to sync 'node1'")
+        #the later changeset is synchronized at once without the parked one
+        self.assertEqual([(e[1],e[2]) for e in self.queue.pending()],[("node2",0)])
+        self.assertTrue(drain(self.queue,self.sync))
+        self.assertEqual(self.synced[-1],"node2")
+        self.assertEqual(self.queue.pending(),[])
+
+    def test_park_disabled(self):
+        self.queue.enqueue("node1")
+        self.queue.failed([self.queue.pending()[0][0]],"failed")
+        self.assertIsNone(self.queue.park(max_attempts=0))
+        self.assertIsNone(self.queue.park(max_attempts=2))
+        self.assertEqual(self.queue.parked(),[])
+
+    def test_queue_is_durable(self):
+        self.queue.enqueue("node1")
+        self.queue.failed([self.queue.pending()[0][0]],"failed")
+        self.queue.close()
+        self.queue = SyncQueue(os.path.join(self.folder,".sync_queue.db"))
+        self.assertEqual([(e[1],e[2]) for e in self.queue.pending()],[("node1",1)])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+import unittest
+
+import tests
+import slave_sync_scheduler
+from slave_sync_scheduler import SyncTaskScheduler
+
+BATCH_TASK_TYPES = ["create_db_schema","update_gwc","purge_fastly_cache"]
+
+class SchedulerTestCase(unittest.TestCase):
+    """
+    The task metadata of a task is its task type in these tests, the tasks are recorded instead of executed
+    """
+    def setUp(self):
+        self.executed = []
+        self.batches = []
+        self._patched = dict([(name,getattr(slave_sync_scheduler,name)) for name in ("batch_handler","execute_task","execute_batch_task","task_dependencies")])
+        slave_sync_scheduler.batch_handler = lambda task_metadata: task_metadata in BATCH_TASK_TYPES
+        slave_sync_scheduler.execute_task = lambda sync_job,task_metadata,task_logger: self.executed.append((task_metadata,sync_job["job_file"]))
+        slave_sync_scheduler.execute_batch_task = lambda tasks: self.batches.append((tasks[0][1],[t[0]["job_file"] for t in tasks]))
+
+    def tearDown(self):
+        for name,value in self._patched.iteritems():
+            setattr(slave_sync_scheduler,name,value)
+
+    def job(self,i,**kwargs):
+        sync_job = {"job_file":"layers/job{}.json".format(i),"workspace":"ws","name":"layer{}".format(i),"store":"store"}
+        sync_job.update(kwargs)
+        return sync_job
+
+    def sync_tasks(self,jobs,task_types):
+        return dict([(task_type,dict([(j["job_file"],(j,task_type,None)) for j in jobs])) for task_type in task_types])
+
+    def test_batch_once_per_task_type(self):
+        jobs = [self.job(i) for i in range(30)]
+        SyncTaskScheduler(self.sync_tasks(jobs,["create_db_schema","restore_table","update_wmslayer","update_gwc","purge_fastly_cache"])).run()
+
+        self.assertEqual(sorted([b[0] for b in self.batches]),sorted(BATCH_TASK_TYPES))
+        for task_type,job_files in self.batches:
+            self.assertEqual(sorted(job_files),sorted([j["job_file"] for j in jobs]))
+        self.assertEqual(len(self.executed),len(jobs) * 2)
+
+    def test_batch_with_multiple_workers(self):
+        jobs = [self.job(i) for i in range(30)]
+        SyncTaskScheduler(self.sync_tasks(jobs,["update_wmslayer","update_gwc","purge_fastly_cache"]),workers=4).run()
+
+        self.assertEqual(sorted([b[0] for b in self.batches]),["purge_fastly_cache","update_gwc"])
+
+    def circular_jobs(self,workers):
+        #restore_table of each job depends on update_wmslayer of the other job, and update_wmslayer depends on restore_table in the same job
+        slave_sync_scheduler.task_dependencies = [("restore_table","update_wmslayer",lambda sync_job:[sync_job["name"]],lambda sync_job:sync_job["depends"])]
+        jobs = [self.job(1,depends=["layer2"]),self.job(2,depends=["layer1"]),self.job(3,depends=[])]
+        done_jobs = []
+        SyncTaskScheduler(self.sync_tasks(jobs,["restore_table","update_wmslayer","update_gwc"]),workers=workers,job_done=done_jobs.extend).run()
+
+        self.assertEqual(sorted(self.executed),sorted([(task_type,j["job_file"]) for j in jobs for task_type in ["restore_table","update_wmslayer"]]))
+        for j in jobs:
+            self.assertLess(self.executed.index(("restore_table",j["job_file"])),self.executed.index(("update_wmslayer",j["job_file"])))
+        self.assertEqual(sorted([f for b in self.batches for f in b[1]]),sorted([j["job_file"] for j in jobs]))
+        self.assertEqual(sorted([j["job_file"] for j in done_jobs]),sorted([j["job_file"] for j in jobs]))
+
+    def test_circular_dependencies(self):
+        self.circular_jobs(1)
+        #the job without circular dependencies is not blocked by the others
+        self.assertEqual(self.executed[:2],[("restore_table","layers/job3.json"),("update_wmslayer","layers/job3.json")])
+
+    def test_circular_dependencies_with_multiple_workers(self):
+        self.circular_jobs(4)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+import threading
+import subprocess
+import unittest
+
+import tests
+import slave_sync_ssh
+from slave_sync_ssh import SSHPool
+from slave_sync_env import BORGCOLLECTOR_SSH
+
+class SSHPoolTestCase(unittest.TestCase):
+    """
+    The ssh commands are recorded instead of executed
+    """
+    def setUp(self):
+        self.started = []
+        self.closed = []
+        self.fail_hosts = set()
+        self._subprocess = (subprocess.check_call,subprocess.call)
+        self._control_persist = slave_sync_ssh.SSH_CONTROL_PERSIST
+        subprocess.check_call = self.check_call
+        subprocess.call = self.call
+        SSHPool._masters = {}
+
+    def tearDown(self):
+        subprocess.check_call,subprocess.call = self._subprocess
+        slave_sync_ssh.SSH_CONTROL_PERSIST = self._control_persist
+        SSHPool._masters = {}
+
+    def check_call(self,cmd,**kwargs):
+        self.started.append(cmd)
+        if cmd[-1] in self.fail_hosts:
+            raise subprocess.CalledProcessError(255,cmd)
+        return 0
+
+    def call(self,cmd,**kwargs):
+        self.closed.append(cmd)
+        return 0
+
+    def test_master_started_once_per_host(self):
+        threads = [threading.Thread(target=SSHPool.rsync_ssh,args=("borg@{}:/data/file{}.db".format(host,i),)) for i in range(5) for host in ("host1","host2")]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(sorted([cmd[-1] for cmd in self.started]),["borg@host1","borg@host2"])
+        for cmd in self.started:
+            self.assertIn("ControlMaster=yes",cmd)
+
+        cmd = SSHPool.ssh_cmd("borg@host1")
+        self.assertEqual(cmd[:len(BORGCOLLECTOR_SSH.split())],BORGCOLLECTOR_SSH.split())
+        self.assertIn("ControlMaster=no",cmd)
+        self.assertIn("ControlPath={}".format(SSHPool._control_path("borg@host1")),cmd)
+        self.assertEqual(len(self.started),2)
+
+    def test_without_master_if_failed(self):
+        self.fail_hosts.add("borg@host1")
+        self.assertEqual(SSHPool.ssh_cmd("borg@host1"),BORGCOLLECTOR_SSH.split())
+        #the master connection is not started again
+        self.assertEqual(SSHPool.ssh_cmd("borg@host1"),BORGCOLLECTOR_SSH.split())
+        self.assertEqual(len(self.started),1)
+        self.assertIn("ControlMaster=no",SSHPool.ssh_cmd("borg@host2"))
+
+    def test_local_path(self):
+        self.assertEqual(SSHPool.rsync_ssh("/data/file.db")," ".join(BORGCOLLECTOR_SSH.split()))
+        self.assertEqual(self.started,[])
+
+    def test_disabled(self):
+        slave_sync_ssh.SSH_CONTROL_PERSIST = 0
+        self.assertEqual(SSHPool.ssh_cmd("borg@host1"),BORGCOLLECTOR_SSH.split())
+        self.assertEqual(self.started,[])
+
+    def test_close_all(self):
+        self.fail_hosts.add("borg@host2")
+        SSHPool.ssh_cmd("borg@host1")
+        SSHPool.ssh_cmd("borg@host2")
+        SSHPool.close_all()
+        self.assertEqual(len(self.closed),1)
+        self.assertEqual(self.closed[0][-3:],["-O","exit","borg@host1"])
+        self.assertEqual(SSHPool._masters,{})
+        #the master connection is started again in the next sync
+        SSHPool.ssh_cmd("borg@host1")
+        self.assertEqual(len(self.started),3)
+
+if __name__ == "__main__":
+    unittest.main()
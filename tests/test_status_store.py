@@ -0,0 +1,92 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import tests
+from slave_sync_status import SyncStatusStore,SlaveSyncStatus
+
+class SyncStatusStoreTestCase(unittest.TestCase):
+    def setUp(self):
+        SlaveSyncStatus.reset()
+        self.folder = tempfile.mkdtemp(dir=tests.TEST_PATH)
+        self._files = (SyncStatusStore._db_file,SyncStatusStore._journal_file)
+        SyncStatusStore._db_file = os.path.join(self.folder,".sync_status.db")
+        SyncStatusStore._journal_file = os.path.join(self.folder,".sync_status.journal")
+
+    def tearDown(self):
+        SlaveSyncStatus.reset()
+        SyncStatusStore._db_file,SyncStatusStore._journal_file = self._files
+        shutil.rmtree(self.folder)
+
+    def run_tasks(self,job_file,task_types,failed=[]):
+        status = SlaveSyncStatus(job_file,"update",md5="md5")
+        for task_type in task_types:
+            task_status = status.get_task_status(task_type)
+            task_status.stage_succeed("prepare")
+            if task_type in failed:
+                task_status.set_message("message","failed")
+                task_status.failed()
+            else:
+                task_status.succeed()
+            SlaveSyncStatus.checkpoint()
+        return status
+
+    def crash(self):
+        """
+        Simulate a killed process: the status is not saved and the status database is not closed cleanly
+        """
+        SyncStatusStore._conn = None
+        SlaveSyncStatus.reset()
+
+    def test_save(self):
+        self.run_tasks("layers/job1.json",["restore_table","update_wmslayer"])
+        SlaveSyncStatus.save_all()
+        self.assertFalse(os.path.exists(SyncStatusStore._journal_file))
+        SlaveSyncStatus.reset()
+
+        status = SlaveSyncStatus("layers/job1.json","update",md5="md5")
+        self.assertTrue(status.get_task_status("restore_table").is_succeed)
+        self.assertTrue(status.get_task_status("update_wmslayer").is_stage_succeed("prepare"))
+        #the status is discarded if the job file is changed
+        SlaveSyncStatus.reset()
+        status = SlaveSyncStatus("layers/job1.json","update",md5="md5_changed")
+        self.assertFalse(status.get_task_status("restore_table").is_succeed)
+
+    def test_replay_journal_after_crash(self):
+        self.run_tasks("layers/job1.json",["restore_table","update_wmslayer"],failed=["update_wmslayer"])
+        self.run_tasks("layers/job2.json",["restore_table"])
+        self.assertTrue(os.path.exists(SyncStatusStore._journal_file))
+        #the last line is half-written when the process is killed
+        with open(SyncStatusStore._journal_file,"a") as f:
+            f.write('{"file":"layers/job3.json","md5":"md5","act')
+        self.crash()
+
+        status = SlaveSyncStatus("layers/job1.json","update",md5="md5")
+        self.assertFalse(os.path.exists(SyncStatusStore._journal_file))
+        self.assertTrue(status.get_task_status("restore_table").is_succeed)
+        #the failed task is executed again, only its succeed stages are kept
+        task_status = status.get_task_status("update_wmslayer")
+        self.assertTrue(task_status.is_not_succeed)
+        self.assertTrue(task_status.is_stage_succeed("prepare"))
+        self.assertEqual(task_status.get_message("message"),"")
+        self.assertTrue(SlaveSyncStatus("layers/job2.json","update",md5="md5").get_task_status("restore_table").is_succeed)
+        self.assertIsNone(SyncStatusStore.get("layers/job3.json"))
+
+    def test_latest_checkpoint_replayed(self):
+        status = self.run_tasks("layers/job1.json",["restore_table"],failed=["restore_table"])
+        status.get_task_status("restore_table").succeed()
+        SlaveSyncStatus.checkpoint(force=True)
+        self.crash()
+
+        self.assertTrue(SlaveSyncStatus("layers/job1.json","update",md5="md5").get_task_status("restore_table").is_succeed)
+
+    def test_not_processed_status_not_saved(self):
+        SlaveSyncStatus("layers/job1.json","update",md5="md5").get_task_status("restore_table")
+        SlaveSyncStatus.checkpoint(force=True)
+        self.assertFalse(os.path.exists(SyncStatusStore._journal_file))
+        SlaveSyncStatus.save_all()
+        self.assertIsNone(SyncStatusStore.get("layers/job1.json"))
+
+if __name__ == "__main__":
+    unittest.main()
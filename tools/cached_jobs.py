@@ -1,6 +1,7 @@
 import argparse
 import os
 import json
+import sqlite3
 
 base_path = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
 default_status_file_path = os.path.join(base_path,".sync_status")
@@ -17,21 +18,46 @@ def options():
 
     return parser.parse_args()
 
+def db_jobs(db_file,status):
+    """
+    Return the list of (file,job_status) from the status database
+    """
+    conn = sqlite3.connect(db_file,timeout=60)
+    try:
+        if status is None:
+            rows = conn.execute("SELECT file,action,status FROM job_status ORDER BY file").fetchall()
+        else:
+            rows = conn.execute("SELECT file,action,status FROM job_status WHERE status = ? ORDER BY file",(1 if status else 0,)).fetchall()
+    finally:
+        conn.close()
+    return [(f,{"action":action,"status":bool(s) if s is not None else None}) for f,action,s in rows]
+
+def remove_db_jobs(db_file,files):
+    conn = sqlite3.connect(db_file,timeout=60)
+    try:
+        with conn:
+            conn.executemany("DELETE FROM job_status WHERE file = ?",[(f,) for f in files])
+    finally:
+        conn.close()
+
 if __name__ == "__main__":
     args = options()
     if not args.action:
         args.action = "list"
 
-    folders = [args.folder]
+    db_file = os.path.join(args.folder,".sync_status.db")
+    #the job status are saved in the status database, or in the status files by the previous version
+    use_db = os.path.exists(db_file)
+    folders = [] if use_db else [args.folder]
     job_status = None
-    jobs = []
-    maximum_len = 0
+    jobs = db_jobs(db_file,args.status) if use_db else []
+    maximum_len = max([len(job_file) for job_file,_ in jobs] or [0])
     while folders:
         for root,dirs,files in os.walk(folders.pop()):
             for f in dirs:
                 folders.append(os.path.join(root,f))
             for f in files:
-                if not f.lower().endswith(".json"):
+                if not f.lower().endswith(".json") or f.startswith("."):
                     continue
                 f = os.path.join(root,f)
                 with open(f) as fi:
@@ -42,11 +68,15 @@ if __name__ == "__main__":
                 if maximum_len < len(f):
                     maximum_len = len(f)
 
+    if args.action == "remove" and use_db and jobs:
+        remove_db_jobs(db_file,[job_file for job_file,_ in jobs])
+
     for f,job_status in jobs:
         if args.action == "list":
             print ("{0: <" + str(maximum_len) + "}\t\taction={1}\tstatus={2}").format(f,job_status["action"],job_status["status"])
         elif args.action == "remove":
-            os.remove(f)
+            if not use_db:
+                os.remove(f)
             print ("{0: <" + str(maximum_len) + "}\t\taction={1}\tstatus={2}\tremoved").format(f,job_status["action"],job_status["status"])
         else:
             print ("{0: <" + str(maximum_len) + "}\t\taction={1}\tstatus={2}").format(f,job_status["action"],job_status["status"])